@@ -0,0 +1,97 @@
+"""
+Compare the per-loan cost of the legacy month-by-month calculate_loan loop
+against the vectorized calculate_loans_batch engine.
+
+Usage:
+    python benchmarks/bench_calculate_loan.py [--loans 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mohi.amortization import calculate_loan, calculate_loans_batch  # noqa: E402
+
+
+def legacy_calculate_loan(principal, monthly_rate, months):
+    """Original iterative implementation, kept here as the baseline."""
+    r = monthly_rate / 100
+    if r == 0:
+        monthly_payment = principal / months
+    else:
+        monthly_payment = principal * (r * (1 + r) ** months) / ((1 + r) ** months - 1)
+    balance = principal
+    total_interest = 0
+    schedule = []
+    for month in range(1, months + 1):
+        interest = balance * r
+        principal_paid = monthly_payment - interest
+        balance -= principal_paid
+        if balance < 0:
+            principal_paid += balance
+            balance = 0
+        total_interest += interest
+        schedule.append({
+            'month': month,
+            'payment': round(monthly_payment, 2),
+            'interest': round(interest, 2),
+            'principal': round(principal_paid, 2),
+            'balance': round(balance, 2)
+        })
+        if balance <= 0:
+            break
+    if balance > 0:
+        final_payment = balance + (balance * r)
+        total_interest += balance * r
+        schedule.append({
+            'month': len(schedule) + 1,
+            'payment': round(final_payment, 2),
+            'interest': round(balance * r, 2),
+            'principal': round(balance, 2),
+            'balance': 0.00
+        })
+    total_paid = sum(item['payment'] for item in schedule)
+    return {
+        'monthly_payment': round(monthly_payment, 2),
+        'total_interest': round(total_interest, 2),
+        'total_paid': round(total_paid, 2),
+        'schedule': schedule
+    }
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--loans', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    principals = rng.uniform(5000, 500000, args.loans).round(2)
+    rates = np.full(args.loans, 1.0)
+    terms = rng.integers(6, 241, args.loans)
+
+    rows = list(zip(principals.tolist(), rates.tolist(), terms.tolist()))
+    loop = timed(lambda: [legacy_calculate_loan(p, r, n) for p, r, n in rows])
+    single = timed(lambda: [calculate_loan(p, r, n) for p, r, n in rows])
+    batch = timed(lambda: calculate_loans_batch(principals, rates, terms))
+
+    per_loan = lambda seconds: seconds / args.loans * 1e6
+    print(f"{args.loans} loans, terms 6-240 months")
+    print(f"{'legacy loop':<22} {loop:>8.3f}s  {per_loan(loop):>9.2f} us/loan")
+    print(f"{'calculate_loan':<22} {single:>8.3f}s  {per_loan(single):>9.2f} us/loan")
+    print(f"{'calculate_loans_batch':<22} {batch:>8.3f}s  {per_loan(batch):>9.2f} us/loan")
+    print(f"batch speedup vs legacy loop: {loop / batch:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
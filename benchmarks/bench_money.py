@@ -0,0 +1,157 @@
+"""
+Compare the legacy Decimal schedule loop that Loan.generate_amortization_schedule used with
+the integer-cents engine in mohi.money, and cross-check the engine's results.
+
+The cross-checks fail the run (exit status 1) unless, for every loan and both rounding modes,
+principal sums to the loan amount to the cent, the final balance is zero, every payment is
+interest plus principal, calculate_loan agrees with the model's schedule, and
+calculate_loans_batch agrees with amortize() row for row. The legacy loop's drift (rows whose
+payment is not interest plus principal, and principal that does not add up to the loan) is
+reported alongside.
+
+Usage:
+    python benchmarks/bench_money.py [--loans 2000] [--seed 42]
+"""
+import argparse
+import os
+import sys
+import time
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mohi import money  # noqa: E402
+from mohi.amortization import calculate_loan, calculate_loans_batch  # noqa: E402
+
+RATE = Decimal('1.0')
+
+
+def legacy_decimal_schedule(principal, monthly_rate, months):
+    """The Decimal loop Loan.generate_amortization_schedule ran before the cents engine, kept as the baseline."""
+    r = monthly_rate / Decimal('100')
+    if r == 0:
+        monthly_payment = principal / months
+    else:
+        monthly_payment = principal * (r * (1 + r) ** months) / ((1 + r) ** months - 1)
+    balance = principal
+    rows = []
+    for month in range(1, months + 1):
+        interest = balance * r
+        principal_paid = monthly_payment - interest
+        balance -= principal_paid
+        if balance < 0:
+            principal_paid += balance
+            balance = 0
+        rows.append((float(round(monthly_payment, 2)), float(round(interest, 2)),
+                     float(round(principal_paid, 2)), float(round(balance, 2))))
+        if balance <= 0:
+            break
+    if balance > 0:
+        rows.append((float(round(balance + balance * r, 2)), float(round(balance * r, 2)), float(round(balance, 2)), 0.0))
+    return rows
+
+
+def _cents(value):
+    return round(value * 100)
+
+
+def legacy_drift(principal, rows):
+    """(rows whose payment is not interest + principal, principal total less the loan amount) in cents."""
+    mismatched = sum(1 for payment, interest, retired, _ in rows if _cents(payment) != _cents(interest) + _cents(retired))
+    return mismatched, sum(_cents(retired) for _, _, retired, _ in rows) - money.to_cents(principal)
+
+
+def cross_check(loans, rounding):
+    """Messages for every loan whose cents schedule does not reconcile."""
+    failures = []
+    principals = [money.to_cents(principal) for principal, _ in loans]
+    terms = [months for _, months in loans]
+    batch = money.amortize_batch(principals, [RATE] * len(loans), terms, rounding)
+    for index, (principal_cents, months) in enumerate(zip(principals, terms)):
+        schedule = money.amortize(principal_cents, RATE, months, rounding)
+        problems = []
+        if sum(schedule.principal) != principal_cents:
+            problems.append(f"principal sums to {sum(schedule.principal)}")
+        if schedule.balance[-1] != 0:
+            problems.append(f"final balance {schedule.balance[-1]}")
+        if any(p != i + r for p, i, r in zip(schedule.payment, schedule.interest, schedule.principal)):
+            problems.append("payment != interest + principal")
+        length = int(batch['mask'][index].sum())
+        for name in ('payment', 'interest', 'principal', 'balance'):
+            if batch[name][index, :length].tolist() != list(getattr(schedule, name)):
+                problems.append(f"batch {name} differs")
+        if int(batch['total_interest'][index]) != sum(schedule.interest):
+            problems.append("batch total_interest differs")
+        if problems:
+            failures.append(f"{rounding} {money.from_cents(principal_cents)} over {months}: {', '.join(problems)}")
+    return failures
+
+
+def check_calculator(loans):
+    """calculate_loan and calculate_loans_batch must price a loan exactly as the model schedule does."""
+    failures = []
+    result = calculate_loans_batch([float(p) for p, _ in loans], [float(RATE)] * len(loans), [n for _, n in loans])
+    for index, (principal, months) in enumerate(loans):
+        schedule = money.amortize(money.to_cents(principal), RATE, months)
+        single = calculate_loan(float(principal), float(RATE), months)
+        if [_cents(value) for value in single['schedule'].payment.tolist()] != list(schedule.payment):
+            failures.append(f"calculate_loan {principal} over {months}: payments differ from the model schedule")
+        if _cents(single['total_paid']) != _cents(result['total_paid'][index]) or _cents(single['total_paid']) != sum(schedule.payment):
+            failures.append(f"calculate_loan {principal} over {months}: total_paid does not reconcile")
+    return failures
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--loans', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    loans = [
+        (Decimal(str(principal)), int(months))
+        for principal, months in zip(rng.uniform(5000, 500000, args.loans).round(2).tolist(),
+                                     rng.integers(6, 241, args.loans).tolist())
+    ]
+    principals = [money.to_cents(principal) for principal, _ in loans]
+    terms = [months for _, months in loans]
+
+    legacy = timed(lambda: [legacy_decimal_schedule(p, RATE, n) for p, n in loans])
+    money._amortize.cache_clear()
+    cents = timed(lambda: [money.amortize(p, RATE, n) for p, n in zip(principals, terms)])
+    batch = timed(lambda: money.amortize_batch(principals, [RATE] * len(loans), terms))
+
+    per_loan = lambda seconds: seconds / args.loans * 1e6
+    print(f"{args.loans} loans, terms 6-240 months, {RATE}% a month")
+    print(f"{'legacy Decimal loop':<22} {legacy:>8.3f}s  {per_loan(legacy):>9.2f} us/loan")
+    print(f"{'money.amortize':<22} {cents:>8.3f}s  {per_loan(cents):>9.2f} us/loan")
+    print(f"{'money.amortize_batch':<22} {batch:>8.3f}s  {per_loan(batch):>9.2f} us/loan")
+    print(f"speedup vs legacy: {legacy / cents:.1f}x single, {legacy / batch:.1f}x batch")
+
+    drift = [legacy_drift(principal, legacy_decimal_schedule(principal, RATE, months)) for principal, months in loans]
+    print(f"legacy drift: {sum(1 for rows, _ in drift if rows)} loans with rows where payment != interest + principal, "
+          f"{sum(1 for _, total in drift if total)} loans whose principal does not sum to the amount "
+          f"(worst {max(abs(total) for _, total in drift)} cents)")
+
+    failures = check_calculator(loans)
+    for rounding in (ROUND_HALF_EVEN, ROUND_HALF_UP):
+        failures.extend(cross_check(loans, rounding))
+    if failures:
+        print(f"\n{len(failures)} cross-check failures:")
+        for message in failures[:20]:
+            print(f"  {message}")
+        sys.exit(1)
+    print("cross-checks passed: every schedule reconciles to the cent in both rounding modes")
+
+
+if __name__ == '__main__':
+    main()
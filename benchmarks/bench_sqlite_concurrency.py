@@ -0,0 +1,176 @@
+"""
+Mixed reader/writer load against a scratch SQLite database, run once with Django's default
+SQLite settings and once with the tuned settings from loan_tracker/settings.py (WAL,
+synchronous=NORMAL, mmap, page cache, busy timeout and IMMEDIATE transactions).
+
+Readers run the loan_list queries (a page of loans plus portfolio totals); writers post
+repayments the way make_repayment does, inside a transaction. Reported per profile: operations
+per second, p50/p99 latency and the number of "database is locked" errors.
+
+Usage:
+    python benchmarks/bench_sqlite_concurrency.py [--readers 4] [--writers 2] [--duration 10]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _setup(profile, path):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_tracker.settings')
+    from django.conf import settings
+
+    if profile == 'default':
+        settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+    else:
+        settings.DATABASES['default'] = dict(settings.DATABASES['default'], NAME=path)
+    import django
+    django.setup()
+
+
+def _seed(users, loans):
+    from django.core.management import call_command
+    from mohi.models import CustomUser, Loan
+
+    call_command('migrate', verbosity=0)
+    rnd = random.Random(0)
+    people = CustomUser.objects.bulk_create([
+        CustomUser(email=f'user{i}@example.com', first_name='Bench', last_name=str(i), department='Ops', designation='Staff')
+        for i in range(users)
+    ])
+    Loan.objects.bulk_create([
+        Loan(
+            user=people[i % users],
+            amount=Decimal(rnd.randrange(10_000, 500_000)),
+            balance=Decimal(0),
+            term_months=rnd.choice([6, 12, 24, 36]),
+            start_date=date(2025, 1, 1),
+        )
+        for i in range(loans)
+    ])
+    Loan.objects.recompute_balances()
+
+
+def _worker(kind, deadline, user_ids, loan_ids, queue):
+    from django.db import OperationalError, connection, transaction
+    from mohi.models import Loan, Repayment
+    from mohi.stats import PortfolioStats
+
+    latencies, errors = [], []
+    rnd = random.Random()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if kind == 'reader':
+                loans = Loan.objects.filter(user_id=rnd.choice(user_ids)).select_related('user').order_by('-start_date', '-id')
+                list(loans[:10])
+                PortfolioStats.from_queryset(loans)
+            else:
+                # Like make_repayment: read the loan, then write inside the same transaction
+                with transaction.atomic():
+                    loan = Loan.objects.get(pk=rnd.choice(loan_ids))
+                    Repayment.objects.create(
+                        loan=loan, date=date.today(),
+                        amount=Decimal('10.00'), principal=Decimal('9.00'), interest=Decimal('1.00'),
+                    )
+        except OperationalError as exc:
+            errors.append(str(exc))
+        else:
+            latencies.append(time.perf_counter() - started)
+    connection.close()
+    queue.put((kind, latencies, errors))
+
+
+def run_profile(profile, path, args):
+    """Child process entry point: seed a fresh database, run the load and print JSON results."""
+    _setup(profile, path)
+    _seed(args.users, args.loans)
+    from mohi.models import CustomUser, Loan
+
+    user_ids = list(CustomUser.objects.values_list('id', flat=True))
+    loan_ids = list(Loan.objects.values_list('id', flat=True))
+    from django.db import connection
+    connection.close()
+
+    # Separate processes, like the workers of a WSGI server, so the GIL does not serialize them
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    deadline = time.perf_counter() + args.duration
+    workers = [
+        context.Process(target=_worker, args=(kind, deadline, user_ids, loan_ids, queue))
+        for kind, count in (('reader', args.readers), ('writer', args.writers))
+        for _ in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+    results = {'reader': ([], []), 'writer': ([], [])}
+    for _ in workers:
+        kind, latencies, errors = queue.get()
+        results[kind][0].extend(latencies)
+        results[kind][1].extend(errors)
+    for worker in workers:
+        worker.join()
+
+    summary = {}
+    for kind, (latencies, errors) in results.items():
+        latencies.sort()
+        summary[kind] = {
+            'ops': len(latencies) / args.duration,
+            'p50': latencies[len(latencies) // 2] * 1000 if latencies else None,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else None,
+            'locked': sum('locked' in error for error in errors),
+            'errors': len(errors),
+        }
+    print(json.dumps(summary))
+
+
+def _fmt(value):
+    return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite default vs tuned settings under mixed load.")
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--loans', type=int, default=5000)
+    parser.add_argument('--profile', choices=['default', 'tuned'], action='append')
+    parser.add_argument('--run', choices=['default', 'tuned'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_profile(args.run, args.db, args)
+        return
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.duration:.0f}s per profile")
+    print(f"{'profile':<8} {'kind':<7} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'locked':>7} {'errors':>7}")
+    for profile in args.profile or ['default', 'tuned']:
+        with tempfile.TemporaryDirectory() as scratch:
+            command = [
+                sys.executable, os.path.abspath(__file__), '--run', profile, '--db', os.path.join(scratch, 'bench.sqlite3'),
+                '--readers', str(args.readers), '--writers', str(args.writers), '--duration', str(args.duration),
+                '--users', str(args.users), '--loans', str(args.loans),
+            ]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        summary = json.loads(output.strip().splitlines()[-1])
+        for kind, row in summary.items():
+            print(
+                f"{profile:<8} {kind:<7} {row['ops']:>9.1f} {_fmt(row['p50'])} {_fmt(row['p99'])} "
+                f"{row['locked']:>7} {row['errors']:>7}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+Benchmark suite over a seeded portfolio, with a JSON history and a regression gate.
+
+Seeds a scratch SQLite database with `manage.py seed_portfolio` at the chosen scale, then
+times calculate_loan, a cold Loan.generate_amortization_schedule, and the loan_list,
+loan_detail, loan_report and make_repayment views through the test client with every cache
+cleared before each request. Each case records its median time and query count.
+
+Results are compared with the last run at the same scale in the history file. The run fails
+(exit status 1) when a case is slower by more than --threshold or runs more queries; passing
+runs are appended to the history, failing ones only with --accept.
+
+Seeding the 1m scale takes several minutes, so pass --db to keep the database between runs.
+
+Usage:
+    python benchmarks/bench_suite.py [--scale 1k|100k|1m] [--repeat 5] [--threshold 0.25]
+                                     [--min-delta-ms 2] [--history benchmarks/history.json] [--db path] [--accept]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCALES = {
+    '1k': {'users': 100, 'loans': 1_000},
+    '100k': {'users': 5_000, 'loans': 100_000},
+    '1m': {'users': 50_000, 'loans': 1_000_000},
+}
+BENCH_EMAIL = 'bench-staff@example.com'
+
+
+def _setup(path):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_tracker.settings')
+    from django.conf import settings
+
+    settings.DATABASES['default'] = dict(settings.DATABASES['default'], NAME=path)
+    # No replica: every view reads the database that was seeded
+    settings.DATABASES.pop(getattr(settings, 'REPLICA_DATABASE', 'replica'), None)
+    settings.ALLOWED_HOSTS = ['testserver']
+    import django
+    django.setup()
+
+
+def _seed(scale):
+    from django.core.management import call_command
+    from mohi.models import CustomUser, Loan
+
+    call_command('migrate', verbosity=0)
+    size = SCALES[scale]
+    if Loan.objects.count() < size['loans']:
+        call_command('seed_portfolio', users=size['users'], loans=size['loans'] - Loan.objects.count())
+    staff, _ = CustomUser.objects.get_or_create(
+        email=BENCH_EMAIL,
+        defaults={'first_name': 'Bench', 'last_name': 'Staff', 'department': 'ICT', 'designation': 'Admin', 'is_staff': True},
+    )
+    return staff
+
+
+def _clear_caches():
+    from django.core.cache import caches
+
+    for cache in caches.all():
+        cache.clear()
+
+
+def _measure(repeat, run, prepare=None):
+    """Median milliseconds and the query count of the last run of run()."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for index in range(repeat):
+        argument = prepare(index) if prepare else None
+        _clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            run(argument)
+            timings.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': round(statistics.median(timings), 3), 'queries': len(queries)}
+
+
+def _get(client, url):
+    def run(_):
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+    return run
+
+
+def run_cases(scale, repeat):
+    from django.test import Client
+    from django.urls import reverse
+    from mohi.amortization import calculate_loan
+    from mohi.models import Loan
+
+    staff = _seed(scale)
+    client = Client()
+    client.force_login(staff)
+    rnd = random.Random(0)
+    # The same loans every run: seeded ids are contiguous, so a seeded sample of the id range
+    low, high = Loan.objects.order_by('id').values_list('id', flat=True)[0], Loan.objects.latest('id').id
+    sample = sorted(Loan.objects.filter(id__in=rnd.sample(range(low, high + 1), min(40, high - low + 1)))
+                    .values_list('id', flat=True)[:20])
+    # Loans without repayments, so every timed POST creates the same two repayments
+    active = list(
+        Loan.objects.filter(is_paid=False, repayment__isnull=True).order_by('id').values_list('id', flat=True)[:repeat]
+    )
+    terms = [(rnd.uniform(5000, 500000), 1.0, rnd.randint(6, 240)) for _ in range(1000)]
+
+    def schedules(_):
+        for loan in Loan.objects.filter(id__in=sample):
+            loan.generate_amortization_schedule(original=True)
+
+    def repay(loan_id):
+        response = client.post(reverse('make_repayment', args=[loan_id]), {'paid_0': 'on', 'paid_1': 'on'})
+        assert response.status_code == 200, response.status_code
+
+    return {
+        'calculate_loan_x1000': _measure(repeat, lambda _: [calculate_loan(*args) for args in terms]),
+        'generate_amortization_schedule_x20': _measure(repeat, schedules),
+        'loan_list': _measure(repeat, _get(client, reverse('loan_list'))),
+        'loan_list_search': _measure(repeat, _get(client, reverse('loan_list') + '?search=seed1')),
+        'loan_detail': _measure(repeat, _get(client, reverse('loan_detail', args=[sample[0]]))),
+        'loan_report': _measure(repeat, _get(client, reverse('loan_report'))),
+        'make_repayment': _measure(len(active), repay, prepare=lambda index: active[index]),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold, min_delta_ms=2.0):
+    """
+    Messages for every case that runs more queries, or got slower than threshold allows by
+    more than min_delta_ms (so timer noise on millisecond cases does not fail the run).
+    """
+    regressions = []
+    for case, result in results.items():
+        previous = baseline.get(case)
+        if previous is None:
+            continue
+        slower = result['median_ms'] - previous['median_ms']
+        if result['median_ms'] > previous['median_ms'] * (1 + threshold) and slower > min_delta_ms:
+            regressions.append(
+                f"{case}: {result['median_ms']:.1f} ms vs {previous['median_ms']:.1f} ms "
+                f"(+{result['median_ms'] / previous['median_ms'] - 1:.0%})"
+            )
+        if result['queries'] > previous['queries']:
+            regressions.append(f"{case}: {result['queries']} queries vs {previous['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite with a regression gate.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown before failing, 0.25 = 25%%.")
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help="Slowdowns smaller than this never fail.")
+    parser.add_argument('--history', default=os.path.join(ROOT, 'benchmarks', 'history.json'))
+    parser.add_argument('--db', help="SQLite file to seed and reuse; a temporary one is used when omitted.")
+    parser.add_argument('--accept', action='store_true', help="Record the run in the history even if it regressed.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        _setup(args.db or os.path.join(scratch, 'bench.sqlite3'))
+        results = run_cases(args.scale, args.repeat)
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as fh:
+            history = json.load(fh)
+    baseline = next((run['results'] for run in reversed(history) if run['scale'] == args.scale), {})
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+
+    print(f"scale {args.scale}, median of {args.repeat}")
+    print(f"{'case':<36} {'ms':>10} {'queries':>8} {'baseline ms':>12}")
+    for case, result in results.items():
+        previous = baseline.get(case, {}).get('median_ms')
+        previous = f"{previous:>12.1f}" if previous is not None else f"{'-':>12}"
+        print(f"{case:<36} {result['median_ms']:>10.1f} {result['queries']:>8} {previous}")
+
+    if not regressions or args.accept:
+        history.append({
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'scale': args.scale,
+            'repeat': args.repeat,
+            'results': results,
+        })
+        with open(args.history, 'w') as fh:
+            json.dump(history, fh, indent=2)
+    if regressions:
+        print("\nRegressions:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Closed-loop HTTP load test for comparing the ASGI and WSGI deployments.
+
+Start the two servers with one worker each, for example:
+    gunicorn -w 1 -b 127.0.0.1:8001 loan_tracker.wsgi
+    uvicorn --workers 1 --port 8002 loan_tracker.asgi:application
+
+then run:
+    python benchmarks/load_test.py --target wsgi=http://127.0.0.1:8001 --target asgi=http://127.0.0.1:8002
+
+Each of --concurrency clients sends requests back to back for --duration seconds over a
+keep-alive connection. --slow-read adds a pause before every response body is read, to
+model slow mobile clients that tie up a synchronous worker.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = [
+    '/api/quote?amount=65000&term=21',
+    '/api/quote?amount=65000&term=21&schedule=1',
+    '/api/quote?amount=123456&term=240&schedule=1',
+]
+
+
+async def _request(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("server closed the connection")
+    length = None
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    return int(status_line.split()[1]), length, chunked
+
+
+async def _read_body(reader, length, chunked):
+    if chunked:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                return
+    elif length:
+        await reader.readexactly(length)
+
+
+async def _client(base_url, paths, deadline, slow_read, latencies, errors):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    reader = writer = None
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            status, length, chunked = await _request(reader, writer, f"{host}:{port}", path)
+            if slow_read:
+                await asyncio.sleep(slow_read)
+            await _read_body(reader, length, chunked)
+            if status >= 400:
+                errors.append(status)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors.append('connection')
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_target(base_url, paths, concurrency, duration, slow_read):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _client(base_url, paths, deadline, slow_read, latencies, errors) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def _percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', action='append', required=True, help="name=base_url, repeatable")
+    parser.add_argument('--path', action='append', help="Request path, repeatable (default: /api/quote variants)")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--slow-read', type=float, default=0.0, help="Seconds each client waits before reading a body")
+    args = parser.parse_args()
+
+    paths = args.path or DEFAULT_PATHS
+    print(f"{args.concurrency} clients, {args.duration:.0f}s per target, slow read {args.slow_read}s")
+    print(f"{'target':<10} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'errors':>7}")
+    for target in args.target:
+        name, _, base_url = target.partition('=')
+        latencies, errors, elapsed = asyncio.run(
+            run_target(base_url, paths, args.concurrency, args.duration, args.slow_read)
+        )
+        mean = statistics.fmean(latencies) if latencies else float('nan')
+        print(
+            f"{name:<10} {len(latencies) / elapsed:>9.1f} {_percentile(latencies, 0.50) * 1000:>9.1f} "
+            f"{_percentile(latencies, 0.99) * 1000:>9.1f} {mean * 1000:>9.1f} {len(errors):>7}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_tracker.settings')
 
+# A persistent connection belongs to the thread that opened it, and under ASGI the queries run
+# on sync_to_async and offload threads that request_finished never visits, so each would hold
+# its own connection open. Served over ASGI, every connection is closed after its request.
+for database in settings.DATABASES.values():
+    database['CONN_MAX_AGE'] = 0
+
 application = get_asgi_application()
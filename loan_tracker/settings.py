@@ -44,6 +44,8 @@ AUTH_USER_MODEL = 'mohi.CustomUser'
 
 
 MIDDLEWARE = [
+    'mohi.middleware.MetricsMiddleware',
+    'mohi.middleware.VersionScopeMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,13 +53,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'mohi.middleware.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'loan_tracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render times recorded for /metrics
+        'BACKEND': 'mohi.template_backend.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,13 +80,144 @@ WSGI_APPLICATION = 'loan_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Every new SQLite connection switches to WAL, so readers no longer block behind a writer,
+# and relaxes fsyncs to the end of each WAL checkpoint. Transactions start IMMEDIATE so a writer
+# waits for the lock up front (for up to "timeout" seconds) instead of failing with
+# "database is locked" when it tries to upgrade a read lock half way through.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,  # KiB, i.e. 32 MB of page cache per connection
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections for a minute instead of reopening (and re-running the pragmas) per
+        # request; loan_tracker/asgi.py turns this off when served over ASGI
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,  # busy_timeout, in seconds
+        },
     }
 }
 
+# Read replica for the read-only pages (home, loan list, report, exports). Locally it is a copy
+# of db.sqlite3 made by "manage.py refresh_replica"; it is used once that file exists.
+# Browsers that wrote something are pinned to the primary for REPLICA_STICKY_SECONDS.
+REPLICA_DATABASE = 'replica'
+REPLICA_STICKY_SECONDS = 10
+REPLICA_PIN_COOKIE = 'mohi_primary'
+if (BASE_DIR / 'db.replica.sqlite3').exists():
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': 'PRAGMA query_only=ON;' + ';'.join(
+                f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+                if name not in ('journal_mode', 'synchronous')
+            ),
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['mohi.routers.ReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Amortization schedules live in their own bounded LRU cache so they cannot evict other entries.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mohi-default',
+    },
+    'schedules': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mohi-schedules',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    # Picked up by {% cache %}: the schedule and repayment tables of loan_detail
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mohi-fragments',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    # Version tokens of cached schedules, fragments and pages. They must be shared by every
+    # process that writes (web workers and management commands), so this cannot be locmem;
+    # point VERSION_CACHE_ALIAS at a Redis or Memcached cache where one is available.
+    # Create the table with "manage.py createcachetable".
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'mohi_cache_versions',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1_000_000,
+        },
+    },
+}
+
+SCHEDULE_CACHE_ALIAS = 'schedules'
+VERSION_CACHE_ALIAS = 'versions'
+
+# Rendered dashboard pages, cached per user and session (mohi.view_cache.cache_per_user)
+VIEW_CACHE_ALIAS = 'default'
+VIEW_CACHE_TIMEOUT = 60 * 5
+
+# Dashboard totals: 'live' runs one aggregate query per scope, 'summary' reads the
+# PortfolioSummary table rebuilt by `manage.py refresh_portfolio_summary`.
+PORTFOLIO_STATS_SOURCE = 'live'
+PORTFOLIO_STATS_TIMEOUT = 30
+
+# Calculator quotes are cached by a hash of (principal, rate, months)
+QUOTE_CACHE_TIMEOUT = 60 * 60 * 24
+DEFAULT_MONTHLY_RATE = 1.0  # percent per month, used by the calculator and /api/quote
+
+# /api/quote serves this (amount, term) grid from a table priced once per process
+QUOTE_GRID_AMOUNTS = range(5000, 1000001, 5000)
+QUOTE_GRID_TERMS = range(1, 61)
+
+# Request metrics (mohi.middleware.MetricsMiddleware), served at /metrics in the Prometheus
+# text format. Counters are per process: scrape every worker, or run a single one.
+# Staff can always read it; a scraper sends "Authorization: Bearer <METRICS_TOKEN>".
+# None leaves the endpoint to staff only.
+METRICS_TOKEN = None
+# Requests slower than this are logged to mohi.performance with their slowest queries
+SLOW_REQUEST_SECONDS = 1.0
+SLOW_REQUEST_TOP_QUERIES = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '{asctime} {levelname} {name}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'mohi': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,6 +257,13 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 
 STATIC_URL = 'static/'
 
+# Statements rendered by `manage.py statement_worker`, one directory per job
+STATEMENT_ROOT = BASE_DIR / 'statements'
+# A running job with no progress for this many seconds is taken to have lost its worker and is
+# queued again, up to STATEMENT_JOB_MAX_ATTEMPTS runs in all
+STATEMENT_JOB_TIMEOUT = 60 * 10
+STATEMENT_JOB_MAX_ATTEMPTS = 3
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
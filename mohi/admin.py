@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Loan, Repayment
+from .models import CustomUser, Loan, MonthlyRollup, PortfolioSummary, Repayment, StatementJob, StatementJobItem
 
 class CustomUserAdmin(UserAdmin):
     ordering = ('email',)
@@ -20,4 +20,8 @@ class CustomUserAdmin(UserAdmin):
 
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Loan)
-admin.site.register(Repayment)
\ No newline at end of file
+admin.site.register(Repayment)
+admin.site.register(PortfolioSummary)
+admin.site.register(MonthlyRollup)
+admin.site.register(StatementJob)
+admin.site.register(StatementJobItem)
\ No newline at end of file
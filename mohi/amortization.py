@@ -0,0 +1,318 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from . import metrics, money
+
+
+class ScheduleRow:
+    """A single installment of an AmortizationSchedule."""
+    __slots__ = ('month', 'date', 'payment', 'interest', 'principal', 'balance')
+
+    def __init__(self, month, date, payment, interest, principal, balance):
+        self.month = month
+        self.date = date
+        self.payment = payment
+        self.interest = interest
+        self.principal = principal
+        self.balance = balance
+
+    def __getitem__(self, key):
+        # Allow item['payment'] lookups from code written against the old list-of-dicts schedules
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != 'date' or self.date is not None}
+
+    def __repr__(self):
+        return f"ScheduleRow(month={self.month}, payment={self.payment}, balance={self.balance})"
+
+
+class AmortizationSchedule:
+    """
+    Column-oriented amortization schedule.
+
+    Each column (month, payment, interest, principal, balance) is a NumPy array, so
+    totals are cheap (``schedule.interest.sum()``). Rows are built lazily while iterating,
+    installment dates are derived from start_date, and scaled() returns a view over the
+    same arrays with a currency multiplier applied on access instead of copying them.
+    """
+    __slots__ = ('_month', '_payment', '_interest', '_principal', '_balance', 'start_date', 'scale')
+
+    def __init__(self, month, payment, interest, principal, balance, start_date=None, scale=1.0):
+        self._month = np.asarray(month, dtype=np.int64)
+        self._payment = np.asarray(payment, dtype=np.float64)
+        self._interest = np.asarray(interest, dtype=np.float64)
+        self._principal = np.asarray(principal, dtype=np.float64)
+        self._balance = np.asarray(balance, dtype=np.float64)
+        self.start_date = start_date
+        self.scale = scale
+
+    @classmethod
+    def from_batch(cls, result, index, start_date=None):
+        """Build a schedule for one loan of a calculate_loans_batch result without copying its columns."""
+        months = int(result['mask'][index].sum())
+        return cls(
+            np.arange(1, months + 1),
+            result['payment'][index, :months],
+            result['interest'][index, :months],
+            result['principal'][index, :months],
+            result['balance'][index, :months],
+            start_date=start_date,
+        )
+
+    def _view(self, start_date, scale):
+        view = AmortizationSchedule.__new__(AmortizationSchedule)
+        view._month = self._month
+        view._payment = self._payment
+        view._interest = self._interest
+        view._principal = self._principal
+        view._balance = self._balance
+        view.start_date = start_date
+        view.scale = scale
+        return view
+
+    def scaled(self, factor):
+        """Return a view of this schedule with every money column multiplied by factor."""
+        return self._view(self.start_date, self.scale * float(factor))
+
+    def starting(self, start_date):
+        """Return a view of this schedule whose first installment falls on start_date."""
+        return self._view(start_date, self.scale)
+
+    def _column(self, values):
+        return values if self.scale == 1 else values * self.scale
+
+    @property
+    def month(self):
+        return self._month
+
+    @property
+    def payment(self):
+        return self._column(self._payment)
+
+    @property
+    def interest(self):
+        return self._column(self._interest)
+
+    @property
+    def principal(self):
+        return self._column(self._principal)
+
+    @property
+    def balance(self):
+        return self._column(self._balance)
+
+    def date_for(self, month):
+        if self.start_date is None:
+            return None
+        return self.start_date + timedelta(days=30 * (month - 1))
+
+    def __len__(self):
+        return len(self._month)
+
+    def __bool__(self):
+        return len(self._month) > 0
+
+    def __getitem__(self, index):
+        month = int(self._month[index])
+        return ScheduleRow(
+            month,
+            self.date_for(month),
+            float(self._payment[index] * self.scale),
+            float(self._interest[index] * self.scale),
+            float(self._principal[index] * self.scale),
+            float(self._balance[index] * self.scale),
+        )
+
+    def __iter__(self):
+        columns = (self.payment.tolist(), self.interest.tolist(), self.principal.tolist(), self.balance.tolist())
+        for month, payment, interest, principal, balance in zip(self._month.tolist(), *columns):
+            yield ScheduleRow(month, self.date_for(month), payment, interest, principal, balance)
+
+    def as_dicts(self):
+        return [row.as_dict() for row in self]
+
+
+def _cents_columns(result, name):
+    return result[name] / 100
+
+
+def calculate_loans_batch(principals, rates, terms, rounding=money.DEFAULT_ROUNDING):
+    """
+    Calculate reducing balance schedules for many loans at once with the integer-cents engine.
+    Args:
+        principals (array-like): Loan amounts
+        rates (array-like): Monthly interest rates in percent (e.g., 1 for 1%)
+        terms (array-like): Loan terms in months
+        rounding (str): Per-installment rounding, money.ROUND_HALF_EVEN or money.ROUND_HALF_UP
+    Returns:
+        dict: Per-loan monthly_payment, total_interest and total_paid arrays of shape (N,),
+              and payment, interest, principal and balance arrays of shape (N, max_term).
+              Months past a loan's last installment are zero; 'mask' marks the valid months.
+    """
+    principals = np.atleast_1d(np.asarray(principals, dtype=object))
+    result = money.amortize_batch([money.to_cents(amount) for amount in principals.tolist()], rates, terms, rounding)
+    return {
+        'monthly_payment': _cents_columns(result, 'level_payment'),
+        'total_interest': _cents_columns(result, 'total_interest'),
+        'total_paid': _cents_columns(result, 'total_paid'),
+        'payment': _cents_columns(result, 'payment'),
+        'interest': _cents_columns(result, 'interest'),
+        'principal': _cents_columns(result, 'principal'),
+        'balance': _cents_columns(result, 'balance'),
+        'mask': result['mask'],
+    }
+
+
+def summarize_loans_batch(principals, rates, terms, rounding=money.DEFAULT_ROUNDING):
+    """
+    Payment summary for many loans without materializing their schedules.
+    Returns:
+        dict: monthly_payment, total_interest and total_paid arrays of shape (N,)
+    """
+    principals = np.atleast_1d(np.asarray(principals, dtype=object))
+    result = money.amortize_batch(
+        [money.to_cents(amount) for amount in principals.tolist()], rates, terms, rounding, keep_rows=False,
+    )
+    return {
+        'monthly_payment': _cents_columns(result, 'level_payment'),
+        'total_interest': _cents_columns(result, 'total_interest'),
+        'total_paid': _cents_columns(result, 'total_paid'),
+    }
+
+
+def schedule_from_cents(schedule, start_date=None, first_month=1):
+    """AmortizationSchedule (display floats) of a money.CentsSchedule, numbered from first_month."""
+    return AmortizationSchedule(
+        np.arange(first_month, first_month + len(schedule)),
+        np.array(schedule.payment, dtype=np.float64) / 100,
+        np.array(schedule.interest, dtype=np.float64) / 100,
+        np.array(schedule.principal, dtype=np.float64) / 100,
+        np.array(schedule.balance, dtype=np.float64) / 100,
+        start_date=start_date,
+    )
+
+
+@metrics.timed('calculate_loan')
+def calculate_loan(principal, monthly_rate, months, rounding=money.DEFAULT_ROUNDING):
+    """
+    Calculate loan details for a reducing balance loan.
+    Args:
+        principal (float): Loan amount
+        monthly_rate (float): Monthly interest rate in percent (e.g., 1 for 1%)
+        months (int): Loan term in months
+        rounding (str): Per-installment rounding, money.ROUND_HALF_EVEN or money.ROUND_HALF_UP
+    Returns:
+        dict: Monthly payment, total interest, total paid, and AmortizationSchedule
+    """
+    schedule = money.amortize(money.to_cents(principal), monthly_rate, months, rounding)
+    return {
+        'monthly_payment': schedule.level_payment / 100,
+        'total_interest': sum(schedule.interest) / 100,
+        'total_paid': sum(schedule.payment) / 100,
+        'schedule': schedule_from_cents(schedule),
+    }
+
+
+def _segments(monthly_rate):
+    # The random-access helpers take a single rate or the ((first_month, rate), ...) of a loan whose rate changed
+    return monthly_rate if isinstance(monthly_rate, tuple) else ((1, monthly_rate),)
+
+
+def _schedule(principal, monthly_rate, months):
+    # Rounding every installment to the cent makes each balance depend on all the earlier ones,
+    # so there is no exact closed form. The helpers below index the memoized money.amortize
+    # schedule instead: O(months) the first time a set of terms is seen, O(1) after that.
+    principal, months = money.to_cents(principal), int(months)
+    if principal <= 0 or months <= 0:
+        raise ValueError("Principal and months must be positive, and monthly rate must be non-negative.")
+    return money.amortize_segments(principal, months, _segments(monthly_rate))
+
+
+def _check_month(k, months, lowest=1):
+    if not lowest <= k <= months:
+        raise IndexError(f"Month {k} is outside the loan term (1-{months}).")
+
+
+def _row(schedule, k):
+    # A schedule that closes early (rounding at extreme rates) has nothing left to pay afterwards
+    if k > len(schedule):
+        return 0, 0, 0, 0
+    return schedule.payment[k - 1], schedule.interest[k - 1], schedule.principal[k - 1], schedule.balance[k - 1]
+
+
+def balance_after(principal, monthly_rate, months, k):
+    """
+    Remaining balance after k installments.
+    Args:
+        principal (Decimal): Loan amount
+        monthly_rate (Decimal|tuple): Monthly interest rate in percent (e.g., 1 for 1%), or the
+            ((first_month, rate), ...) segments of Loan.rate_segments() for a loan whose rate changed
+        months (int): Loan term in months
+        k (int): Installments paid, 0 to months
+    Returns:
+        Decimal: Balance in cents, equal to the schedule's balance for month k
+    """
+    schedule = _schedule(principal, monthly_rate, months)
+    _check_month(k, int(months), lowest=0)
+    return money.from_cents(schedule.principal_cents if k == 0 else _row(schedule, k)[3])
+
+
+def schedule_row(principal, monthly_rate, months, k, start_date=None):
+    """
+    Row k (1-based) of the amortization schedule.
+    Returns:
+        ScheduleRow: Same values as the k-th row of the full schedule
+    """
+    schedule = _schedule(principal, monthly_rate, months)
+    _check_month(k, int(months))
+    row_date = start_date + timedelta(days=30 * (k - 1)) if start_date else None
+    return ScheduleRow(k, row_date, *(cents / 100 for cents in _row(schedule, k)))
+
+
+def installment_interest(principal, monthly_rate, months, k):
+    """
+    Interest charged in month k (1-based), equal to row k's interest.
+    Returns:
+        Decimal: Interest in cents
+    """
+    schedule = _schedule(principal, monthly_rate, months)
+    _check_month(k, int(months))
+    return money.from_cents(_row(schedule, k)[1])
+
+
+def interest_between(principal, monthly_rate, months, first, last):
+    """
+    Interest charged from month first to month last inclusive.
+    Returns:
+        Decimal: The sum of the schedule's interest over those rows, to the cent
+    """
+    schedule = _schedule(principal, monthly_rate, months)
+    _check_month(first, int(months))
+    _check_month(last, int(months))
+    return money.from_cents(sum(schedule.interest[first - 1:last]))
+
+
+def payoff_amount(principal, monthly_rate, months, start_date, on_date, rounding=money.DEFAULT_ROUNDING):
+    """
+    Amount that settles the loan on on_date.
+    Installments due before on_date are taken as paid; the payoff is the remaining
+    balance plus one month's interest on it, the same rule the schedule uses for its final payment.
+    Returns:
+        Decimal: Payoff in cents, or 0.00 once every installment has fallen due
+    """
+    schedule = _schedule(principal, monthly_rate, months)
+    n = int(months)
+    # Installment m falls due start_date + 30 * (m - 1) days; count those strictly before on_date
+    days = (on_date - start_date).days
+    paid = min(n, max(0, -(-days // 30)))
+    balance = schedule.balance_after(min(paid, len(schedule)))
+    if paid >= n or balance == 0:
+        return Decimal('0.00')
+    num, den = money.rate_ratio(money.rate_at(_segments(monthly_rate), paid + 1))
+    return money.from_cents(balance + money.div_round(balance * num, den, rounding))
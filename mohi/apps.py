@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MohiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mohi'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import metrics, signals  # noqa: F401
+
+        connection_created.connect(metrics.install_query_wrapper, dispatch_uid='mohi.metrics.query_wrapper')
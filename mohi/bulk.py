@@ -0,0 +1,40 @@
+from functools import partial
+from itertools import islice
+
+from django.db import transaction
+
+from . import schedule_cache, stats, view_cache
+
+
+def chunks(iterable, size):
+    """Lists of up to size consecutive items of iterable, read lazily."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def invalidate(user_ids, loan_ids=()):
+    """Drop the cached schedules of loan_ids and the cached stats and pages of user_ids."""
+    schedule_cache.invalidate_many(loan_ids)
+    for user_id in user_ids:
+        stats.invalidate(user_id)
+        view_cache.invalidate(user_id)
+
+
+def invalidate_on_commit(user_ids, loan_ids=()):
+    """
+    invalidate() once the current transaction commits.
+    bulk_create, bulk_update and QuerySet.update() send no post_save or post_delete, so the
+    handlers in mohi.signals never see them; code that writes loans or repayments in bulk calls
+    this instead, after keeping installments and rollups up to date itself.
+    """
+    transaction.on_commit(partial(invalidate, set(user_ids), set(loan_ids)))
+
+
+def invalidate_all_on_commit():
+    """Drop every cached schedule and page once the current transaction commits, for book-wide bulk writes."""
+    transaction.on_commit(schedule_cache.invalidate_all)
+    transaction.on_commit(view_cache.invalidate_all)
@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'CPU_OFFLOAD_WORKERS', None),
+            thread_name_prefix='mohi-offload',
+        )
+    return _executor
+
+
+async def offload(func, *args):
+    """
+    Run CPU-bound work such as schedule generation in a worker thread so the event loop keeps
+    serving other requests. The cents engine is pure-Python integer arithmetic and holds the
+    GIL, so this adds no parallelism: the interpreter's switch interval lets the loop accept
+    connections and finish I/O while a schedule is built, and the threads share the process's
+    memoized schedules. CPU throughput scales with server worker processes, not with
+    CPU_OFFLOAD_WORKERS.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _closing_connections, func, *args)
+
+
+def _closing_connections(func, *args):
+    # request_finished never runs on the offload threads, so connections they open (the
+    # database cache, for one) are released here once they pass CONN_MAX_AGE
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def can_fork():
+    """Whether process_pool() can be used: no database connection is inside a transaction."""
+    return not any(connection.in_atomic_block for connection in connections.all())
+
+
+def process_pool(workers, initializer=None):
+    """
+    ProcessPoolExecutor for CPU-bound work on forked workers. Forked workers must not inherit
+    the parent's open database connections, so they are closed first and the parent reconnects
+    on its next query. Connections cannot be closed inside a transaction; callers check
+    can_fork() and otherwise do the work in this process.
+    """
+    if not can_fork():
+        raise RuntimeError("A process pool cannot be started inside a transaction.")
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, initializer=initializer)
@@ -1,6 +1,12 @@
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 
+from .routers import read_from_replica
+
 def is_staff_required(view_func):
     def _wrapped_view(request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -8,4 +14,47 @@ def is_staff_required(view_func):
         if not request.user.is_staff:
             return HttpResponseForbidden("You must be a staff member to access this page.")
         return view_func(request, *args, **kwargs)
-    return _wrapped_view
\ No newline at end of file
+    return _wrapped_view
+
+
+def _pinned_to_primary(request):
+    # Set by ReplicaPinMiddleware after a write, so the writer reads its own changes
+    return getattr(settings, 'REPLICA_PIN_COOKIE', 'mohi_primary') in request.COOKIES
+
+
+def _replica_stream(iterator):
+    # The body is generated after the view returns, so re-enter the replica for every chunk
+    iterator = iter(iterator)
+    done = object()
+    while True:
+        with read_from_replica():
+            chunk = next(iterator, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def use_replica(view_func):
+    """
+    Serve the read-only view's queries from the read replica, unless the browser wrote
+    something in the last REPLICA_STICKY_SECONDS. Streaming bodies keep reading from the replica.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            if _pinned_to_primary(request):
+                return await view_func(request, *args, **kwargs)
+            with read_from_replica():
+                return await view_func(request, *args, **kwargs)
+        return _wrapped_async_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if _pinned_to_primary(request):
+            return view_func(request, *args, **kwargs)
+        with read_from_replica():
+            response = view_func(request, *args, **kwargs)
+        if getattr(response, 'streaming', False) and not response.is_async:
+            response.streaming_content = _replica_stream(response.streaming_content)
+        return response
+    return _wrapped_view
@@ -0,0 +1,165 @@
+import csv
+import zipfile
+from xml.sax.saxutils import escape
+
+from . import bulk, money
+from .amortization import AmortizationSchedule, calculate_loans_batch, schedule_from_cents
+from .models import rate_segments_for
+
+HEADER = [
+    'loan_id', 'email', 'amount', 'balance', 'term_months', 'start_date', 'status',
+    'month', 'due_date', 'payment', 'interest', 'principal', 'remaining_balance',
+]
+EMPTY_LOAN = [''] * 6
+EMPTY_INSTALLMENT = [''] * 6
+
+
+def portfolio_rows(loans, include_schedules=False, chunk_size=2000):
+    """
+    Yield the export header and then one row per loan, each optionally followed by its
+    installment rows. Loans are read with .iterator(chunk_size) and each chunk's schedules
+    are priced together with calculate_loans_batch, so memory is bounded by one chunk. Loans
+    whose rate changed mid-term are priced one by one from their rate history.
+    """
+    yield HEADER
+    loans = loans.select_related('user').only(
+        'id', 'amount', 'balance', 'interest_rate', 'rate_from_month', 'term_months', 'start_date', 'is_paid',
+        'user__email',
+    ).order_by('id')
+    for chunk in bulk.chunks(loans.iterator(chunk_size=chunk_size), chunk_size):
+        schedules = None
+        if include_schedules:
+            segments = rate_segments_for(chunk)
+            schedules = calculate_loans_batch(
+                [float(loan.amount) for loan in chunk],
+                [float(loan.monthly_rate) for loan in chunk],
+                [loan.term_months for loan in chunk],
+            )
+        for index, loan in enumerate(chunk):
+            yield [
+                loan.id, loan.user.email, loan.amount, loan.balance, loan.term_months,
+                loan.start_date.isoformat(), loan.get_status_display(),
+            ] + EMPTY_INSTALLMENT
+            if schedules is not None:
+                if loan.rate_from_month > 1:
+                    cents = money.amortize_segments(money.to_cents(loan.amount), loan.term_months, segments[loan.id])
+                    schedule = schedule_from_cents(cents, start_date=loan.start_date)
+                else:
+                    schedule = AmortizationSchedule.from_batch(schedules, index, start_date=loan.start_date)
+                for row in schedule:
+                    yield [loan.id] + EMPTY_LOAN + [
+                        row.month, row.date.isoformat(), row.payment, row.interest, row.principal, row.balance,
+                    ]
+
+
+class _Echo:
+    """File-like object whose write() hands back what it was given."""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class _ZipBuffer:
+    """Unseekable sink for zipfile; drain() hands over everything written since the last call."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Portfolio" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value == '' or value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    if hasattr(value, 'as_tuple'):  # Decimal
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def xlsx_stream(rows, rows_per_flush=500):
+    """
+    Stream rows as a single-sheet XLSX workbook. The workbook is a zip written to an
+    unseekable buffer, so compressed bytes can be sent as soon as each batch of rows is written.
+    """
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        yield buffer.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for batch in bulk.chunks(rows, rows_per_flush):
+                sheet.write(''.join(
+                    '<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>' for row in batch
+                ).encode('utf-8'))
+                data = buffer.drain()
+                if data:
+                    yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_stream, 'text/csv'),
+    'xlsx': (xlsx_stream, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+
+from . import money
+from .models import Installment, rate_segments_for
+
+LOAN_FIELDS = ('id', 'amount', 'interest_rate', 'rate_from_month', 'term_months', 'start_date')
+
+
+def installment_rows(loan_id, start_date, schedule, first_month=1):
+    """
+    (loan_id, seq, due_date, payment, interest, principal) tuples of a money.CentsSchedule from
+    first_month on, amounts in cents. Needs no database, so worker processes can build them.
+    """
+    return [
+        (loan_id, seq, start_date + timedelta(days=30 * (seq - 1)),
+         schedule.payment[seq - 1], schedule.interest[seq - 1], schedule.principal[seq - 1])
+        for seq in range(first_month, len(schedule) + 1)
+    ]
+
+
+def replace(loan_ids, rows, from_rate_change=False, created=False, apps=global_apps, batch_size=1000):
+    """
+    Replace the installments of loan_ids with rows from installment_rows() and set their
+    statuses from the repayments already posted: one DELETE, the bulk_create and one UPDATE.
+    With from_rate_change only the rows from each loan's rate_from_month on are replaced,
+    the ones a rate change reprices; the installments before it are left as they were.
+    created skips the DELETE and the UPDATE for loans that were just inserted.
+    """
+    model = apps.get_model('mohi', 'Installment')
+    if not created:
+        stale = model.objects.filter(loan_id__in=loan_ids)
+        if from_rate_change:
+            stale = stale.filter(seq__gte=F('loan__rate_from_month'))
+        stale.delete()
+    model.objects.bulk_create([
+        model(
+            loan_id=loan_id, seq=seq, due_date=due_date, payment=money.from_cents(payment),
+            interest=money.from_cents(interest), principal=money.from_cents(principal),
+        )
+        for loan_id, seq, due_date, payment, interest, principal in rows
+    ], batch_size=batch_size)
+    if not created:
+        sync_status(loan_ids, apps=apps)
+    return len(rows)
+
+
+def materialize(loans, from_rate_change=False, created=False, apps=global_apps):
+    """
+    Write the installments of loans, priced from their terms and rate history, as replace()
+    does. Loans with nothing lent have no schedule, so any installments they kept from an
+    earlier amount are deleted. Loans need the LOAN_FIELDS columns. Returns the number of
+    rows written.
+    """
+    empty = [loan.id for loan in loans if loan.amount <= 0]
+    if empty and not created:
+        apps.get_model('mohi', 'Installment').objects.filter(loan_id__in=empty).delete()
+    loans = [loan for loan in loans if loan.amount > 0]
+    segments = rate_segments_for(loans, rate_changes=apps.get_model('mohi', 'RateChange').objects)
+    rows = []
+    for loan in loans:
+        schedule = money.amortize_segments(money.to_cents(loan.amount), loan.term_months, segments[loan.id])
+        first_month = loan.rate_from_month if from_rate_change else 1
+        rows.extend(installment_rows(loan.id, loan.start_date, schedule, first_month))
+    return replace([loan.id for loan in loans], rows, from_rate_change=from_rate_change, created=created, apps=apps)
+
+
+def sync_status(loan_ids, dates=None, apps=global_apps):
+    """
+    Mark the installments of loan_ids paid when a repayment is recorded on their due date and
+    due otherwise, in one UPDATE. dates narrows it to the installments due on those dates.
+    """
+    model = apps.get_model('mohi', 'Installment')
+    Repayment = apps.get_model('mohi', 'Repayment')
+    installments = model.objects.filter(loan_id__in=loan_ids)
+    if dates is not None:
+        installments = installments.filter(due_date__in=dates)
+    paid = Exists(Repayment.objects.filter(loan_id=OuterRef('loan_id'), date=OuterRef('due_date')))
+    return installments.update(
+        status=Case(When(paid, then=Value(Installment.PAID)), default=Value(Installment.DUE)),
+    )
+
+
+def rebuild(apps=global_apps, batch_size=2000):
+    """Rewrite the installments of every loan, a batch of loans at a time. Returns the number of rows written."""
+    Loan = apps.get_model('mohi', 'Loan')
+    written, last_id = 0, 0
+    with transaction.atomic():
+        while True:
+            batch = list(Loan.objects.filter(id__gt=last_id).only(*LOAN_FIELDS).order_by('id')[:batch_size])
+            if not batch:
+                return written
+            last_id = batch[-1].id
+            written += materialize(batch, apps=apps)
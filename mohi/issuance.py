@@ -0,0 +1,176 @@
+import csv
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from . import bulk, installments, rollups
+from .models import CustomUser, Loan, default_monthly_rate
+from .quotes import MAX_TERM
+from .rates import clean_rate
+
+COLUMNS = ('email', 'amount', 'term_months')
+MAX_AMOUNT = Decimal('99999999.99')  # Loan.amount is max_digits=10, decimal_places=2
+
+
+class IssueResult:
+    """Outcome of a bulk issuance: how many loans were created and why the other rows were skipped."""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def rejected(self):
+        return len(self.errors)
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(lines, columns=COLUMNS):
+    """
+    Return an iterator of (line_number, row) over CSV text whose header has the given columns
+    (by default email, amount, term_months, an optional start_date as YYYY-MM-DD and an optional
+    interest_rate as a monthly percentage). The header is checked straight away; rows are read
+    lazily, so uploads of any size stay in constant memory.
+    """
+    reader = csv.DictReader(lines)
+    try:
+        fieldnames = reader.fieldnames or ()
+    except csv.Error as exc:
+        raise RowError(f"Malformed CSV: {exc}")
+    missing = [column for column in columns if column not in fieldnames]
+    if missing:
+        raise RowError(f"Missing column(s): {', '.join(missing)}")
+    return _rows(reader)
+
+
+def _rows(reader):
+    # A malformed line (stray quote, NUL byte, oversized field) leaves the reader unable to go on,
+    # so it fails the whole file like a bad header does
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as exc:
+        raise RowError(f"Malformed CSV after line {reader.line_num}: {exc}")
+
+
+def _users_by_email(emails):
+    """Borrowers whose email matches one of emails (lower-cased) ignoring case, as {lower-cased email: [user, ...]}."""
+    users = {}
+    matches = CustomUser.objects.only('id', 'email', 'department').annotate(
+        email_lower=Lower('email'),
+    ).filter(email_lower__in=emails)
+    for user in matches:
+        users.setdefault(user.email_lower, []).append(user)
+    return users
+
+
+def _match_user(users, email):
+    candidates = users.get(email.lower(), ())
+    for user in candidates:
+        if user.email == email:
+            return user
+    if len(candidates) > 1:
+        raise RowError(f"Several users match email {email}; give the exact address.")
+    if not candidates:
+        raise RowError(f"No user with email {email}.")
+    return candidates[0]
+
+
+def _clean(row, default_start):
+    email = (row.get('email') or '').strip()
+    if not email:
+        raise RowError("Email is required.")
+    try:
+        amount = Decimal((row.get('amount') or '').strip()).quantize(Decimal('0.01'))
+        term_months = int((row.get('term_months') or '').strip())
+    except (InvalidOperation, ValueError):
+        raise RowError("Invalid amount or term.")
+    if not amount.is_finite() or amount <= 0 or amount > MAX_AMOUNT:
+        raise RowError("Invalid amount or term.")
+    # Beyond this the end date overflows datetime.date
+    if not 1 <= term_months <= MAX_TERM:
+        raise RowError(f"Term must be between 1 and {MAX_TERM} months.")
+    start_date = default_start
+    if (row.get('start_date') or '').strip():
+        try:
+            start_date = date.fromisoformat(row['start_date'].strip())
+        except ValueError:
+            raise RowError("Invalid start_date, expected YYYY-MM-DD.")
+    interest_rate = default_monthly_rate()
+    if (row.get('interest_rate') or '').strip():
+        try:
+            interest_rate = clean_rate(row['interest_rate'].strip())
+        except ValueError as exc:
+            raise RowError(str(exc))
+    return email, amount, term_months, start_date, interest_rate
+
+
+def issue_loans(rows, start_date, batch_size=500, dry_run=False):
+    """
+    Validate and insert loans in batches of batch_size.
+    Each batch resolves its borrowers with one case-insensitive lookup on email and is written
+    with one bulk_create, plus one for its installments; everything runs in a single transaction
+    so a database error or malformed CSV leaves nothing half-issued, while invalid rows are only
+    recorded in the result.
+    Args:
+        rows (iterable): (line_number, dict) pairs as produced by read_rows
+        start_date (date): Start date for rows that do not give one
+        batch_size (int): Rows validated and inserted per query
+        dry_run (bool): Validate only; nothing is written
+    Returns:
+        IssueResult; a malformed CSV raises RowError instead
+    """
+    result = IssueResult()
+    user_ids = set()
+    delta = rollups.RollupDelta()
+    rows = iter(rows)
+    with transaction.atomic():
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            cleaned = []
+            for line, row in batch:
+                try:
+                    cleaned.append((line,) + _clean(row, start_date))
+                except RowError as exc:
+                    result.add_error(line, str(exc))
+
+            users = _users_by_email({email.lower() for _, email, _, _, _, _ in cleaned})
+            loans = []
+            for line, email, amount, term_months, loan_start, interest_rate in cleaned:
+                try:
+                    user = _match_user(users, email)
+                except RowError as exc:
+                    result.add_error(line, str(exc))
+                    continue
+                loans.append(Loan(
+                    user_id=user.id,
+                    amount=amount,
+                    balance=amount,
+                    interest_rate=interest_rate,
+                    term_months=term_months,
+                    start_date=loan_start,
+                    end_date=loan_start + timedelta(days=30 * term_months),
+                    is_paid=False,
+                ))
+                user_ids.add(user.id)
+                delta.loan(loan_start, user.department, amount)
+            if not dry_run:
+                Loan.objects.bulk_create(loans)
+                installments.materialize(loans, created=True)
+            result.created += len(loans)
+
+        if not dry_run:
+            rollups.apply(delta)
+            bulk.invalidate_on_commit(user_ids)
+    return result
@@ -0,0 +1,201 @@
+import logging
+import os
+from concurrent.futures import as_completed
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import bulk, concurrency, money
+from .amortization import schedule_from_cents
+from .models import Loan, StatementJob, StatementJobItem
+from .pdf import render_payment_schedule
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_statements(loans, created_by=None):
+    """Create a queued StatementJob with one item per loan in the queryset."""
+    with transaction.atomic():
+        job = StatementJob.objects.create(created_by=created_by)
+        items = (StatementJobItem(job=job, loan_id=loan_id) for loan_id in loans.values_list('id', flat=True).iterator())
+        total = 0
+        for batch in bulk.chunks(items, 1000):
+            StatementJobItem.objects.bulk_create(batch)
+            total += len(batch)
+        job.total = total
+        job.save(update_fields=['total'])
+    return job
+
+
+def recover_stale_jobs(now=None):
+    """
+    Requeue running jobs whose worker made no progress for STATEMENT_JOB_TIMEOUT seconds (it
+    was killed or lost its host); their finished items are kept, so a rerun renders only the
+    rest. A job that has already had STATEMENT_JOB_MAX_ATTEMPTS runs is failed instead.
+    Returns:
+        tuple: (requeued, failed) job counts
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, 'STATEMENT_JOB_TIMEOUT', 600))
+    stale = StatementJob.objects.filter(status=StatementJob.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+    )
+    max_attempts = getattr(settings, 'STATEMENT_JOB_MAX_ATTEMPTS', 3)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=StatementJob.FAILED, finished_at=now, error="The worker stopped responding.",
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=StatementJob.QUEUED)
+    if failed or requeued:
+        logger.warning("Recovered stale statement jobs: %s requeued, %s failed", requeued, failed)
+    return requeued, failed
+
+
+def claim_next_job():
+    """Atomically move the oldest queued job to running and return it, or None. Stale jobs are recovered first."""
+    recover_stale_jobs()
+    for job_id in StatementJob.objects.filter(status=StatementJob.QUEUED).order_by('created_at').values_list('id', flat=True)[:5]:
+        now = timezone.now()
+        claimed = StatementJob.objects.filter(pk=job_id, status=StatementJob.QUEUED).update(
+            status=StatementJob.RUNNING, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return StatementJob.objects.get(pk=job_id)
+    return None
+
+
+def job_directory(job_id):
+    return Path(settings.STATEMENT_ROOT) / f'job_{job_id}'
+
+
+def statement_payload(loan):
+    """Plain data needed to render one statement; safe to send to a worker process."""
+    user = loan.user
+    return {
+        'loan': {
+            'id': loan.id,
+            'user': {
+                'email': user.email,
+                'name': f"{user.first_name} {user.last_name}",
+                'department': user.department,
+                'designation': user.designation,
+            },
+            'amount': str(loan.amount),
+            'rates': [[first_month, str(rate)] for first_month, rate in loan.rate_segments()],
+            'term_months': loan.term_months,
+            'start_date': loan.start_date.isoformat(),
+            'balance': str(loan.balance),
+            'status': loan.get_status_display(),
+        },
+        'repayments': [
+            {'date': rep.date.isoformat(), 'amount': str(rep.amount), 'principal': str(rep.principal), 'interest': str(rep.interest)}
+            for rep in sorted(loan.repayment_set.all(), key=lambda rep: rep.date)
+        ],
+    }
+
+
+def _init_worker():
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def render_statement(payload, output_dir):
+    """
+    Worker process entry point: price the schedule and write the statement PDF.
+    Uses no database connection, so any number of workers can run next to the parent.
+    """
+    from datetime import date
+    from decimal import Decimal
+
+    data = payload['loan']
+    rates = tuple((first_month, Decimal(rate)) for first_month, rate in data['rates'])
+    schedule = schedule_from_cents(
+        money.amortize_segments(money.to_cents(Decimal(data['amount'])), data['term_months'], rates),
+        start_date=date.fromisoformat(data['start_date']),
+    )
+    path = os.path.join(output_dir, f"statement_loan_{data['id']}.pdf")
+    with open(path, 'wb') as f:
+        for chunk in render_payment_schedule(data, schedule, payload['repayments']):
+            f.write(chunk)
+    return path
+
+
+def _payloads(job, chunk_size):
+    # Item ids are read up front so that progress updates never race an open cursor
+    items = list(job.items.filter(status=StatementJob.QUEUED).order_by('id').values_list('id', 'loan_id'))
+    for chunk in bulk.chunks(items, chunk_size):
+        loans = Loan.objects.select_related('user').prefetch_related('repayment_set', 'rate_changes').in_bulk([loan_id for _, loan_id in chunk])
+        for item_id, loan_id in chunk:
+            if loan_id not in loans:
+                # Deleted since the job was queued; the rest of the job still renders
+                _record(job, item_id, error=f"Loan #{loan_id} no longer exists.")
+                continue
+            yield item_id, statement_payload(loans[loan_id])
+
+
+def run_job(job, workers=None, chunk_size=200):
+    """
+    Render every queued item of a running job on a process pool, recording progress per item.
+    A failing item is recorded on the item; anything else that goes wrong fails the job with
+    the error, so it is never left running.
+    """
+    try:
+        _render_items(job, workers or os.cpu_count() or 1, chunk_size)
+    except Exception as exc:
+        logger.exception("Statement job %s failed", job.id)
+        StatementJob.objects.filter(pk=job.pk).update(
+            status=StatementJob.FAILED, finished_at=timezone.now(), error=str(exc)[:2000] or exc.__class__.__name__,
+        )
+        job.refresh_from_db()
+        return job
+
+    job.refresh_from_db()
+    job.status = StatementJob.FAILED if job.failed and not job.completed else StatementJob.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return job
+
+
+def _render_items(job, workers, chunk_size):
+    output_dir = job_directory(job.id)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with concurrency.process_pool(workers, initializer=_init_worker) as pool:
+        pending = {}
+        for item_id, payload in _payloads(job, chunk_size):
+            pending[pool.submit(render_statement, payload, str(output_dir))] = item_id
+            if len(pending) >= workers * 4:
+                _collect(job, pending, wait_for=len(pending) - workers * 2)
+        _collect(job, pending)
+
+
+def _record(job, item_id, path='', error=None):
+    """Mark one item done with its file, or failed with error, and count it on the job."""
+    if error is None:
+        StatementJobItem.objects.filter(pk=item_id).update(status=StatementJob.DONE, file_path=path)
+        StatementJob.objects.filter(pk=job.pk).update(completed=F('completed') + 1, heartbeat_at=timezone.now())
+    else:
+        StatementJobItem.objects.filter(pk=item_id).update(status=StatementJob.FAILED, error=error[:2000])
+        StatementJob.objects.filter(pk=job.pk).update(failed=F('failed') + 1, heartbeat_at=timezone.now())
+
+
+def _collect(job, pending, wait_for=None):
+    """Record results of finished futures; stop after wait_for of them (all when None)."""
+    done = 0
+    for future in as_completed(list(pending)):
+        item_id = pending.pop(future)
+        try:
+            path = future.result()
+        except Exception as exc:
+            logger.exception("Statement for job %s item %s failed", job.id, item_id)
+            _record(job, item_id, error=str(exc))
+        else:
+            _record(job, item_id, path)
+        done += 1
+        if wait_for is not None and done >= wait_for:
+            return
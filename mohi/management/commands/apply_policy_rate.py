@@ -0,0 +1,67 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mohi.models import Loan
+from mohi.rates import apply_policy_rate, change_rate
+
+
+class Command(BaseCommand):
+    help = (
+        "Move active loans to a new monthly rate (percent) from their first installment due on or after "
+        "--date, with set-based updates; --loan changes a single loan instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('rate', help="New monthly rate in percent, e.g. 1.25")
+        parser.add_argument('--date', help="Installments due on or after this date (YYYY-MM-DD) get the new rate; defaults to today.")
+        parser.add_argument('--loan', type=int, help="Change only this loan, from --month or its next unpaid installment.")
+        parser.add_argument('--month', type=int, help="With --loan: first installment charged at the new rate.")
+        parser.add_argument('--reason', default='', help="Recorded on every rate change.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, help="Processes used to reprice the changed schedules; defaults to the CPU count.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing.")
+
+    def handle(self, *args, **options):
+        if options['loan'] is not None:
+            return self._change_one(options)
+        on_date = timezone.now().date()
+        if options['date']:
+            try:
+                on_date = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError("--date must be YYYY-MM-DD")
+
+        started = time.perf_counter()
+        try:
+            result = apply_policy_rate(
+                options['rate'], on_date, reason=options['reason'], batch_size=options['batch_size'],
+                workers=options['workers'], dry_run=options['dry_run'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        prefix = "Dry run: " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{result.changed} loans moved to {options['rate']}% from {on_date}, {result.skipped} skipped "
+            f"in {elapsed:.2f}s. Scheduled interest from the change: {result.interest_before} -> {result.interest_after}"
+        ))
+
+    def _change_one(self, options):
+        try:
+            loan = Loan.objects.get(pk=options['loan'])
+        except Loan.DoesNotExist:
+            raise CommandError(f"No loan #{options['loan']}.")
+        if options['dry_run']:
+            self.stdout.write(f"Dry run: loan #{loan.pk} is at {loan.interest_rate}% from installment {loan.rate_from_month}.")
+            return
+        try:
+            change = change_rate(loan, options['rate'], month=options['month'], reason=options['reason'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Loan #{loan.pk} moved from {change.previous_rate}% to {change.rate}% from installment {change.effective_month}."
+        ))
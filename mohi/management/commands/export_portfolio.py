@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from mohi.exports import EXPORT_FORMATS, portfolio_rows
+from mohi.models import Loan
+
+
+class Command(BaseCommand):
+    help = "Write the whole loan portfolio, optionally with amortization schedules, as CSV or XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--schedules', action='store_true', help="Include each loan's amortization schedule.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--output', '-o', help="File to write; defaults to stdout.")
+
+    def handle(self, *args, **options):
+        stream, _ = EXPORT_FORMATS[options['format']]
+        rows = portfolio_rows(Loan.objects.all(), options['schedules'], chunk_size=options['chunk_size'])
+        if options['output']:
+            output = open(options['output'], 'wb')
+        else:
+            output = sys.stdout.buffer
+        try:
+            for chunk in stream(rows):
+                output.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        finally:
+            if options['output']:
+                output.close()
+        if options['output']:
+            self.stderr.write(self.style.SUCCESS(f"Exported portfolio to {options['output']}"))
@@ -0,0 +1,42 @@
+import io
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mohi.issuance import RowError, issue_loans, read_rows
+
+
+class Command(BaseCommand):
+    help = "Issue loans in bulk from a CSV with email, amount, term_months and optional start_date and interest_rate columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="CSV file to read, or - for stdin.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--start-date', help="Start date (YYYY-MM-DD) for rows without one; defaults to today.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate the file without creating loans.")
+
+    def handle(self, *args, **options):
+        start_date = timezone.now().date()
+        if options['start_date']:
+            try:
+                start_date = date.fromisoformat(options['start_date'])
+            except ValueError:
+                raise CommandError("--start-date must be YYYY-MM-DD")
+
+        if options['csv_file'] == '-':
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            source = open(options['csv_file'], encoding='utf-8-sig', newline='')
+        with source:
+            try:
+                rows = read_rows(source)
+                result = issue_loans(rows, start_date, batch_size=options['batch_size'], dry_run=options['dry_run'])
+            except RowError as exc:
+                raise CommandError(str(exc))
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        verb = "Would issue" if options['dry_run'] else "Issued"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {result.created} loans, rejected {result.rejected} rows"))
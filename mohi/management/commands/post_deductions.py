@@ -0,0 +1,39 @@
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mohi.issuance import RowError
+from mohi.payroll import post_deductions, read_deductions
+
+
+class Command(BaseCommand):
+    help = "Post a payroll deduction CSV (loan_id, date, amount) as repayments; re-running a file is a no-op."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="CSV file to read, or - for stdin.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help="Match and validate the file without writing.")
+
+    def handle(self, *args, **options):
+        if options['csv_file'] == '-':
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            source = open(options['csv_file'], encoding='utf-8-sig', newline='')
+        started = time.perf_counter()
+        with source:
+            try:
+                rows = read_deductions(source)
+                result = post_deductions(rows, batch_size=options['batch_size'], dry_run=options['dry_run'])
+            except RowError as exc:
+                raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        prefix = "Dry run: " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{result.created} created, {result.updated} updated, {result.unchanged} unchanged, "
+            f"{result.rejected} rejected in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mohi.installments import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rewrite the Installment rows of every loan from its terms, rate history and repayments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} installments."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mohi.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the MonthlyRollup rows behind the loan report charts from loans and repayments."
+
+    def handle(self, *args, **options):
+        rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} monthly rollup rows."))
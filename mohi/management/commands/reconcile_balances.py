@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mohi import bulk
+from mohi.models import Loan
+
+
+class Command(BaseCommand):
+    help = "Recompute Loan.balance and is_paid from repayments for loans that drifted, batch by batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted loans without writing.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = fixed = 0
+        last_id = 0
+        while True:
+            # Keyset over the primary key, so memory and each query stay bounded by batch_size
+            ids = list(Loan.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            batch = Loan.objects.filter(id__gte=ids[0], id__lte=ids[-1])
+            last_id = ids[-1]
+            checked += len(ids)
+            drifted = dict(batch.drifted().values_list('id', 'user_id'))
+            fixed += len(drifted)
+            if drifted and not options['dry_run']:
+                with transaction.atomic():
+                    Loan.objects.filter(id__in=drifted).recompute_balances()
+                    bulk.invalidate_on_commit(drifted.values(), drifted)
+
+        action = "Would fix" if options['dry_run'] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} loans. {action} {fixed} drifted balances."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mohi.stats import refresh_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized PortfolioSummary rows read when PORTFOLIO_STATS_SOURCE = 'summary'."
+
+    def handle(self, *args, **options):
+        rows = refresh_summaries()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} portfolio summary rows."))
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from mohi.routers import replica_alias
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh a file-copy SQLite read replica from the primary database with the online backup API. "
+        "Writers are not blocked while the copy is made."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Replica file to write; defaults to the replica alias' NAME.")
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("refresh_replica only copies SQLite databases; use the database's own replication.")
+        output = options['output']
+        if not output:
+            alias = replica_alias()
+            if alias is None:
+                # First copy: settings only configure the replica once its file exists
+                output = Path(settings.BASE_DIR) / 'db.replica.sqlite3'
+            else:
+                if connections[alias].vendor != 'sqlite':
+                    raise CommandError(f"The '{alias}' database is not SQLite.")
+                output = settings.DATABASES[alias]['NAME']
+                connections[alias].close()
+        output = Path(output)
+
+        started = time.perf_counter()
+        primary.ensure_connection()
+        staging = output.with_name(output.name + '.tmp')
+        staging.unlink(missing_ok=True)
+        copy = sqlite3.connect(staging)
+        try:
+            primary.connection.backup(copy)
+            # A single self-contained file, so it can be swapped in with one rename
+            copy.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            copy.close()
+        os.replace(staging, output)
+        self.stdout.write(self.style.SUCCESS(f"Replica {output} refreshed in {time.perf_counter() - started:.2f}s"))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mohi.seeding import seed_portfolio
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic portfolio of users, loans and repayments for load testing and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, required=True)
+        parser.add_argument('--loans', type=int, required=True)
+        parser.add_argument('--history-months', type=int, default=24, help="How far back loan start dates go.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same portfolio.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', help="Password for every seeded user; unusable when omitted.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 0 or options['loans'] < 0:
+            raise CommandError("--users and --loans must not be negative")
+        started = time.perf_counter()
+        try:
+            result = seed_portfolio(
+                options['users'], options['loans'], history_months=options['history_months'],
+                seed=options['seed'], batch_size=options['batch_size'], password=options['password'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.users} users, {result.loans} loans and {result.repayments} repayments "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
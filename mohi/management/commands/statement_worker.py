@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mohi.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Render queued statement jobs on a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+        parser.add_argument('--poll-interval', type=float, default=5.0)
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            self.stdout.write(f"Running statement job #{job.id} ({job.total} loans)")
+            started = time.perf_counter()
+            job = run_job(job, workers=options['workers'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"Job #{job.id} {job.status}: {job.completed} rendered, {job.failed} failed in {elapsed:.1f}s"
+            ))
@@ -0,0 +1,209 @@
+import heapq
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from inspect import isgeneratorfunction
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Per-request totals, set by MetricsMiddleware; async views carry it into sync_to_async threads
+_current = ContextVar('mohi_request_metrics', default=None)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_number(value)}'
+
+
+class Histogram:
+    """Observations per label set, counted into cumulative buckets with their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_number(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}'
+
+
+REQUESTS = Counter('mohi_requests_total', 'Responses returned, by view, method and status.', ('view', 'method', 'status'))
+REQUEST_LATENCY = Histogram(
+    'mohi_request_duration_seconds', 'Time to produce a response (streamed bodies excluded).',
+    LATENCY_BUCKETS, ('view', 'method'),
+)
+REQUEST_QUERIES = Histogram('mohi_request_db_queries', 'ORM queries run per request.', QUERY_BUCKETS, ('view',))
+REQUEST_QUERY_TIME = Histogram('mohi_request_db_seconds', 'Time spent in ORM queries per request.', LATENCY_BUCKETS, ('view',))
+TEMPLATE_RENDER = Histogram('mohi_template_render_seconds', 'Time to render a template.', LATENCY_BUCKETS, ('template',))
+FUNCTION_TIME = Histogram(
+    'mohi_function_duration_seconds', 'Time spent in instrumented functions.', LATENCY_BUCKETS, ('function',),
+)
+REGISTRY = (REQUESTS, REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_QUERY_TIME, TEMPLATE_RENDER, FUNCTION_TIME)
+
+
+def render():
+    """The registry in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """Query and template totals of one request, plus its slowest queries for the slow-request log."""
+
+    def __init__(self, keep_queries=5):
+        self.queries = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.slowest = []
+        self._keep = keep_queries
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, duration):
+        with self._lock:
+            self.queries += 1
+            self.query_time += duration
+            entry = (duration, self.queries, sql)
+            if len(self.slowest) < self._keep:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def top_queries(self):
+        return [(duration, sql) for duration, _, sql in sorted(self.slowest, reverse=True)]
+
+
+def start_request(keep_queries=5):
+    state = RequestMetrics(keep_queries)
+    return state, _current.set(state)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def current():
+    """RequestMetrics of the request being served, or None outside MetricsMiddleware."""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper: time every query into the current request's totals."""
+    state = _current.get()
+    if state is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """connection_created receiver. Wrappers live on the connection wrapper, which outlives reconnects."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def timed(function):
+    """
+    Record the time spent in the decorated function under FUNCTION_TIME. For generator
+    functions the time spent producing every item is added up, so a streamed PDF is measured
+    while it renders rather than when the generator is created.
+    """
+    def decorator(func):
+        if isgeneratorfunction(func):
+            @wraps(func)
+            def _timed_generator(*args, **kwargs):
+                iterator = func(*args, **kwargs)
+                elapsed = 0.0
+                try:
+                    while True:
+                        started = time.perf_counter()
+                        try:
+                            item = next(iterator)
+                        except StopIteration:
+                            return
+                        finally:
+                            elapsed += time.perf_counter() - started
+                        yield item
+                finally:
+                    iterator.close()
+                    FUNCTION_TIME.observe(elapsed, function=function)
+            return _timed_generator
+
+        @wraps(func)
+        def _timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                FUNCTION_TIME.observe(time.perf_counter() - started, function=function)
+        return _timed
+    return decorator
+
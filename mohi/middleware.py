@@ -0,0 +1,110 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics, schedule_cache
+from .routers import replica_alias
+
+performance_logger = logging.getLogger('mohi.performance')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+def _pin(request, response):
+    if request.method not in SAFE_METHODS and response.status_code < 500 and replica_alias():
+        response.set_cookie(
+            getattr(settings, 'REPLICA_PIN_COOKIE', 'mohi_primary'), '1',
+            max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10), httponly=True, samesite='Lax',
+        )
+    return response
+
+
+@sync_and_async_middleware
+def ReplicaPinMiddleware(get_response):
+    """
+    After a write, pin the browser to the primary for REPLICA_STICKY_SECONDS, longer than the
+    replica lags behind, so pages marked @use_replica show the writer its own changes.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return _pin(request, await get_response(request))
+        return middleware
+
+    def middleware(request):
+        return _pin(request, get_response(request))
+    return middleware
+
+
+@sync_and_async_middleware
+def VersionScopeMiddleware(get_response):
+    """
+    Read the shared cache versions once per request (schedule_cache.version_scope), so a warm
+    schedule or page lookup costs no query.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with schedule_cache.version_scope():
+                return await get_response(request)
+        return middleware
+
+    def middleware(request):
+        with schedule_cache.version_scope():
+            return get_response(request)
+    return middleware
+
+
+def _view_name(request):
+    # The URL pattern name keeps label cardinality bounded; unmatched paths share one label
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
+
+
+def _record(request, response, state, started):
+    elapsed = time.perf_counter() - started
+    view = _view_name(request)
+    metrics.REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+    metrics.REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+    metrics.REQUEST_QUERIES.observe(state.queries, view=view)
+    metrics.REQUEST_QUERY_TIME.observe(state.query_time, view=view)
+    if elapsed >= getattr(settings, 'SLOW_REQUEST_SECONDS', 1.0):
+        top = ''.join(f'\n  {duration * 1000:8.1f} ms  {sql[:300]}' for duration, sql in state.top_queries())
+        performance_logger.warning(
+            "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, templates %.0f ms%s",
+            request.method, request.get_full_path(), view, elapsed * 1000,
+            state.queries, state.query_time * 1000, state.template_time * 1000, top,
+        )
+    return response
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    """
+    Time every request and count its ORM queries, query time and template time into the
+    in-process registry served at /metrics. Requests slower than SLOW_REQUEST_SECONDS are
+    logged to mohi.performance with their slowest queries.
+    """
+    keep = getattr(settings, 'SLOW_REQUEST_TOP_QUERIES', 5)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            state, token = metrics.start_request(keep)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                metrics.finish_request(token)
+            return _record(request, response, state, started)
+        return middleware
+
+    def middleware(request):
+        state, token = metrics.start_request(keep)
+        started = time.perf_counter()
+        try:
+            response = get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return _record(request, response, state, started)
+    return middleware
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:32
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    from mohi.rollups import rebuild
+    rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mohi', '0007_statementjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('department', models.CharField(blank=True, default='', max_length=100)),
+                ('loans_issued', models.IntegerField(default=0)),
+                ('disbursed', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('repaid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('interest', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('principal_repaid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Disbursed less principal repaid, cumulative to the end of the month', max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('department', 'month'), name='monthly_rollup_department_month_uniq')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
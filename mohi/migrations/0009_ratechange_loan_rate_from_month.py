@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from decimal import Decimal
+
+import django.db.models.deletion
+import django.utils.timezone
+import mohi.models
+from django.db import migrations, models
+
+
+RESET_REASON = 'Legacy schedules were priced at 1% a month'
+
+
+def reset_rates(apps, schema_editor):
+    # Until now every schedule was priced at 1% a month whatever interest_rate said, so that is
+    # the rate existing loans and their repayments were agreed at. Each loan moved records its
+    # stored rate on a month-1 RateChange, which the reverse restores it from.
+    Loan = apps.get_model('mohi', 'Loan')
+    RateChange = apps.get_model('mohi', 'RateChange')
+    moved = Loan.objects.exclude(interest_rate=Decimal('1.00'))
+    RateChange.objects.bulk_create((
+        RateChange(loan_id=loan_id, effective_month=1, previous_rate=rate, rate=Decimal('1.00'), reason=RESET_REASON)
+        for loan_id, rate in moved.values_list('id', 'interest_rate').iterator()
+    ), batch_size=2000)
+    moved.update(interest_rate=Decimal('1.00'))
+
+
+def restore_rates(apps, schema_editor):
+    Loan = apps.get_model('mohi', 'Loan')
+    RateChange = apps.get_model('mohi', 'RateChange')
+    resets = RateChange.objects.filter(reason=RESET_REASON, effective_month=1)
+    for rate in resets.values_list('previous_rate', flat=True).distinct():
+        Loan.objects.filter(id__in=resets.filter(previous_rate=rate).values('loan_id')).update(interest_rate=rate)
+    resets.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mohi', '0008_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='rate_from_month',
+            field=models.PositiveIntegerField(default=1, help_text='First installment charged at interest_rate; earlier ones follow the RateChange history'),
+        ),
+        migrations.AlterField(
+            model_name='loan',
+            name='interest_rate',
+            field=models.DecimalField(decimal_places=2, default=mohi.models.default_monthly_rate, help_text='Monthly interest rate in percent, charged from installment rate_from_month on', max_digits=5),
+        ),
+        migrations.CreateModel(
+            name='RateChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effective_month', models.PositiveIntegerField()),
+                ('previous_rate', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('reason', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rate_changes', to='mohi.loan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['loan', 'effective_month'], name='ratechange_loan_month_idx')],
+            },
+        ),
+        migrations.RunPython(reset_rates, restore_rates),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:30
+
+from datetime import timedelta
+from decimal import Decimal
+from fractions import Fraction
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The backfill is frozen here rather than imported from mohi.money and mohi.installments, so
+# later changes to the live engine cannot change what this migration writes.
+DUE, PAID = 'due', 'paid'
+
+
+def _div_round(numerator, denominator):
+    # Half-even, as the schedules were rounded when this migration was written
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def _amortize(principal, rate, months):
+    """(payment, interest, principal, balance) rows in cents of a level-payment schedule."""
+    ratio = Fraction(rate) / 100
+    num, den = ratio.numerator, ratio.denominator
+    if num == 0:
+        level = _div_round(principal, months)
+    else:
+        grown = (den + num) ** months
+        level = _div_round(principal * num * grown, den * (grown - den ** months))
+    rows, balance = [], principal
+    for month in range(1, months + 1):
+        interest = _div_round(balance * num, den)
+        retired = level - interest
+        if month == months or retired >= balance:
+            retired = balance
+        balance -= retired
+        rows.append((retired + interest, interest, retired, balance))
+        if balance == 0:
+            break
+    return rows
+
+
+def _schedule(principal, months, segments):
+    """Rows of a loan whose rate changed: the balance at each change is re-amortized at the new rate."""
+    rows = _amortize(principal, segments[0][1], months)
+    for first_month, rate in segments[1:]:
+        paid = first_month - 1
+        if paid >= min(len(rows), months):
+            break
+        balance = rows[paid - 1][3] if paid else principal
+        rows = rows[:paid] + _amortize(balance, rate, months - paid)
+    return rows
+
+
+def _segments(loan, changes):
+    if loan.rate_from_month <= 1 or not changes:
+        return ((1, loan.interest_rate),)
+    changes = sorted(changes)
+    segments = ((1, changes[0][2]),)
+    for effective_month, _change_id, _previous, rate in changes:
+        segments = tuple(segment for segment in segments if segment[0] < effective_month) + ((effective_month, rate),)
+    return segments
+
+
+def build_installments(apps, schema_editor):
+    Loan = apps.get_model('mohi', 'Loan')
+    RateChange = apps.get_model('mohi', 'RateChange')
+    Repayment = apps.get_model('mohi', 'Repayment')
+    Installment = apps.get_model('mohi', 'Installment')
+    last_id = 0
+    while True:
+        loans = list(
+            Loan.objects.filter(id__gt=last_id, amount__gt=0)
+            .only('id', 'amount', 'interest_rate', 'rate_from_month', 'term_months', 'start_date')
+            .order_by('id')[:2000]
+        )
+        if not loans:
+            return
+        last_id = loans[-1].id
+        ids = [loan.id for loan in loans]
+        history, paid = {}, set()
+        for loan_id, *change in RateChange.objects.filter(loan_id__in=ids).values_list(
+            'loan_id', 'effective_month', 'id', 'previous_rate', 'rate',
+        ):
+            history.setdefault(loan_id, []).append(tuple(change))
+        paid.update(Repayment.objects.filter(loan_id__in=ids).values_list('loan_id', 'date'))
+        installments = []
+        for loan in loans:
+            rows = _schedule(int(loan.amount * 100), loan.term_months, _segments(loan, history.get(loan.id)))
+            for seq, (payment, interest, principal, _balance) in enumerate(rows, 1):
+                due_date = loan.start_date + timedelta(days=30 * (seq - 1))
+                installments.append(Installment(
+                    loan_id=loan.id, seq=seq, due_date=due_date, payment=Decimal(payment).scaleb(-2),
+                    interest=Decimal(interest).scaleb(-2), principal=Decimal(principal).scaleb(-2),
+                    status=PAID if (loan.id, due_date) in paid else DUE,
+                ))
+        Installment.objects.bulk_create(installments, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mohi', '0009_ratechange_loan_rate_from_month'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Installment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField()),
+                ('due_date', models.DateField()),
+                ('payment', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('interest', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('principal', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('due', 'Due'), ('paid', 'Paid')], default='due', max_length=10)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='mohi.loan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['due_date', 'status'], name='installment_due_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('loan', 'seq'), name='installment_loan_seq_uniq')],
+            },
+        ),
+        migrations.RunPython(build_installments, migrations.RunPython.noop),
+    ]
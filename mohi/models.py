@@ -1,12 +1,19 @@
+from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Lower
+from django.db.models.lookups import LessThanOrEqual
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
 from datetime import timedelta
 from django.utils import timezone
 import math
 
+from . import amortization, metrics, money, schedule_cache
+from .amortization import AmortizationSchedule
+
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, first_name, last_name, department, designation, password=None, **extra_fields):
@@ -52,6 +59,12 @@ class CustomUser(AbstractUser):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Bulk issuance matches emails case-insensitively on Lower('email')
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -62,84 +75,217 @@ from decimal import Decimal
 from datetime import datetime, timedelta
 from django.utils import timezone
 
+def _repaid_principal():
+    """Principal repaid on the outer loan (OuterRef('pk')), 0.00 when it has no repayments."""
+    return Coalesce(
+        Subquery(
+            Repayment.objects.filter(loan=OuterRef('pk')).values('loan').annotate(total=Sum('principal')).values('total')
+        ),
+        Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+class LoanQuerySet(models.QuerySet):
+    PAID_TERMS = {'paid': True, 'true': True, 'active': False, 'unpaid': False, 'false': False}
+    # Columns rendered by the loan_list and loan_report tables
+    LISTING_FIELDS = (
+        'id', 'amount', 'balance', 'term_months', 'start_date', 'is_paid',
+        'user__email', 'user__first_name', 'user__last_name',
+    )
+
+    def visible_to(self, user):
+        """Every loan for staff, only their own loans for everyone else."""
+        return self if user.is_staff else self.filter(user=user)
+
+    def for_listing(self):
+        """
+        Loans with their borrower joined in the same query and only the columns the listing
+        tables render, so a page costs one query however many rows it shows.
+        """
+        return self.select_related('user').only(*self.LISTING_FIELDS)
+
+    def search(self, query):
+        """
+        Filter by an exact loan id ("42" or "#42"), a status word, or an email prefix.
+        Each form maps onto an index (primary key, is_paid, or a range on the unique email
+        index) instead of the LIKE '%...%' scans icontains would need.
+        """
+        query = query.strip()
+        if not query:
+            return self
+        term = query.lstrip('#')
+        if term.isdigit():
+            return self.filter(pk=int(term))
+        if term.lower() in self.PAID_TERMS:
+            return self.filter(is_paid=self.PAID_TERMS[term.lower()])
+        prefixes = {term, term.lower()}
+        email_prefix = Q()
+        for prefix in prefixes:
+            email_prefix |= Q(user__email__gte=prefix, user__email__lt=prefix + '\U0010ffff')
+        return self.filter(email_prefix)
+
+    def apply_principal(self, principal):
+        """
+        Reduce balance by principal repaid (negative to restore it) and refresh is_paid and
+        end_date, all in a single UPDATE so concurrent repayments cannot overwrite each other.
+        """
+        principal = Decimal(str(principal))
+        settled = Q(balance__lte=principal)
+        return self.update(
+            balance=Greatest(F('balance') - principal, Value(Decimal('0.00'))),
+            is_paid=Case(When(settled, then=Value(True)), default=Value(False)),
+            end_date=Case(When(settled & Q(is_paid=False), then=Value(timezone.now().date())), default=F('end_date')),
+        )
+
+    def recompute_balances(self):
+        """
+        Set balance, is_paid and end_date from each loan's amount less the principal of its
+        repayments, in one UPDATE with a correlated subquery. Idempotent, so it is safe after
+        bulk writes that bypass the Repayment signals.
+        """
+        repaid = _repaid_principal()
+        settled = LessThanOrEqual(F('amount'), repaid)
+        return self.update(
+            balance=Greatest(F('amount') - repaid, Value(Decimal('0.00'))),
+            is_paid=Case(When(settled, then=Value(True)), default=Value(False)),
+            end_date=Case(When(Q(settled, is_paid=False), then=Value(timezone.now().date())), default=F('end_date')),
+        )
+
+    def drifted(self):
+        """Loans whose balance or is_paid disagree with their repayments, i.e. those recompute_balances() would change."""
+        return self.alias(
+            expected=Greatest(F('amount') - _repaid_principal(), Value(Decimal('0.00'))),
+        ).filter(~Q(balance=F('expected')) | Q(is_paid=True, expected__gt=0) | Q(is_paid=False, expected=0))
+
+
+def default_monthly_rate():
+    """Monthly rate of new loans, in percent: settings.DEFAULT_MONTHLY_RATE."""
+    return Decimal(str(getattr(settings, 'DEFAULT_MONTHLY_RATE', 1.0))).quantize(Decimal('0.01'))
+
+
+def _rate_segments(current_rate, changes):
+    # changes: (effective_month, id, previous_rate, rate) rows of one loan's RateChange history
+    if not changes:
+        return ((1, current_rate),)
+    changes = sorted(changes)
+    segments = ((1, changes[0][2]),)
+    for effective_month, _change_id, _previous_rate, rate in changes:
+        segments = money.with_rate(segments, effective_month, rate)
+    return segments
+
+
+def rate_segments_for(loans, rate_changes=None):
+    """
+    {loan id: loan.rate_segments()} for many loans, reading the history of the ones whose rate
+    changed mid-term with a single query instead of one per loan. rate_changes is the manager
+    to read from, RateChange.objects by default (a historical model's inside migrations).
+    """
+    changed = [loan.id for loan in loans if loan.rate_from_month > 1]
+    history = {}
+    if changed:
+        rate_changes = RateChange.objects if rate_changes is None else rate_changes
+        for row in rate_changes.filter(loan_id__in=changed).values_list(
+            'loan_id', 'effective_month', 'id', 'previous_rate', 'rate',
+        ):
+            history.setdefault(row[0], []).append(row[1:])
+    return {
+        loan.id: _rate_segments(loan.interest_rate, history.get(loan.id)) if loan.rate_from_month > 1
+        else ((1, loan.interest_rate),)
+        for loan in loans
+    }
+
+
 class Loan(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    interest_rate = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('5.00'))
+    interest_rate = models.DecimalField(
+        max_digits=5, decimal_places=2, default=default_monthly_rate,
+        help_text="Monthly interest rate in percent, charged from installment rate_from_month on",
+    )
+    rate_from_month = models.PositiveIntegerField(
+        default=1, help_text="First installment charged at interest_rate; earlier ones follow the RateChange history",
+    )
     term_months = models.PositiveIntegerField(default=12)
     start_date = models.DateField(default=timezone.now)
     end_date = models.DateField(null=True, blank=True)
     is_paid = models.BooleanField(default=False)
 
+    objects = LoanQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_paid', 'start_date'], name='loan_user_paid_start_idx'),
+            models.Index(fields=['start_date', 'id'], name='loan_start_date_id_idx'),
+        ]
+
+    @property
+    def monthly_rate(self):
+        return self.interest_rate
+
+    def rate_segments(self):
+        """
+        ((first_month, rate), ...) of the monthly rates the loan is charged, oldest first.
+        Loans whose rate never changed mid-term read no history; otherwise rate_changes is
+        queried, or taken from prefetch_related('rate_changes').
+        """
+        if self.rate_from_month <= 1:
+            return ((1, self.interest_rate),)
+        return _rate_segments(self.interest_rate, [
+            (change.effective_month, change.id, change.previous_rate, change.rate) for change in self.rate_changes.all()
+        ])
+
+    def cents_schedule(self):
+        """The original schedule in integer cents (money.CentsSchedule), with every rate change applied."""
+        return money.amortize_segments(money.to_cents(self.amount), self.term_months, self.rate_segments())
+
+    @metrics.timed('generate_amortization_schedule')
     def generate_amortization_schedule(self, original=False):
         """
         Generate amortization schedule for the loan, matching calculate_loan logic.
+        Schedules are memoized in the schedule cache until the loan or one of its repayments changes.
         Args:
             original (bool): If True, generate based on original terms; if False, adjust for repayments.
         Returns:
-            list: Amortization schedule with month, date, payment, interest, principal, balance.
+            AmortizationSchedule: Columns for month, payment, interest, principal, balance; rows carry the date.
         """
-        principal = self.amount if original else self.balance
-        monthly_rate = Decimal('1.0')  # Fixed 1% monthly interest rate to match calculate_loan
-        months = self.term_months
-        r = monthly_rate / Decimal('100')  # Convert to decimal (1% = 0.01)
-        
-        # Calculate monthly payment
-        if r == 0:
-            monthly_payment = principal / months
-        else:
-            monthly_payment = principal * (r * (1 + r) ** months) / ((1 + r) ** months - 1)
-        
-        balance = principal
-        schedule = []
+        return schedule_cache.get_or_build(self, original, lambda: self._build_amortization_schedule(original))
+
+    def _build_amortization_schedule(self, original):
+        start_date = self.start_date or timezone.now().date()
+        if original:
+            if self.amount <= 0:
+                return AmortizationSchedule([], [], [], [], [], start_date=start_date)
+            return amortization.schedule_from_cents(self.cents_schedule(), start_date=start_date)
+        # The remaining balance is re-amortized over the months not yet paid, at the rates they are charged
+        paid_months = Repayment.objects.filter(loan=self).count()
+        principal_cents = money.to_cents(self.balance)
+        if principal_cents <= 0:
+            return AmortizationSchedule([], [], [], [], [], start_date=start_date)
+        months = max(1, self.term_months - paid_months)
+        rates = money.segments_from(self.rate_segments(), paid_months + 1)
+        schedule = money.amortize_segments(principal_cents, months, rates)
+        return amortization.schedule_from_cents(schedule, start_date=start_date, first_month=paid_months + 1)
+
+    def balance_after(self, k):
+        """Balance after k installments of the original schedule (see amortization._schedule for the cost)."""
+        return amortization.balance_after(self.amount, self.rate_segments(), self.term_months, k)
+
+    def row(self, k):
+        """Row k (1-based) of the original schedule, from the memoized cents schedule."""
         start_date = self.start_date or timezone.now().date()
-        
-        # Adjust for repayments if not original
-        if not original:
-            repayments = Repayment.objects.filter(loan=self).order_by('date')
-            repaid_principal = sum(rep.principal for rep in repayments) or Decimal('0.00')
-            balance = max(Decimal('0.00'), principal - repaid_principal)
-            # Skip months already paid
-            paid_months = repayments.count()
-        else:
-            paid_months = 0
-        
-        # Generate schedule
-        for month in range(1 + paid_months, months + 1):
-            interest = balance * r
-            principal_paid = monthly_payment - interest
-            balance -= principal_paid
-            
-            if balance < 0:
-                principal_paid += balance
-                balance = 0
-            
-            schedule.append({
-                'month': month,
-                'date': start_date + timedelta(days=30 * (month - 1)),
-                'payment': float(round(monthly_payment, 2)),
-                'interest': float(round(interest, 2)),
-                'principal': float(round(principal_paid, 2)),
-                'balance': float(round(balance, 2))
-            })
-            
-            if balance <= 0:
-                break
-        
-        # Handle final payment
-        if balance > 0:
-            final_payment = balance + (balance * r)
-            schedule.append({
-                'month': len(schedule) + 1,
-                'date': start_date + timedelta(days=30 * len(schedule)),
-                'payment': float(round(final_payment, 2)),
-                'interest': float(round(balance * r, 2)),
-                'principal': float(round(balance, 2)),
-                'balance': 0.0
-            })
-        
-        return schedule
+        return amortization.schedule_row(self.amount, self.rate_segments(), self.term_months, k, start_date)
+
+    def interest_between(self, first, last):
+        """Interest charged from month first to month last inclusive, from the memoized cents schedule."""
+        return amortization.interest_between(self.amount, self.rate_segments(), self.term_months, first, last)
+
+    def payoff_amount(self, on_date=None):
+        """Amount that settles the original schedule on on_date (default today)."""
+        start_date = self.start_date or timezone.now().date()
+        on_date = on_date or timezone.now().date()
+        return amortization.payoff_amount(self.amount, self.rate_segments(), self.term_months, start_date, on_date)
 
     def get_status_display(self):
         return "Paid" if self.is_paid else "Active"
@@ -147,6 +293,65 @@ class Loan(models.Model):
     def __str__(self):
         return f"Loan #{self.id} for {self.user.email}"
 
+class RateChange(models.Model):
+    """A change of a loan's monthly rate, charged from installment effective_month on."""
+    loan = models.ForeignKey(Loan, related_name='rate_changes', on_delete=models.CASCADE)
+    effective_month = models.PositiveIntegerField()
+    previous_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    rate = models.DecimalField(max_digits=5, decimal_places=2)
+    reason = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'effective_month'], name='ratechange_loan_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"Loan #{self.loan_id} at {self.rate}% from month {self.effective_month}"
+
+
+class InstallmentQuerySet(models.QuerySet):
+    def due_between(self, first, last):
+        """Unpaid installments falling due from first to last inclusive."""
+        return self.filter(status=Installment.DUE, due_date__range=(first, last))
+
+    def overdue(self, on_date=None):
+        """Unpaid installments that fell due before on_date (default today)."""
+        return self.filter(status=Installment.DUE, due_date__lt=on_date or timezone.now().date())
+
+
+class Installment(models.Model):
+    """
+    One installment of a loan's schedule (original terms with every rate change applied),
+    kept in step with loans and repayments by mohi.installments so that due-date questions are
+    indexed queries. An installment is paid once a repayment is recorded for its due date.
+    """
+    DUE, PAID = 'due', 'paid'
+    STATUS_CHOICES = [(DUE, 'Due'), (PAID, 'Paid')]
+
+    loan = models.ForeignKey(Loan, related_name='installments', on_delete=models.CASCADE)
+    seq = models.PositiveIntegerField()
+    due_date = models.DateField()
+    payment = models.DecimalField(max_digits=10, decimal_places=2)
+    interest = models.DecimalField(max_digits=10, decimal_places=2)
+    principal = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DUE)
+
+    objects = InstallmentQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'seq'], name='installment_loan_seq_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['due_date', 'status'], name='installment_due_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Installment {self.seq} of loan #{self.loan_id} due {self.due_date}"
+
+
 class Repayment(models.Model):
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE)
     date = models.DateField(default=timezone.now)
@@ -154,5 +359,81 @@ class Repayment(models.Model):
     principal = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     interest = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'date'], name='repayment_loan_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Repayment of {self.amount} on {self.date}"
+
+class PortfolioSummary(models.Model):
+    """Materialized PortfolioStats per borrower; the row with no user holds the portfolio totals."""
+    user = models.OneToOneField(CustomUser, null=True, blank=True, on_delete=models.CASCADE)
+    loan_count = models.PositiveIntegerField(default=0)
+    principal = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    repaid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    refreshed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Portfolio summary for {self.user.email if self.user_id else 'all loans'}"
+
+
+class MonthlyRollup(models.Model):
+    """
+    Portfolio totals per calendar month, for the whole portfolio (department '') and per
+    borrower department. Kept current by mohi.rollups on every loan and repayment write.
+    """
+    month = models.DateField(help_text="First day of the month")
+    department = models.CharField(max_length=100, blank=True, default='')
+    loans_issued = models.IntegerField(default=0)
+    disbursed = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    repaid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    interest = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    principal_repaid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    outstanding = models.DecimalField(
+        max_digits=14, decimal_places=2, default=Decimal('0.00'),
+        help_text="Disbursed less principal repaid, cumulative to the end of the month",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['department', 'month'], name='monthly_rollup_department_month_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Rollup for {self.month:%Y-%m} ({self.department or 'all departments'})"
+
+
+class StatementJob(models.Model):
+    """A batch of loan statements rendered in the background by `manage.py statement_worker`."""
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    created_by = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Moved on by the worker with every finished item; a running job that stops moving is requeued
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Statement job #{self.id} ({self.status})"
+
+
+class StatementJobItem(models.Model):
+    job = models.ForeignKey(StatementJob, related_name='items', on_delete=models.CASCADE)
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=StatementJob.STATUS_CHOICES, default=StatementJob.QUEUED)
+    error = models.TextField(blank=True)
+    file_path = models.CharField(max_length=255, blank=True)
+
     def __str__(self):
-        return f"Repayment of {self.amount} on {self.date}"
\ No newline at end of file
+        return f"Statement for loan #{self.loan_id} in job #{self.job_id}"
@@ -0,0 +1,281 @@
+"""
+Integer-cents money engine for reducing balance schedules.
+
+Amounts are carried as integer cents and each installment's interest is rounded to the
+cent with an explicit rule (banker's rounding by default, half-up on request). Principal
+retired is the level payment less that interest, and the last installment pays off whatever
+balance is left, so principal always sums to the loan amount exactly and payments always
+equal principal plus interest to the cent.
+
+The monthly rate is a percentage carried to RATE_PLACES and held as an exact fraction, so
+the only roundings are the per-installment ones and the level payment itself.
+"""
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+
+CENT = Decimal('0.01')
+RATE_PLACES = Decimal('0.0001')  # monthly rates are honoured to 1/10000 of a percent
+DEFAULT_ROUNDING = ROUND_HALF_EVEN
+ROUNDING_MODES = (ROUND_HALF_EVEN, ROUND_HALF_UP)
+# balance * rate numerator must fit in int64 for the vectorized engine
+_INT64_LIMIT = 2 ** 62
+
+
+def to_cents(amount):
+    """Integer cents of a Decimal, float, int or numeric string, rounded half-up to the cent."""
+    amount = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    return int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents):
+    """Decimal amount of integer cents."""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+@lru_cache(maxsize=256)
+def rate_ratio(monthly_rate):
+    """
+    (numerator, denominator) of the monthly rate as a fraction of one, e.g. 1 (percent)
+    gives (1, 100). Rates are rounded to RATE_PLACES first.
+    """
+    rate = Decimal(str(monthly_rate)).quantize(RATE_PLACES, rounding=ROUND_HALF_EVEN)
+    if rate < 0:
+        raise ValueError("Monthly rate must be non-negative.")
+    ratio = Fraction(rate) / 100
+    return ratio.numerator, ratio.denominator
+
+
+def div_round(numerator, denominator, rounding=DEFAULT_ROUNDING):
+    """numerator / denominator rounded to an integer, for non-negative numerator and positive denominator."""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and (rounding == ROUND_HALF_UP or quotient % 2)):
+        quotient += 1
+    return quotient
+
+
+def _div_round_array(numerator, denominator, rounding):
+    quotient, remainder = np.divmod(numerator, denominator)
+    twice = 2 * remainder
+    up = twice > denominator
+    if rounding == ROUND_HALF_UP:
+        up |= twice == denominator
+    else:
+        up |= (twice == denominator) & (quotient % 2 == 1)
+    return quotient + up
+
+
+def _check_rounding(rounding):
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f"Unsupported rounding {rounding!r}; use ROUND_HALF_EVEN or ROUND_HALF_UP.")
+
+
+@lru_cache(maxsize=4096)
+def _payment_factor(num, den, months):
+    # M = P * r * (1+r)^n / ((1+r)^n - 1) with r = num/den, as an exact integer ratio
+    if num == 0:
+        return 1, months
+    grown = (den + num) ** months
+    return num * grown, den * (grown - den ** months)
+
+
+def payment_cents(principal_cents, monthly_rate, months, rounding=DEFAULT_ROUNDING):
+    """Level monthly installment of a loan, in cents."""
+    num, den = rate_ratio(monthly_rate)
+    factor_num, factor_den = _payment_factor(num, den, int(months))
+    return div_round(int(principal_cents) * factor_num, factor_den, rounding)
+
+
+class CentsSchedule:
+    """
+    Installments of one loan in integer cents: parallel tuples of payment, interest,
+    principal and the balance left after each installment.
+    """
+    __slots__ = ('principal_cents', 'level_payment', 'payment', 'interest', 'principal', 'balance')
+
+    def __init__(self, principal_cents, level_payment, payment, interest, principal, balance):
+        self.principal_cents = principal_cents
+        self.level_payment = level_payment
+        self.payment = payment
+        self.interest = interest
+        self.principal = principal
+        self.balance = balance
+
+    def __len__(self):
+        return len(self.payment)
+
+    def balance_after(self, k):
+        """Balance after k installments (0 gives the loan amount)."""
+        return self.principal_cents if k == 0 else self.balance[k - 1]
+
+    def spliced(self, k, tail):
+        """The first k installments of this schedule followed by tail, a schedule of balance_after(k)."""
+        return CentsSchedule(
+            self.principal_cents,
+            tail.level_payment,
+            self.payment[:k] + tail.payment,
+            self.interest[:k] + tail.interest,
+            self.principal[:k] + tail.principal,
+            self.balance[:k] + tail.balance,
+        )
+
+
+def _validate(principal_cents, months):
+    if principal_cents <= 0 or months <= 0:
+        raise ValueError("Principal and months must be positive, and monthly rate must be non-negative.")
+
+
+@lru_cache(maxsize=8192)
+def _amortize(principal_cents, num, den, months, rounding):
+    factor_num, factor_den = _payment_factor(num, den, months)
+    level = div_round(principal_cents * factor_num, factor_den, rounding)
+    payments, interests, principals, balances = [], [], [], []
+    balance = principal_cents
+    for month in range(1, months + 1):
+        interest = div_round(balance * num, den, rounding)
+        retired = level - interest
+        if month == months or retired >= balance:
+            # Final installment: whatever is left, so the schedule closes to the cent
+            retired = balance
+        payments.append(retired + interest)
+        interests.append(interest)
+        principals.append(retired)
+        balance -= retired
+        balances.append(balance)
+        if balance == 0:
+            break
+    return CentsSchedule(principal_cents, level, tuple(payments), tuple(interests), tuple(principals), tuple(balances))
+
+
+def amortize(principal_cents, monthly_rate, months, rounding=DEFAULT_ROUNDING):
+    """
+    Schedule of one loan. Results are memoized by their terms, so every caller pricing the
+    same loan shares one computation.
+    Args:
+        principal_cents (int): Loan amount in cents
+        monthly_rate (Decimal|float|str): Monthly interest rate in percent (e.g., 1 for 1%)
+        months (int): Loan term in months
+        rounding (str): ROUND_HALF_EVEN (banker's) or ROUND_HALF_UP, applied to every installment
+    Returns:
+        CentsSchedule
+    """
+    months = int(months)
+    _validate(principal_cents, months)
+    _check_rounding(rounding)
+    num, den = rate_ratio(monthly_rate)
+    return _amortize(int(principal_cents), num, den, months, rounding)
+
+
+def rate_at(segments, month):
+    """Rate charged in month of ((first_month, rate), ...) segments ordered by first_month."""
+    rate = segments[0][1]
+    for first_month, segment_rate in segments:
+        if first_month > month:
+            break
+        rate = segment_rate
+    return rate
+
+
+def with_rate(segments, first_month, rate):
+    """Segments with rate charged from first_month on, replacing whatever they charged from there."""
+    return tuple(segment for segment in segments if segment[0] < first_month) + ((first_month, rate),)
+
+
+def segments_from(segments, month):
+    """Segments renumbered so that month becomes month 1, dropping the ones that ended before it."""
+    return ((1, rate_at(segments, month)),) + tuple(
+        (first_month - month + 1, rate) for first_month, rate in segments if first_month > month
+    )
+
+
+def amortize_segments(principal_cents, months, segments, rounding=DEFAULT_ROUNDING):
+    """
+    Schedule of a loan whose rate changed during its term. Installments before a change are
+    those of the schedule at the earlier rate, and the balance left at the change is
+    re-amortized at the new rate over the remaining months. Every piece comes from amortize(),
+    so a change reuses the memoized rows before it and computes only the ones after.
+    Args:
+        principal_cents (int): Loan amount in cents
+        months (int): Loan term in months
+        segments (tuple): ((first_month, monthly_rate), ...) ordered by first_month, starting at month 1
+        rounding (str): ROUND_HALF_EVEN or ROUND_HALF_UP
+    Returns:
+        CentsSchedule
+    """
+    months = int(months)
+    schedule = amortize(principal_cents, segments[0][1], months, rounding)
+    for first_month, rate in segments[1:]:
+        paid = first_month - 1
+        if paid >= min(len(schedule), months):
+            break
+        schedule = schedule.spliced(paid, amortize(schedule.balance_after(paid), rate, months - paid, rounding))
+    return schedule
+
+
+def amortize_batch(principals_cents, rates, terms, rounding=DEFAULT_ROUNDING, keep_rows=True):
+    """
+    Schedules of many loans at once: a loop over months, vectorized over loans with int64
+    arithmetic, applying the same per-installment rules as amortize().
+    Args:
+        principals_cents (array-like): Loan amounts in cents
+        rates (array-like): Monthly interest rates in percent
+        terms (array-like): Loan terms in months
+        rounding (str): ROUND_HALF_EVEN or ROUND_HALF_UP
+        keep_rows (bool): Also return the (N, max_term) payment, interest, principal and balance arrays
+    Returns:
+        dict: level_payment, total_interest and total_paid arrays of shape (N,) in cents,
+              plus the row arrays and a 'mask' of valid months when keep_rows is set.
+    """
+    _check_rounding(rounding)
+    principals = np.atleast_1d(np.asarray(principals_cents, dtype=np.int64))
+    terms = np.atleast_1d(np.asarray(terms, dtype=np.int64))
+    rates = np.atleast_1d(np.asarray(rates, dtype=object))
+    principals, rates, terms = np.broadcast_arrays(principals, rates, terms)
+    if (principals <= 0).any() or (terms <= 0).any():
+        raise ValueError("Principal and months must be positive, and monthly rate must be non-negative.")
+
+    ratios = [rate_ratio(rate) for rate in rates.tolist()]
+    num = np.array([ratio[0] for ratio in ratios], dtype=np.int64)
+    den = np.array([ratio[1] for ratio in ratios], dtype=np.int64)
+    if int(principals.max()) * int(num.max()) >= _INT64_LIMIT:
+        raise ValueError("Amount and rate too large for the vectorized engine; use amortize().")
+    level = np.array([
+        div_round(principal * factor[0], factor[1], rounding)
+        for principal, factor in zip(
+            principals.tolist(),
+            (_payment_factor(*terms_) for terms_ in zip(num.tolist(), den.tolist(), terms.tolist())),
+        )
+    ], dtype=np.int64)
+
+    count, max_term = len(principals), int(terms.max())
+    balance = principals.copy()
+    total_interest = np.zeros(count, dtype=np.int64)
+    total_paid = np.zeros(count, dtype=np.int64)
+    if keep_rows:
+        # Filled a month (row) at a time and returned transposed, so every write is contiguous
+        rows = {name: np.zeros((max_term, count), dtype=np.int64) for name in ('payment', 'interest', 'principal', 'balance')}
+        mask = np.zeros((max_term, count), dtype=bool)
+    for month in range(1, max_term + 1):
+        active = (month <= terms) & (balance > 0)
+        interest = np.where(active, _div_round_array(balance * num, den, rounding), 0)
+        retired = level - interest
+        final = (month == terms) | (retired >= balance)
+        retired = np.where(active, np.where(final, balance, retired), 0)
+        payment = retired + interest
+        balance = balance - retired
+        total_interest += interest
+        total_paid += payment
+        if keep_rows:
+            rows['payment'][month - 1] = payment
+            rows['interest'][month - 1] = interest
+            rows['principal'][month - 1] = retired
+            rows['balance'][month - 1] = balance
+            mask[month - 1] = active
+
+    result = {'level_payment': level, 'total_interest': total_interest, 'total_paid': total_paid}
+    if keep_rows:
+        result.update({name: values.T for name, values in rows.items()}, mask=mask.T)
+    return result
@@ -0,0 +1,82 @@
+import base64
+import binascii
+from datetime import date
+
+from django.db.models import Q
+
+
+class CursorPage:
+    """
+    One page of a keyset-paginated listing ordered newest first by (start_date, id).
+
+    Pages are located with a WHERE on the last row seen instead of OFFSET, and no COUNT is
+    run, so every page costs the same index range scan however deep it is.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def encode_cursor(loan, direction):
+    raw = f"{direction}|{loan.start_date.isoformat()}|{loan.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, start_date, id) or None when the cursor is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, start_date, pk = raw.split('|')
+        if direction not in ('next', 'prev'):
+            return None
+        return direction, date.fromisoformat(start_date), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_paginate(queryset, cursor=None, per_page=10):
+    """Return the CursorPage of queryset that follows (or precedes) cursor."""
+    position = decode_cursor(cursor)
+    if position is None:
+        rows = list(queryset.order_by('-start_date', '-id')[:per_page + 1])
+        has_more, has_before = len(rows) > per_page, False
+        rows = rows[:per_page]
+    else:
+        direction, start_date, pk = position
+        if direction == 'next':
+            after = Q(start_date__lt=start_date) | Q(start_date=start_date, id__lt=pk)
+            rows = list(queryset.filter(after).order_by('-start_date', '-id')[:per_page + 1])
+            has_more, has_before = len(rows) > per_page, True
+            rows = rows[:per_page]
+        else:
+            before = Q(start_date__gt=start_date) | Q(start_date=start_date, id__gt=pk)
+            rows = list(queryset.filter(before).order_by('start_date', 'id')[:per_page + 1])
+            has_more, has_before = True, len(rows) > per_page
+            rows = rows[:per_page][::-1]
+
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], 'next') if rows and has_more else None,
+        previous_cursor=encode_cursor(rows[0], 'prev') if rows and has_before else None,
+    )
@@ -0,0 +1,170 @@
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from . import amortization, bulk, installments, rollups
+from .issuance import RowError, read_rows
+from .models import Loan, Repayment, rate_segments_for
+
+COLUMNS = ('loan_id', 'date', 'amount')
+
+
+class PostingResult:
+    """Outcome of a deduction import: repayments created, changed and left as they were, plus rejected rows."""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def rejected(self):
+        return len(self.errors)
+
+
+def read_deductions(lines):
+    """(line_number, row) pairs from a payroll deduction CSV with loan_id, date and amount columns."""
+    return read_rows(lines, columns=COLUMNS)
+
+
+def _clean(row):
+    try:
+        loan_id = int((row.get('loan_id') or '').strip().lstrip('#'))
+    except ValueError:
+        raise RowError("Invalid loan_id.")
+    try:
+        deducted_on = date.fromisoformat((row.get('date') or '').strip())
+    except ValueError:
+        raise RowError("Invalid date, expected YYYY-MM-DD.")
+    try:
+        amount = Decimal((row.get('amount') or '').strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError("Invalid amount.")
+    if amount <= 0:
+        raise RowError("Invalid amount.")
+    return loan_id, deducted_on, amount
+
+
+def match_installment(loan, deducted_on):
+    """
+    Installment number and due date of the 30-day period of loan that contains deducted_on,
+    or None when the date falls outside the loan term.
+    """
+    k = (deducted_on - loan.start_date).days // 30 + 1
+    if not 1 <= k <= loan.term_months:
+        return None
+    return k, loan.start_date + timedelta(days=30 * (k - 1))
+
+
+def _split(loan, segments, k, amount):
+    """(principal, interest) of a deduction: the matched installment's interest is settled first."""
+    interest = min(amount, amortization.installment_interest(loan.amount, segments, loan.term_months, k))
+    return amount - interest, interest
+
+
+def post_deductions(rows, batch_size=2000, dry_run=False):
+    """
+    Post payroll deductions as repayments.
+    Each row is matched to the installment due in its 30-day period with the memoized cents
+    schedule and stored as that installment's repayment (keyed on loan and due date, the same
+    key make_repayment uses), so posting a file twice leaves the data unchanged. Per batch
+    this runs one in_bulk on loans (and one read of rate history if any of them changed rate),
+    one lookup of existing repayments, one bulk_create, one bulk_update, one set-based
+    balance UPDATE and one UPDATE marking the matched installments paid, all inside a single
+    transaction.
+    Args:
+        rows (iterable): (line_number, dict) pairs as produced by read_deductions
+        batch_size (int): Rows handled per round of queries
+        dry_run (bool): Match and validate only; nothing is written
+    Returns:
+        PostingResult
+    """
+    result = PostingResult()
+    seen = set()
+    touched_loans, touched_users = set(), set()
+    delta = rollups.RollupDelta()
+    rows = iter(rows)
+    with transaction.atomic():
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            cleaned = []
+            for line, row in batch:
+                try:
+                    cleaned.append((line,) + _clean(row))
+                except RowError as exc:
+                    result.add_error(line, str(exc))
+
+            loans = Loan.objects.select_related('user').only(
+                'id', 'amount', 'interest_rate', 'rate_from_month', 'term_months', 'start_date', 'user__department',
+            ).in_bulk(
+                {loan_id for _, loan_id, _, _ in cleaned}
+            )
+            segments = rate_segments_for(loans.values())
+            postings = {}
+            for line, loan_id, deducted_on, amount in cleaned:
+                loan = loans.get(loan_id)
+                if loan is None:
+                    result.add_error(line, f"No loan #{loan_id}.")
+                    continue
+                installment = match_installment(loan, deducted_on)
+                if installment is None:
+                    result.add_error(line, f"{deducted_on} is outside the term of loan #{loan_id}.")
+                    continue
+                k, due_date = installment
+                if (loan_id, due_date) in seen:
+                    result.add_error(line, f"Duplicate deduction for installment {k} of loan #{loan_id}.")
+                    continue
+                seen.add((loan_id, due_date))
+                postings[(loan_id, due_date)] = (amount,) + _split(loan, segments[loan_id], k, amount)
+            if not postings:
+                continue
+
+            existing = {
+                (loan_id, due_date): (pk, amount, principal, interest)
+                for pk, loan_id, due_date, amount, principal, interest in Repayment.objects.filter(
+                    loan_id__in={loan_id for loan_id, _ in postings},
+                    date__in={due_date for _, due_date in postings},
+                ).values_list('id', 'loan_id', 'date', 'amount', 'principal', 'interest')
+            }
+            to_create, to_update = [], []
+            for (loan_id, due_date), values in postings.items():
+                current = existing.get((loan_id, due_date))
+                if current is not None and current[1:] == values:
+                    result.unchanged += 1
+                    continue
+                amount, principal, interest = values
+                repayment = Repayment(loan_id=loan_id, date=due_date, amount=amount, principal=principal, interest=interest)
+                department = loans[loan_id].user.department
+                delta.repayment(due_date, department, amount, interest, principal)
+                if current is None:
+                    to_create.append(repayment)
+                else:
+                    repayment.pk = current[0]
+                    to_update.append(repayment)
+                    _, old_amount, old_principal, old_interest = current
+                    delta.repayment(due_date, department, old_amount, old_interest, old_principal, sign=-1)
+            result.created += len(to_create)
+            result.updated += len(to_update)
+            if dry_run or not (to_create or to_update):
+                continue
+
+            Repayment.objects.bulk_create(to_create)
+            Repayment.objects.bulk_update(to_update, ['amount', 'principal', 'interest'])
+            changed = {repayment.loan_id for repayment in to_create + to_update}
+            Loan.objects.filter(id__in=changed).recompute_balances()
+            installments.sync_status(changed, dates={due_date for _, due_date in postings})
+            touched_loans |= changed
+            touched_users |= {loans[loan_id].user_id for loan_id in changed}
+
+        if touched_loans:
+            rollups.apply(delta)
+            bulk.invalidate_on_commit(touched_users, touched_loans)
+    return result
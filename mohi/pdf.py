@@ -0,0 +1,244 @@
+import zlib
+
+from . import metrics
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 50
+FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold', 'F3': 'Courier'}
+
+
+def _escape(text):
+    """Encode text as the body of a PDF literal string (WinAnsi, unsupported characters become '?')."""
+    data = str(text).encode('cp1252', 'replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class PdfStream:
+    """
+    Minimal incremental PDF writer.
+
+    Objects are emitted in file order as soon as they are complete and their byte offsets
+    are remembered for the cross-reference table, so a document can be sent page by page
+    without temp files. Only the standard Type1 fonts are used, so nothing is embedded.
+    """
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self):
+        self._offset = 0
+        self._offsets = {}
+        self._fonts = {}
+        self._page_ids = []
+        self._next_id = 3
+
+    def _reserve(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _object(self, obj_id, body):
+        data = b'%d 0 obj\n%s\nendobj\n' % (obj_id, body)
+        self._offsets[obj_id] = self._offset
+        self._offset += len(data)
+        return data
+
+    def _raw(self, data):
+        self._offset += len(data)
+        return data
+
+    def start(self):
+        out = [self._raw(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')]
+        out.append(self._object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES))
+        for name, base_font in FONTS.items():
+            obj_id = self._reserve()
+            self._fonts[name] = obj_id
+            out.append(self._object(
+                obj_id,
+                b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % base_font.encode(),
+            ))
+        return b''.join(out)
+
+    def page(self, content):
+        """Write one page with the given content stream and return its bytes."""
+        stream_id, page_id = self._reserve(), self._reserve()
+        compressed = zlib.compress(content)
+        fonts = b' '.join(b'/%s %d 0 R' % (name.encode(), obj_id) for name, obj_id in self._fonts.items())
+        self._page_ids.append(page_id)
+        return self._object(
+            stream_id,
+            b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(compressed), compressed),
+        ) + self._object(
+            page_id,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> /Contents %d 0 R >>'
+            % (self.PAGES, PAGE_WIDTH, PAGE_HEIGHT, fonts, stream_id),
+        )
+
+    def finish(self):
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self._page_ids)
+        out = [self._object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self._page_ids)))]
+        xref_offset = self._offset
+        size = self._next_id
+        xref = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        for obj_id in range(1, size):
+            xref.append(b'%010d 00000 n \n' % self._offsets[obj_id])
+        xref.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, self.CATALOG, xref_offset))
+        out.extend(xref)
+        return b''.join(out)
+
+
+class _Layout:
+    """Top-to-bottom text layout that starts a new page when the current one is full."""
+
+    def __init__(self):
+        self.pages = []
+        self._ops = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _break_page(self):
+        self.pages.append(b'\n'.join(self._ops))
+        self._ops = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def fits(self, height):
+        return self.y - height >= MARGIN
+
+    def text(self, value, font='F1', size=10, leading=None, x=MARGIN):
+        leading = leading or size * 1.4
+        if not self.fits(leading):
+            self._break_page()
+        self.y -= leading
+        self._ops.append(b'BT /%s %d Tf %.2f %.2f Td (%s) Tj ET' % (font.encode(), size, x, self.y, _escape(value)))
+
+    def rule(self, gap=4):
+        if not self.fits(gap * 2):
+            self._break_page()
+        self.y -= gap
+        self._ops.append(b'%.2f %.2f m %.2f %.2f l S' % (MARGIN, self.y, PAGE_WIDTH - MARGIN, self.y))
+        self.y -= gap
+
+    def space(self, height):
+        if self.fits(height):
+            self.y -= height
+        else:
+            self._break_page()
+
+    def close(self):
+        if self._ops:
+            self._break_page()
+
+
+def _money(value):
+    return f"{float(value or 0):>14,.2f}"
+
+
+LOAN_FIELDS = ('id', 'amount', 'term_months', 'start_date', 'balance', 'status')
+SCHEDULE_FIELDS = ('month', 'date', 'payment', 'interest', 'principal', 'balance')
+REPAYMENT_FIELDS = ('date', 'amount', 'principal', 'interest')
+_AMOUNTS = {'amount', 'balance', 'payment', 'interest', 'principal'}
+
+
+def _check(item, fields, where, blank_amounts=False):
+    if not isinstance(item, dict):
+        raise ValueError(f"{where} must be an object.")
+    for field in fields:
+        if field not in item:
+            raise ValueError(f"{where} is missing {field!r}.")
+        value = item[field]
+        if value is None and blank_amounts and field in _AMOUNTS:
+            # Table cells print a missing amount as 0.00
+            continue
+        if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            raise ValueError(f"{where}: {field!r} must be a string or a number.")
+        if field in _AMOUNTS:
+            try:
+                float(value)
+            except ValueError:
+                raise ValueError(f"{where}: {field!r} must be a number.")
+
+
+def validate_payload(loan, schedule, repayments):
+    """
+    Check a JSON payload for render_payment_schedule, raising ValueError on the first missing
+    or malformed field, so a bad request is refused before any of the PDF has been sent.
+    """
+    _check(loan, LOAN_FIELDS, "loan")
+    if not isinstance(loan.get('user', {}), dict):
+        raise ValueError("loan: 'user' must be an object.")
+    for name, rows, fields in (('schedule', schedule, SCHEDULE_FIELDS), ('repayments', repayments, REPAYMENT_FIELDS)):
+        if not isinstance(rows, list):
+            raise ValueError(f"{name} must be a list.")
+        for index, row in enumerate(rows):
+            _check(row, fields, f"{name}[{index}]", blank_amounts=True)
+
+
+SCHEDULE_HEADER = f"{'Month':>5}  {'Date':<10}  {'Payment':>14}  {'Interest':>14}  {'Principal':>14}  {'Balance':>14}"
+REPAYMENT_HEADER = f"{'Date':<10}  {'Amount':>14}  {'Principal':>14}  {'Interest':>14}"
+
+
+def _table(layout, title, header, lines):
+    layout.space(8)
+    layout.text(title, font='F2', size=12)
+    layout.text(header, font='F3', size=8, leading=12)
+    layout.rule(2)
+    for line in lines:
+        if not layout.fits(11):
+            layout.close()
+            layout.text(f"{title} (continued)", font='F2', size=12)
+            layout.text(header, font='F3', size=8, leading=12)
+            layout.rule(2)
+        layout.text(line, font='F3', size=8, leading=11)
+        yield
+
+
+@metrics.timed('generate_pdf')
+def render_payment_schedule(loan, schedule, repayments):
+    """
+    Yield the bytes of a payment schedule PDF, one finished page at a time.
+    Args:
+        loan (dict): id, user (email, name, department, designation), amount, term_months,
+                     start_date, balance, status
+        schedule (iterable): Rows with month, date, payment, interest, principal, balance
+        repayments (iterable): Rows with date, amount, principal, interest
+    """
+    pdf = PdfStream()
+    layout = _Layout()
+    yield pdf.start()
+
+    user = loan.get('user', {})
+    layout.text(f"Payment Schedule - Loan #{loan['id']}", font='F2', size=16, leading=24)
+    layout.text("User Information", font='F2', size=12)
+    for label, key in (('Email', 'email'), ('Name', 'name'), ('Department', 'department'), ('Designation', 'designation')):
+        layout.text(f"{label}: {user.get(key, '')}")
+    layout.space(6)
+    layout.text("Loan Summary", font='F2', size=12)
+    layout.text(f"Amount: KSH {float(loan['amount']):,.2f}")
+    layout.text(f"Term: {loan['term_months']} months")
+    layout.text(f"Start Date: {loan['start_date']}")
+    layout.text(f"Balance: KSH {float(loan['balance']):,.2f}")
+    layout.text(f"Status: {loan['status']}")
+
+    def _row(item, key):
+        return item[key] if isinstance(item, dict) else getattr(item, key)
+
+    schedule_lines = (
+        f"{_row(item, 'month'):>5}  {str(_row(item, 'date')):<10}  {_money(_row(item, 'payment'))}  "
+        f"{_money(_row(item, 'interest'))}  {_money(_row(item, 'principal'))}  {_money(_row(item, 'balance'))}"
+        for item in schedule
+    )
+    repayment_lines = (
+        f"{str(_row(item, 'date')):<10}  {_money(_row(item, 'amount'))}  "
+        f"{_money(_row(item, 'principal'))}  {_money(_row(item, 'interest'))}"
+        for item in repayments
+    )
+    for lines, title, header in (
+        (schedule_lines, "Payment Schedule", SCHEDULE_HEADER),
+        (repayment_lines, "Repayments", REPAYMENT_HEADER),
+    ):
+        for _ in _table(layout, title, header, lines):
+            # Hand over pages as soon as they fill up
+            while layout.pages:
+                yield pdf.page(layout.pages.pop(0))
+
+    layout.close()
+    for content in layout.pages:
+        yield pdf.page(content)
+    yield pdf.finish()
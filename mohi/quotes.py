@@ -0,0 +1,155 @@
+import hashlib
+import math
+import threading
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .amortization import calculate_loan, summarize_loans_batch
+from .rates import clean_rate
+
+SESSION_KEY = 'calculator_quotes'
+MAX_SESSION_QUOTES = 20
+MAX_AMOUNT = 99999999.99  # Loan.amount is max_digits=10, decimal_places=2
+MAX_TERM = 600
+
+
+def clean_terms(principal, monthly_rate, months):
+    """
+    (principal, monthly_rate, months) as float, float and int within what can be quoted, or
+    ValueError. Infinite and NaN amounts are refused before they reach Decimal, and the term is
+    capped so one request cannot tie up a worker building a huge schedule.
+    """
+    principal = float(principal)
+    if not math.isfinite(principal) or not 0 < principal <= MAX_AMOUNT:
+        raise ValueError(f"Amount must be greater than 0 and at most {MAX_AMOUNT:,.2f}.")
+    try:
+        months = int(months)
+    except OverflowError:
+        raise ValueError("Invalid term.")
+    if not 1 <= months <= MAX_TERM:
+        raise ValueError(f"Term must be between 1 and {MAX_TERM} months.")
+    return principal, float(clean_rate(monthly_rate)), months
+
+
+def quote_key(principal, monthly_rate, months):
+    """Content address of a quote: the same terms always hash to the same key."""
+    canonical = f"{Decimal(str(principal)).quantize(Decimal('0.01'))}|{Decimal(str(monthly_rate)).normalize()}|{int(months)}"
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def _cache_key(key):
+    return f'mohi:quote:{key}'
+
+
+def get_quote(principal, monthly_rate, months):
+    """
+    Return (key, loan_details) for the terms, computing calculate_loan only when no
+    quote with the same terms is cached yet.
+    """
+    key = quote_key(principal, monthly_rate, months)
+    details = cache.get(_cache_key(key))
+    if details is None:
+        details = calculate_loan(principal, monthly_rate, months)
+        cache.set(_cache_key(key), details, getattr(settings, 'QUOTE_CACHE_TIMEOUT', 60 * 60 * 24))
+    return key, details
+
+
+def remember_quote(session, key, principal, monthly_rate, months, quote_date):
+    """Keep the terms of a quote in the user's session so it can be rebuilt after cache eviction."""
+    quotes = session.get(SESSION_KEY, {})
+    quotes.pop(key, None)
+    quotes[key] = [float(principal), float(monthly_rate), int(months), quote_date.isoformat()]
+    while len(quotes) > MAX_SESSION_QUOTES:
+        quotes.pop(next(iter(quotes)))
+    session[SESSION_KEY] = quotes
+
+
+def recall_quote(session, key):
+    """Return (terms, loan_details) for a quote key from this session, or None if unknown."""
+    terms = session.get(SESSION_KEY, {}).get(key)
+    if terms is None:
+        return None
+    principal, monthly_rate, months, quote_date = terms
+    _, details = get_quote(principal, monthly_rate, months)
+    return terms, details
+
+
+_grid = None
+_grid_lock = threading.Lock()
+
+
+def _quote_grid():
+    """
+    Summaries for the common (amount, term) grid from settings.QUOTE_GRID_AMOUNTS and
+    QUOTE_GRID_TERMS at DEFAULT_MONTHLY_RATE, priced in one vectorized pass on first use.
+    """
+    global _grid
+    if _grid is None:
+        with _grid_lock:
+            if _grid is None:
+                amounts = list(getattr(settings, 'QUOTE_GRID_AMOUNTS', range(5000, 1000001, 5000)))
+                terms = list(getattr(settings, 'QUOTE_GRID_TERMS', range(1, 61)))
+                rate = float(getattr(settings, 'DEFAULT_MONTHLY_RATE', 1.0))
+                pairs = [(amount, term) for amount in amounts for term in terms]
+                summary = summarize_loans_batch([a for a, _ in pairs], rate, [t for _, t in pairs])
+                columns = zip(
+                    summary['monthly_payment'].tolist(), summary['total_interest'].tolist(), summary['total_paid'].tolist()
+                )
+                _grid = {
+                    (float(amount), rate, term): values for (amount, term), values in zip(pairs, columns)
+                }
+    return _grid
+
+
+def _price(terms):
+    """(monthly_payment, total_interest, total_paid) for each of terms, in one vectorized pass."""
+    principals, rates, months = zip(*terms)
+    summary = summarize_loans_batch(principals, rates, months)
+    return list(zip(
+        summary['monthly_payment'].tolist(), summary['total_interest'].tolist(), summary['total_paid'].tolist(),
+    ))
+
+
+@lru_cache(maxsize=4096)
+def _summary(principal, monthly_rate, months):
+    return _price([(principal, monthly_rate, months)])[0]
+
+
+def _normalize(principal, monthly_rate, months):
+    return round(float(principal), 2), float(monthly_rate), int(months)
+
+
+def quote_summary(principal, monthly_rate, months):
+    """Monthly payment, total interest and total paid, from the precomputed grid when possible."""
+    terms = _normalize(principal, monthly_rate, months)
+    return _summary_dict(terms, _quote_grid().get(terms) or _summary(*terms))
+
+
+def quote_summaries(terms):
+    """
+    quote_summary() for each (principal, monthly_rate, months) in terms. Grid hits are looked
+    up and every other distinct set of terms is priced together in one summarize_loans_batch
+    call, instead of one NumPy pass per quote.
+    """
+    terms = [_normalize(*item) for item in terms]
+    grid = _quote_grid()
+    values = {item: grid[item] for item in terms if item in grid}
+    misses = list(dict.fromkeys(item for item in terms if item not in values))
+    if misses:
+        values.update(zip(misses, _price(misses)))
+    return [_summary_dict(item, values[item]) for item in terms]
+
+
+def _summary_dict(terms, values):
+    principal, monthly_rate, months = terms
+    return {
+        'amount': principal,
+        'term': months,
+        'monthly_rate': monthly_rate,
+        'monthly_payment': values[0],
+        'total_interest': values[1],
+        'total_paid': values[2],
+    }
@@ -0,0 +1,207 @@
+import os
+from contextlib import nullcontext
+from datetime import timedelta
+from functools import partial
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Max
+
+from . import bulk, concurrency, installments, money
+from .models import Loan, RateChange, rate_segments_for
+
+MAX_RATE = Decimal('999.99')  # Loan.interest_rate is max_digits=5, decimal_places=2
+
+
+class PolicyResult:
+    """Outcome of a policy rate change: loans moved to the new rate, loans left alone, and the repricing."""
+
+    def __init__(self):
+        self.changed = 0
+        self.skipped = 0
+        self.interest_before = Decimal('0.00')
+        self.interest_after = Decimal('0.00')
+
+
+def clean_rate(rate):
+    """rate as a Decimal monthly percentage to the cent, or ValueError."""
+    try:
+        cleaned = Decimal(str(rate)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        cleaned = None
+    if cleaned is None or not cleaned.is_finite():
+        raise ValueError(f"Invalid rate {rate!r}.")
+    rate = cleaned
+    if not Decimal('0.00') <= rate <= MAX_RATE:
+        raise ValueError(f"Rate must be between 0 and {MAX_RATE} percent a month.")
+    return rate
+
+
+def effective_month(start_date, on_date):
+    """Installment number of the first installment of a loan started on start_date that falls due on or after on_date."""
+    days = (on_date - start_date).days
+    return 1 if days <= 0 else (days + 29) // 30 + 1
+
+
+def change_rate(loan, rate, month=None, reason=''):
+    """
+    Charge loan at rate from installment month on, by default its next unpaid installment.
+    The installments before month keep their rows; only the schedule from month onward is
+    recomputed, from the balance left there (money.amortize_segments).
+    Args:
+        loan (Loan): The loan to reprice
+        rate (Decimal): New monthly rate in percent
+        month (int): First installment charged at rate, from loan.rate_from_month to loan.term_months
+        reason (str): Recorded on the RateChange
+    Returns:
+        RateChange
+    """
+    rate = clean_rate(rate)
+    if loan.is_paid:
+        raise ValueError(f"Loan #{loan.pk} is paid off.")
+    if month is None:
+        month = loan.repayment_set.count() + 1
+    if not loan.rate_from_month <= month <= loan.term_months:
+        raise ValueError(
+            f"Month {month} is outside installments {loan.rate_from_month}-{loan.term_months} of loan #{loan.pk}."
+        )
+    with transaction.atomic():
+        change = RateChange.objects.create(
+            loan=loan, effective_month=month, previous_rate=loan.interest_rate, rate=rate, reason=reason,
+        )
+        loan.interest_rate = rate
+        loan.rate_from_month = month
+        # post_save moves the loan's schedule version, so cached schedules at the old rate are dropped
+        loan.save(update_fields=['interest_rate', 'rate_from_month'])
+    return change
+
+
+def _window(on_date, month):
+    """start_date range of the loans whose effective_month() for on_date is month."""
+    if month == 1:
+        return {'start_date__gte': on_date}
+    return {
+        'start_date__gte': on_date - timedelta(days=30 * (month - 1)),
+        'start_date__lt': on_date - timedelta(days=30 * (month - 2)),
+    }
+
+
+def _reprice(items, keep_rows=False):
+    """
+    Worker process entry point: scheduled interest from each loan's change point before and
+    after its rate change, in cents, and with keep_rows the repriced installments from the
+    change point on. The old schedule is priced first, so the new one reuses its memoized rows
+    up to the change and only computes the rest.
+    """
+    before = after = 0
+    rows = []
+    for loan_id, start_date, principal_cents, months, segments, month, rate in items:
+        old = money.amortize_segments(principal_cents, months, segments)
+        new = money.amortize_segments(principal_cents, months, money.with_rate(segments, month, rate))
+        before += sum(old.interest[month - 1:])
+        after += sum(new.interest[month - 1:])
+        if keep_rows:
+            rows.extend(installments.installment_rows(loan_id, start_date, new, first_month=month))
+    return before, after, rows
+
+
+def reprice(items, workers=None, chunk_size=2000, write=None):
+    """
+    Total scheduled interest before and after a set of rate changes, priced in parallel.
+    With write, the rate changes and the repriced installments are written in one transaction:
+    write() runs first, then each chunk's installments from its change point on are written as
+    its worker returns them (installments.replace), so a failure part-way leaves no loan at
+    its new rate with installments at the old one.
+    Args:
+        items (list): (loan_id, start_date, principal_cents, term_months, rate_segments, effective_month, rate) per loan
+        workers (int): Worker processes; 1 prices in this process
+        chunk_size (int): Loans per task sent to a worker
+        write (callable): Writes the rate changes themselves; None only prices them
+    Returns:
+        tuple: (before, after) in cents
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = list(bulk.chunks(items, chunk_size))
+    task = partial(_reprice, keep_rows=write is not None)
+    # Inside a transaction the schedules are priced in this process
+    if workers == 1 or not concurrency.can_fork():
+        return _collect(chunks, map(task, chunks), write)
+    with concurrency.process_pool(workers) as pool:
+        # map() submits every task, forking the workers, before the transaction opens a connection
+        return _collect(chunks, pool.map(task, chunks), write)
+
+
+def _collect(chunks, results, write):
+    """Sum the workers' totals; with write, write the rate changes and each chunk's installments in one transaction."""
+    before = after = 0
+    with transaction.atomic() if write else nullcontext():
+        if write:
+            write()
+        for chunk, (chunk_before, chunk_after, rows) in zip(chunks, results):
+            before += chunk_before
+            after += chunk_after
+            if write:
+                installments.replace([item[0] for item in chunk], rows, from_rate_change=True)
+    return before, after
+
+
+def apply_policy_rate(rate, on_date, loans=None, reason='', batch_size=2000, workers=None, dry_run=False):
+    """
+    Move every active loan to rate from its first installment due on or after on_date.
+    Loans already at rate, past their last installment, or with a change scheduled after
+    on_date are skipped. The loans are read in keyset batches, one read of the loans and one
+    of their earlier changes per batch, and the new schedules are priced on a process pool to
+    report how much scheduled interest moved. Then, in one transaction, the RateChange history
+    is written with one bulk_create per batch, the loans are updated with one UPDATE per
+    effective month (a start_date window), and each chunk's repriced installments are written
+    as it comes back, so the number of statements does not grow with the size of the book and
+    a failure leaves nothing half-applied. Cached schedules are dropped on commit.
+    Args:
+        rate (Decimal): New monthly rate in percent
+        on_date (date): The change applies to installments due on or after this date
+        loans (QuerySet): Loans to consider, all loans by default
+        reason (str): Recorded on every RateChange
+        batch_size (int): Loans read and RateChange rows written per query
+        workers (int): Processes used to reprice the changed schedules
+        dry_run (bool): Report what would change; nothing is written
+    Returns:
+        PolicyResult
+    """
+    rate = clean_rate(rate)
+    result = PolicyResult()
+    loans = (Loan.objects.all() if loans is None else loans).filter(is_paid=False).exclude(interest_rate=rate)
+    changes, items = [], []
+    last_id = 0
+    while True:
+        batch = list(loans.filter(id__gt=last_id).only(*installments.LOAN_FIELDS).order_by('id')[:batch_size])
+        if not batch:
+            break
+        segments = rate_segments_for(batch)
+        last_id = batch[-1].id
+        for loan in batch:
+            month = effective_month(loan.start_date, on_date)
+            if not loan.rate_from_month <= month <= loan.term_months:
+                result.skipped += 1
+                continue
+            changes.append(RateChange(
+                loan_id=loan.id, effective_month=month, previous_rate=loan.interest_rate, rate=rate, reason=reason,
+            ))
+            items.append((
+                loan.id, loan.start_date, money.to_cents(loan.amount), loan.term_months, segments[loan.id], month, rate,
+            ))
+    result.changed = len(changes)
+    if not items:
+        return result
+
+    def write():
+        RateChange.objects.bulk_create(changes, batch_size=batch_size)
+        longest = loans.aggregate(longest=Max('term_months'))['longest'] or 0
+        for month in range(1, longest + 1):
+            loans.filter(
+                term_months__gte=month, rate_from_month__lte=month, **_window(on_date, month),
+            ).update(interest_rate=rate, rate_from_month=month)
+        bulk.invalidate_all_on_commit()
+
+    before, after = reprice(items, workers=workers, chunk_size=batch_size, write=None if dry_run else write)
+    result.interest_before, result.interest_after = money.from_cents(before), money.from_cents(after)
+    return result
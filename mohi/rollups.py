@@ -0,0 +1,135 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+ZERO = Decimal('0.00')
+ALL_DEPARTMENTS = ''
+FIELDS = ('loans_issued', 'disbursed', 'repaid', 'interest', 'principal_repaid')
+
+
+def month_of(day):
+    if isinstance(day, datetime):
+        day = timezone.localdate(day) if timezone.is_aware(day) else day.date()
+    return day.replace(day=1)
+
+
+class RollupDelta:
+    """
+    Changes to MonthlyRollup collected by (month, department) and written by apply().
+    Every change is also counted under ALL_DEPARTMENTS, the portfolio-wide row.
+    """
+
+    def __init__(self):
+        self._changes = defaultdict(lambda: [0, ZERO, ZERO, ZERO, ZERO])
+
+    def _add(self, day, department, values, sign):
+        month = month_of(day)
+        for key in {(month, department or ALL_DEPARTMENTS), (month, ALL_DEPARTMENTS)}:
+            change = self._changes[key]
+            for index, value in enumerate(values):
+                change[index] += sign * value
+
+    def loan(self, start_date, department, amount, sign=1):
+        self._add(start_date, department, (1, Decimal(str(amount)), ZERO, ZERO, ZERO), sign)
+
+    def repayment(self, day, department, amount, interest, principal, sign=1):
+        values = (0, ZERO, Decimal(str(amount)), Decimal(str(interest)), Decimal(str(principal)))
+        self._add(day, department, values, sign)
+
+    def items(self):
+        for key, values in sorted(self._changes.items()):
+            if any(values):
+                yield key, dict(zip(FIELDS, values))
+
+    def __bool__(self):
+        return any(any(values) for values in self._changes.values())
+
+
+def _month_row(MonthlyRollup, month, department, changes):
+    """Add changes to an existing month row, creating it from the previous month's outstanding if needed."""
+    increments = {name: F(name) + value for name, value in changes.items() if value}
+    if MonthlyRollup.objects.filter(month=month, department=department).update(**increments):
+        return
+    outstanding = (
+        MonthlyRollup.objects.filter(department=department, month__lt=month)
+        .order_by('-month').values_list('outstanding', flat=True).first()
+    ) or ZERO
+    try:
+        with transaction.atomic():
+            MonthlyRollup.objects.create(month=month, department=department, outstanding=outstanding, **changes)
+    except IntegrityError:
+        # Created concurrently since the UPDATE above
+        MonthlyRollup.objects.filter(month=month, department=department).update(**increments)
+
+
+def apply(delta):
+    """
+    Write the collected changes. Each (month, department) costs one UPDATE (or an INSERT for a
+    month's first activity) plus, when principal moved, one UPDATE carrying the change in
+    outstanding forward to every later month. Reversals also delete rows left empty.
+    """
+    if not delta:
+        return
+    from .models import MonthlyRollup
+
+    with transaction.atomic():
+        for (month, department), changes in delta.items():
+            _month_row(MonthlyRollup, month, department, changes)
+            moved = changes['disbursed'] - changes['principal_repaid']
+            if moved:
+                MonthlyRollup.objects.filter(department=department, month__gte=month).update(
+                    outstanding=F('outstanding') + moved
+                )
+            if any(value < 0 for value in changes.values()):
+                # A month whose only activity moved away or was deleted is dropped, as rebuild() would
+                MonthlyRollup.objects.filter(month=month, department=department, **dict.fromkeys(FIELDS, 0)).delete()
+
+
+def rebuild(apps=global_apps):
+    """
+    Recompute every MonthlyRollup row from two grouped queries, one over loans by start month
+    and one over repayments by payment month. Returns the number of rows written.
+    """
+    Loan = apps.get_model('mohi', 'Loan')
+    Repayment = apps.get_model('mohi', 'Repayment')
+    MonthlyRollup = apps.get_model('mohi', 'MonthlyRollup')
+
+    totals = defaultdict(lambda: dict.fromkeys(FIELDS, ZERO))
+    issued = (
+        Loan.objects.order_by().annotate(month=TruncMonth('start_date'))
+        .values('month', 'user__department').annotate(count=Count('id'), amount=Sum('amount'))
+    )
+    for row in issued:
+        for department in {row['user__department'] or ALL_DEPARTMENTS, ALL_DEPARTMENTS}:
+            month = totals[(row['month'], department)]
+            month['loans_issued'] += row['count']
+            month['disbursed'] += row['amount'] or ZERO
+    repaid = (
+        Repayment.objects.order_by().annotate(month=TruncMonth('date'))
+        .values('month', 'loan__user__department')
+        .annotate(amount=Sum('amount'), interest=Sum('interest'), principal=Sum('principal'))
+    )
+    for row in repaid:
+        for department in {row['loan__user__department'] or ALL_DEPARTMENTS, ALL_DEPARTMENTS}:
+            month = totals[(row['month'], department)]
+            month['repaid'] += row['amount'] or ZERO
+            month['interest'] += row['interest'] or ZERO
+            month['principal_repaid'] += row['principal'] or ZERO
+
+    rows = []
+    outstanding = defaultdict(lambda: ZERO)
+    for (month, department), values in sorted(totals.items()):
+        outstanding[department] += values['disbursed'] - values['principal_repaid']
+        values['loans_issued'] = int(values['loans_issued'])
+        rows.append(MonthlyRollup(month=month, department=department, outstanding=outstanding[department], **values))
+
+    with transaction.atomic():
+        MonthlyRollup.objects.all().delete()
+        MonthlyRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set while a view marked with @use_replica runs; async views carry it into sync_to_async threads
+_replica_reads = ContextVar('mohi_replica_reads', default=False)
+
+
+def replica_alias():
+    """Alias of the read replica, or None when no replica is configured."""
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    return alias if alias and alias in settings.DATABASES else None
+
+
+@contextmanager
+def read_from_replica():
+    """Route ORM reads made inside the block to the replica (writes always go to default)."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send reads to the replica only inside read_from_replica(), so a view has to opt in and
+    everything else, including the reads that precede a write, stays on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        # Cache version tokens (DatabaseCache) are read where they are written
+        if _replica_reads.get() and model._meta.app_label != 'django_cache':
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary and receives its schema with the data
+        return db != replica_alias()
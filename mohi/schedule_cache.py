@@ -0,0 +1,198 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Hit/miss counters for this process, read with schedule_cache_stats()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'SCHEDULE_CACHE_ALIAS', 'default')]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _versions():
+    # Shared by every process, so a write made anywhere retires the schedules cached everywhere
+    return caches[getattr(settings, 'VERSION_CACHE_ALIAS', 'default')]
+
+
+EPOCH_KEY = 'mohi:schedule-epoch'
+# Moved on every version write, so a process can tell with one read whether its copy is current
+GENERATION_KEY = 'mohi:version-generation'
+MAX_LOCAL_VERSIONS = 20000
+
+# This process's copy of the shared versions, valid while GENERATION_KEY still holds _generation
+_local = {}
+_generation = None
+_local_lock = threading.Lock()
+# Set for the length of a request by VersionScopeMiddleware: the generation is checked once per scope
+_scope = ContextVar('mohi_version_scope', default=None)
+
+
+@contextmanager
+def version_scope():
+    """
+    Check the shared generation at most once inside the block. A request then reads the
+    versions it needs from this process's copy, with one query (or cache round trip) at
+    the start, instead of one per lookup.
+    """
+    token = _scope.set({'checked': False})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def _sync():
+    global _generation
+    scope = _scope.get()
+    if scope is not None and scope['checked']:
+        return
+    generation = _versions().get(GENERATION_KEY)
+    with _local_lock:
+        if generation != _generation or len(_local) > MAX_LOCAL_VERSIONS:
+            _local.clear()
+            _generation = generation
+    if scope is not None:
+        scope['checked'] = True
+
+
+def _version_key(loan_id):
+    return f'mohi:schedule-version:{loan_id}'
+
+
+def current_versions(keys):
+    """
+    Values of the version keys. They come from this process's copy while no process has
+    written a version since it was taken (see version_scope), otherwise from the shared
+    cache with one round trip. A missing (evicted) version is replaced by a fresh token,
+    so entries cached under an older one are never served again.
+    """
+    _sync()
+    with _local_lock:
+        versions = {key: _local[key] for key in keys if key in _local}
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        cache = _versions()
+        shared = cache.get_many(missing)
+        absent = [key for key in missing if key not in shared]
+        if absent:
+            token = time.time_ns()
+            for key in absent:
+                cache.add(key, token, timeout=None)
+            fresh = cache.get_many(absent)
+            shared.update({key: fresh.get(key, token) for key in absent})
+        with _local_lock:
+            _local.update(shared)
+        versions.update(shared)
+    return versions
+
+
+def set_versions(keys):
+    """
+    Move the given version keys to a new token, in the shared cache and in this process's
+    copy, and move the generation so every other process drops its copy.
+    """
+    version = time.time_ns()
+    versions = dict.fromkeys(keys, version)
+    _versions().set_many({**versions, GENERATION_KEY: version}, timeout=None)
+    with _local_lock:
+        _local.update(versions)
+
+
+def loan_version(loan_id):
+    """
+    Current repayment version of a loan: the book-wide epoch and the loan's own token. The
+    loan's token is bumped on every Loan or Repayment write, the epoch by invalidate_all().
+    """
+    versions = current_versions([EPOCH_KEY, _version_key(loan_id)])
+    return f'{versions[EPOCH_KEY]}.{versions[_version_key(loan_id)]}'
+
+
+def invalidate(loan_id):
+    """Drop every cached schedule of a loan by moving it to a new version."""
+    if loan_id is None:
+        return
+    set_versions([_version_key(loan_id)])
+    _count('invalidations')
+
+
+def invalidate_many(loan_ids):
+    """invalidate() for many loans with a single cache round trip, for bulk writes that send no signals."""
+    keys = [_version_key(loan_id) for loan_id in set(loan_ids) if loan_id is not None]
+    if keys:
+        set_versions(keys)
+        with _stats_lock:
+            _stats['invalidations'] += len(keys)
+
+
+def invalidate_all():
+    """
+    Drop every cached schedule by moving the book-wide epoch, for book-wide writes where moving
+    each loan's version would cost a cache write per loan.
+    """
+    set_versions([EPOCH_KEY])
+    _count('invalidations')
+
+
+def schedule_key(loan, original):
+    return 'mohi:schedule:{}:{}:{}:{}:{}:{}:{}:{}:{}'.format(
+        loan.pk,
+        'original' if original else 'adjusted',
+        loan.amount,
+        loan.balance,
+        loan.monthly_rate,
+        loan.rate_from_month,
+        loan.term_months,
+        _date_key(loan.start_date),
+        loan_version(loan.pk),
+    )
+
+
+def _date_key(value):
+    # A fresh instance may still hold the datetime it was given; keys must not contain spaces
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.isoformat() if value else ''
+
+
+
+def get_or_build(loan, original, build):
+    """Return the cached schedule for loan, calling build() and caching the result on a miss."""
+    if loan.pk is None:
+        return build()
+    cache = _cache()
+    key = schedule_key(loan, original)
+    schedule = cache.get(key)
+    if schedule is not None:
+        _count('hits')
+        return schedule
+    _count('misses')
+    schedule = build()
+    cache.set(key, schedule)
+    return schedule
+
+
+def schedule_cache_stats():
+    """Hit, miss and invalidation counts for this process, plus the hit ratio."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def reset_schedule_cache_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,117 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import bulk, installments, money, rollups
+from .models import CustomUser, Loan, Repayment
+
+DEPARTMENTS = ('Finance', 'Operations', 'Human Resources', 'Procurement', 'Programs', 'ICT', 'Logistics', 'Health')
+DESIGNATIONS = ('Officer', 'Assistant', 'Coordinator', 'Manager', 'Driver', 'Accountant', 'Nurse', 'Teacher')
+FIRST_NAMES = ('Achieng', 'Wanjiru', 'Kamau', 'Otieno', 'Mwangi', 'Njeri', 'Kiprono', 'Atieno', 'Mutua', 'Wafula')
+LAST_NAMES = ('Odhiambo', 'Kariuki', 'Chebet', 'Njoroge', 'Omondi', 'Wambui', 'Kiptoo', 'Muthoni', 'Owino', 'Barasa')
+TERMS = (3, 6, 6, 12, 12, 12, 18, 24, 24, 36, 48, 60)
+
+
+class SeedResult:
+    """Rows written by seed_portfolio."""
+
+    def __init__(self):
+        self.users = 0
+        self.loans = 0
+        self.repayments = 0
+
+
+def _amount(rnd):
+    # Mostly small salary advances with a long tail of larger loans, in whole hundreds
+    return Decimal(min(1_000_000, max(5_000, round(rnd.lognormvariate(10.8, 0.8), -2))))
+
+
+def _users(rnd, count, offset, password):
+    return [
+        CustomUser(
+            email=f'seed{offset + index}@example.com',
+            first_name=rnd.choice(FIRST_NAMES),
+            last_name=rnd.choice(LAST_NAMES),
+            department=rnd.choice(DEPARTMENTS),
+            designation=rnd.choice(DESIGNATIONS),
+            password=password,
+        )
+        for index in range(count)
+    ]
+
+
+def _repayments(rnd, loans, today):
+    """Installments already due on each loan, paid on schedule except for loans that fell into arrears."""
+    rows = []
+    for loan in loans:
+        due = min(loan.term_months, (today - loan.start_date).days // 30 + 1)
+        if rnd.random() < 0.15:
+            due = rnd.randrange(due + 1)
+        # Priced at the loan's own rates, so seeded repayments match its schedule and installments
+        schedule = loan.cents_schedule()
+        for k in range(min(due, len(schedule))):
+            rows.append(Repayment(
+                loan_id=loan.id, date=loan.start_date + timedelta(days=30 * k),
+                amount=money.from_cents(schedule.payment[k]),
+                interest=money.from_cents(schedule.interest[k]),
+                principal=money.from_cents(schedule.principal[k]),
+            ))
+    return rows
+
+
+def seed_portfolio(users, loans, history_months=24, seed=0, batch_size=5000, password=None):
+    """
+    Create a synthetic portfolio: users spread over departments, loans with a skewed amount
+    distribution and start dates over the last history_months months, and the repayments
+    already due on them (about 15% of loans stop paying part way). Everything is written with
+    bulk_create in batches, then balances, installments and the monthly rollups are recomputed set-wise.
+    Args:
+        users (int): Borrowers to create
+        loans (int): Loans to create, assigned to the new borrowers at random
+        history_months (int): How far back start dates go
+        seed (int): Random seed, so a given size always produces the same portfolio
+        batch_size (int): Rows per bulk_create
+        password (str): Password for every seeded user; unusable when omitted
+    Returns:
+        SeedResult
+    """
+    if users <= 0 and loans > 0:
+        raise ValueError("Loans need at least one user.")
+    rnd = random.Random(seed)
+    result = SeedResult()
+    today = timezone.now().date()
+    # Hashing once and sharing the hash keeps seeding from being bound by the password hasher
+    hashed = make_password(password)
+    offset = CustomUser.objects.filter(email__startswith='seed').count()
+
+    with transaction.atomic():
+        user_ids = []
+        for start in range(0, users, batch_size):
+            created = CustomUser.objects.bulk_create(_users(rnd, min(batch_size, users - start), offset + start, hashed))
+            user_ids.extend(user.pk for user in created)
+        result.users = len(user_ids)
+
+        span = max(1, history_months * 30)
+        for start in range(0, loans, batch_size):
+            batch = []
+            for _ in range(min(batch_size, loans - start)):
+                amount = _amount(rnd)
+                batch.append(Loan(
+                    user_id=rnd.choice(user_ids), amount=amount, balance=amount,
+                    term_months=rnd.choice(TERMS), start_date=today - timedelta(days=rnd.randrange(span)),
+                ))
+            batch = Loan.objects.bulk_create(batch)
+            repayments = _repayments(rnd, batch, today)
+            Repayment.objects.bulk_create(repayments, batch_size=batch_size)
+            Loan.objects.filter(id__in=[loan.id for loan in batch]).recompute_balances()
+            installments.materialize(batch)
+            result.loans += len(batch)
+            result.repayments += len(repayments)
+
+        rollups.rebuild()
+        bulk.invalidate_on_commit(user_ids)
+    return result
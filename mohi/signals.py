@@ -0,0 +1,160 @@
+from decimal import Decimal
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import installments, rollups, schedule_cache, stats, view_cache
+from .models import CustomUser, Loan, Repayment
+
+
+def _user_department(user_id):
+    return CustomUser.objects.filter(pk=user_id).values_list('department', flat=True).first() or ''
+
+
+def _loan_department(loan_id):
+    return CustomUser.objects.filter(loan__id=loan_id).values_list('department', flat=True).first() or ''
+
+
+@receiver([post_save, post_delete], sender=Loan)
+def invalidate_loan_schedule(sender, instance, **kwargs):
+    schedule_cache.invalidate(instance.pk)
+    stats.invalidate(instance.user_id)
+    view_cache.invalidate(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Repayment)
+def invalidate_repayment_schedule(sender, instance, **kwargs):
+    schedule_cache.invalidate(instance.loan_id)
+    stats.invalidate(instance.loan.user_id)
+    view_cache.invalidate(instance.loan.user_id)
+
+
+@receiver(pre_save, sender=Repayment)
+def remember_previous_repayment(sender, instance, **kwargs):
+    # Updates only move the balance and the rollups by the change from the stored row
+    instance._previous = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._previous = (
+            Repayment.objects.filter(pk=instance.pk)
+            .values('date', 'amount', 'interest', 'principal', 'loan__user__department')
+            .first()
+        )
+    instance._previous_principal = instance._previous['principal'] if instance._previous else Decimal('0.00')
+
+
+@receiver(post_save, sender=Repayment)
+def apply_repayment_to_balance(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    delta = Decimal(str(instance.principal)) - getattr(instance, '_previous_principal', Decimal('0.00'))
+    if delta:
+        Loan.objects.filter(pk=instance.loan_id).apply_principal(delta)
+
+
+@receiver(post_save, sender=Repayment)
+def mark_installment_paid(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    dates = {instance.date, previous['date']} if previous else {instance.date}
+    installments.sync_status([instance.loan_id], dates=dates)
+
+
+@receiver(post_delete, sender=Repayment)
+def mark_installment_due(sender, instance, **kwargs):
+    installments.sync_status([instance.loan_id], dates={instance.date})
+
+
+@receiver(post_delete, sender=Repayment)
+def restore_repayment_to_balance(sender, instance, **kwargs):
+    if instance.principal:
+        Loan.objects.filter(pk=instance.loan_id).apply_principal(-Decimal(str(instance.principal)))
+
+
+@receiver(post_save, sender=Repayment)
+def roll_up_repayment(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    delta = rollups.RollupDelta()
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        delta.repayment(
+            previous['date'], previous['loan__user__department'],
+            previous['amount'], previous['interest'], previous['principal'], sign=-1,
+        )
+    delta.repayment(
+        instance.date, _loan_department(instance.loan_id), instance.amount, instance.interest, instance.principal,
+    )
+    rollups.apply(delta)
+
+
+@receiver(post_delete, sender=Repayment)
+def roll_back_repayment(sender, instance, **kwargs):
+    delta = rollups.RollupDelta()
+    delta.repayment(
+        instance.date, _loan_department(instance.loan_id),
+        instance.amount, instance.interest, instance.principal, sign=-1,
+    )
+    rollups.apply(delta)
+
+
+@receiver(pre_save, sender=Loan)
+def remember_previous_loan(sender, instance, **kwargs):
+    instance._previous = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._previous = (
+            Loan.objects.filter(pk=instance.pk)
+            .values('start_date', 'amount', 'user__department', 'interest_rate', 'rate_from_month', 'term_months')
+            .first()
+        )
+
+
+def _schedule_changes(previous, loan):
+    """Names of the loan fields its installments are priced from that differ from previous."""
+    current = {
+        'amount': Decimal(str(loan.amount)),
+        'interest_rate': Decimal(str(loan.interest_rate)),
+        'rate_from_month': loan.rate_from_month,
+        'term_months': loan.term_months,
+        'start_date': loan.start_date,
+    }
+    return {name for name, value in current.items() if previous[name] != value}
+
+
+@receiver(post_save, sender=Loan)
+def materialize_installments(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if created or previous is None:
+        installments.materialize([instance], created=created)
+        return
+    changed = _schedule_changes(previous, instance)
+    if changed:
+        # A rate change alone leaves the installments before rate_from_month as they were
+        installments.materialize([instance], from_rate_change=changed <= {'interest_rate', 'rate_from_month'})
+
+
+@receiver(post_save, sender=Loan)
+def roll_up_loan(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = {'start_date': instance.start_date, 'amount': Decimal(str(instance.amount)), 'user__department': instance.user.department}
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        previous = {name: previous[name] for name in current}
+    if previous == current:
+        # Balance and status changes do not touch the rollups
+        return
+    delta = rollups.RollupDelta()
+    if previous:
+        delta.loan(previous['start_date'], previous['user__department'], previous['amount'], sign=-1)
+    delta.loan(current['start_date'], current['user__department'], current['amount'])
+    rollups.apply(delta)
+
+
+@receiver(post_delete, sender=Loan)
+def roll_back_loan(sender, instance, **kwargs):
+    delta = rollups.RollupDelta()
+    delta.loan(instance.start_date, _user_department(instance.user_id), instance.amount, sign=-1)
+    rollups.apply(delta)
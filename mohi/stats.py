@@ -0,0 +1,162 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Loan, PortfolioSummary, Repayment
+
+ZERO = Decimal('0.00')
+
+
+def _repaid_subquery():
+    repaid = (
+        Repayment.objects.filter(loan=OuterRef('pk'))
+        .values('loan')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return Coalesce(Subquery(repaid), Value(ZERO), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+class PortfolioStats:
+    """
+    Loan count, principal, repaid and outstanding totals for a set of loans.
+
+    Totals come from a single query: repayments are summed per loan in a correlated
+    subquery, so joining them never double-counts a loan's amount. for_user() caches the
+    result briefly per scope and can read the materialized PortfolioSummary table instead.
+    """
+
+    def __init__(self, loan_count=0, principal=ZERO, repaid=ZERO, outstanding=ZERO):
+        self.loan_count = loan_count
+        self.principal = principal
+        self.repaid = repaid
+        self.outstanding = outstanding
+
+    @staticmethod
+    def _totals_query(loans):
+        return loans.order_by().annotate(repaid_total=_repaid_subquery()), {
+            'loan_count': Count('id'),
+            'principal': Sum('amount'),
+            'repaid': Sum('repaid_total'),
+            'outstanding': Sum('balance'),
+        }
+
+    @classmethod
+    def _from_totals(cls, totals):
+        return cls(
+            loan_count=totals['loan_count'],
+            principal=totals['principal'] or ZERO,
+            repaid=totals['repaid'] or ZERO,
+            outstanding=totals['outstanding'] or ZERO,
+        )
+
+    @classmethod
+    def from_queryset(cls, loans):
+        queryset, aggregates = cls._totals_query(loans)
+        return cls._from_totals(queryset.aggregate(**aggregates))
+
+    @classmethod
+    async def afrom_queryset(cls, loans):
+        queryset, aggregates = cls._totals_query(loans)
+        return cls._from_totals(await queryset.aaggregate(**aggregates))
+
+    @staticmethod
+    def _scope(user):
+        user_id = None if user.is_staff else user.pk
+        loans = Loan.objects.all() if user_id is None else Loan.objects.filter(user_id=user_id)
+        return user_id, loans
+
+    @classmethod
+    def for_user(cls, user):
+        """Portfolio-wide stats for staff, the user's own loans otherwise."""
+        user_id, loans = cls._scope(user)
+        key = cache_key(user_id)
+        stats = cache.get(key)
+        if stats is None:
+            if stats_source() == 'summary':
+                stats = cls._from_summary(PortfolioSummary.objects.filter(user_id=user_id).first())
+            if stats is None:
+                stats = cls.from_queryset(loans)
+            cache.set(key, stats, getattr(settings, 'PORTFOLIO_STATS_TIMEOUT', 30))
+        return stats
+
+    @classmethod
+    async def afor_user(cls, user):
+        """Async for_user(), for views running on the event loop."""
+        user_id, loans = cls._scope(user)
+        key = cache_key(user_id)
+        stats = await cache.aget(key)
+        if stats is None:
+            if stats_source() == 'summary':
+                stats = cls._from_summary(await PortfolioSummary.objects.filter(user_id=user_id).afirst())
+            if stats is None:
+                stats = await cls.afrom_queryset(loans)
+            await cache.aset(key, stats, getattr(settings, 'PORTFOLIO_STATS_TIMEOUT', 30))
+        return stats
+
+    @classmethod
+    def _from_summary(cls, summary):
+        if summary is None:
+            return None
+        return cls(summary.loan_count, summary.principal, summary.repaid, summary.outstanding)
+
+    def scaled(self, exchange_rate):
+        return PortfolioStats(
+            self.loan_count,
+            self.principal * exchange_rate,
+            self.repaid * exchange_rate,
+            self.outstanding * exchange_rate,
+        )
+
+
+def stats_source():
+    return getattr(settings, 'PORTFOLIO_STATS_SOURCE', 'live')
+
+
+def cache_key(user_id):
+    return f"mohi:portfolio-stats:{'all' if user_id is None else user_id}"
+
+
+def invalidate(user_id):
+    """Drop the cached stats of a borrower and of the whole portfolio."""
+    cache.delete_many([cache_key(None), cache_key(user_id)])
+
+
+def refresh_summaries():
+    """
+    Rebuild PortfolioSummary from one grouped query over loans: a row per borrower plus
+    the portfolio-wide row (user=None). Returns the number of rows written.
+    """
+    now = timezone.now()
+    rows = []
+    overall = PortfolioStats()
+    per_user = (
+        Loan.objects.order_by()
+        .annotate(repaid_total=_repaid_subquery())
+        .values('user_id')
+        .annotate(loan_count=Count('id'), principal=Sum('amount'), repaid=Sum('repaid_total'), outstanding=Sum('balance'))
+    )
+    for totals in per_user:
+        stats = PortfolioStats(
+            totals['loan_count'],
+            totals['principal'] or ZERO,
+            totals['repaid'] or ZERO,
+            totals['outstanding'] or ZERO,
+        )
+        overall.loan_count += stats.loan_count
+        overall.principal += stats.principal
+        overall.repaid += stats.repaid
+        overall.outstanding += stats.outstanding
+        rows.append(PortfolioSummary(user_id=totals['user_id'], refreshed_at=now, **vars(stats)))
+    rows.append(PortfolioSummary(user_id=None, refreshed_at=now, **vars(overall)))
+
+    with transaction.atomic():
+        PortfolioSummary.objects.all().delete()
+        PortfolioSummary.objects.bulk_create(rows, batch_size=1000)
+    cache.delete_many([cache_key(row.user_id) for row in rows])
+    return len(rows)
@@ -0,0 +1,29 @@
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.TEMPLATE_RENDER.observe(elapsed, template=self.origin.template_name or '<string>')
+            state = metrics.current()
+            if state is not None:
+                state.template_time += elapsed
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend with every top-level render timed under metrics.TEMPLATE_RENDER."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
@@ -1,3 +1,1066 @@
-from django.test import TestCase
+import asyncio
+import csv
+import random
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import amortization, concurrency, installments, jobs, metrics, money, quotes, rollups, schedule_cache
+from .amortization import calculate_loan, calculate_loans_batch
+from .decorators import use_replica
+from .exports import HEADER
+from .issuance import RowError, issue_loans, read_rows
+from .jobs import claim_next_job, enqueue_statements, recover_stale_jobs, run_job
+from .middleware import ReplicaPinMiddleware
+from .models import CustomUser, Installment, Loan, MonthlyRollup, RateChange, Repayment, StatementJob
+from .payroll import post_deductions
+from .rates import apply_policy_rate, change_rate, effective_month
+from .routers import ReplicaRouter, read_from_replica
+from .seeding import seed_portfolio
+from .stats import PortfolioStats, refresh_summaries
+
+
+class QueryCountTests(TestCase):
+    """
+    Each page must cost a fixed number of queries whether the portfolio holds a handful of
+    loans or hundreds: a count that grows with the data means an N+1 lookup crept back in.
+    Caches are cleared before every request, so the counts are those of a cold render; the
+    counts include the one check of the shared version generation per request.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            'staff@example.com', 'Staff', 'Member', 'Finance', 'Officer', password='pw', is_staff=True,
+        )
+        cls.borrower = CustomUser.objects.create_user(
+            'borrower@example.com', 'Jane', 'Doe', 'Operations', 'Clerk', password='pw',
+        )
+
+    def _add_loans(self, count):
+        """Add count loans spread over fresh borrowers, so every row has a different user."""
+        borrowers = CustomUser.objects.bulk_create([
+            CustomUser(
+                email=f'user{index}-{Loan.objects.count()}@example.com', first_name='User', last_name=str(index),
+                department='Operations', designation='Clerk',
+            )
+            for index in range(count)
+        ])
+        Loan.objects.bulk_create([
+            Loan(
+                user=user if index % 2 else self.borrower, amount=Decimal('12000.00'),
+                balance=Decimal('12000.00'), term_months=12, start_date=date(2025, 1, 1) + timedelta(days=index),
+            )
+            for index, user in enumerate(borrowers)
+        ])
+
+    def _get(self, url):
+        # Version tokens are shared state rather than cached data, so they survive the clear
+        for alias in settings.CACHES:
+            if alias != settings.VERSION_CACHE_ALIAS:
+                caches[alias].clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertConstantQueries(self, url, num, user=None):
+        self.client.force_login(user or self.staff)
+        self._get(url)  # issues the version tokens, a one-off cost
+        for count in (3, 60):
+            self._add_loans(count)
+            with self.assertNumQueries(num):
+                self._get(url)
+
+    def test_loan_list(self):
+        self.assertConstantQueries(reverse('loan_list'), 6)
+
+    def test_loan_list_borrower(self):
+        self.assertConstantQueries(reverse('loan_list'), 6, user=self.borrower)
+
+    def test_loan_list_cursor(self):
+        self.assertConstantQueries(reverse('loan_list') + '?mode=cursor', 5)
+
+    def test_loan_list_search(self):
+        self.assertConstantQueries(reverse('loan_list') + '?search=user', 6)
+
+    def test_loan_report(self):
+        self.assertConstantQueries(reverse('loan_report'), 6)
+
+    def test_loan_report_borrower(self):
+        self.assertConstantQueries(reverse('loan_report'), 5, user=self.borrower)
+
+    def test_home(self):
+        self.assertConstantQueries(reverse('home'), 4)
+
+    def test_loan_detail(self):
+        self.client.force_login(self.staff)
+        loan = Loan.objects.create(
+            user=self.borrower, amount=Decimal('12000.00'), balance=Decimal('12000.00'),
+            term_months=12, start_date=date(2025, 1, 1),
+        )
+        url = reverse('loan_detail', args=[loan.id])
+        self._get(url)
+        for months in (1, 10):
+            for month in range(months):
+                Repayment.objects.update_or_create(
+                    loan=loan, date=loan.start_date + timedelta(days=30 * month),
+                    defaults={'amount': Decimal('1066.19'), 'principal': Decimal('946.19'), 'interest': Decimal('120.00')},
+                )
+            # Two of them are version reads: the generation check, then the versions the repayments moved
+            with self.assertNumQueries(6):
+                self._get(url)
+
+    def test_loan_report_pages(self):
+        self.client.force_login(self.staff)
+        self._add_loans(120)
+        first = self._get(reverse('loan_report'))
+        self.assertEqual(len(first.context['loans']), 50)
+        self.assertTrue(first.context['loans'].has_next)
+        second = self._get(reverse('loan_report') + '?cursor=' + first.context['loans'].next_cursor)
+        self.assertFalse({loan.id for loan in first.context['loans']} & {loan.id for loan in second.context['loans']})
+
+
+class MoneyTests(SimpleTestCase):
+    """Schedules from the cents engine reconcile to the cent, whichever path produced them."""
+
+    LOANS = ((Decimal('5000.00'), 6), (Decimal('123456.78'), 36), (Decimal('999999.99'), 240), (Decimal('7777.77'), 1))
+
+    def test_schedules_reconcile(self):
+        for rounding in (ROUND_HALF_EVEN, ROUND_HALF_UP):
+            for principal, months in self.LOANS:
+                schedule = money.amortize(money.to_cents(principal), '1.0', months, rounding)
+                self.assertEqual(sum(schedule.principal), money.to_cents(principal))
+                self.assertEqual(schedule.balance[-1], 0)
+                for payment, interest, retired in zip(schedule.payment, schedule.interest, schedule.principal):
+                    self.assertEqual(payment, interest + retired)
+
+    def test_batch_matches_single(self):
+        principals = [money.to_cents(principal) for principal, _ in self.LOANS]
+        terms = [months for _, months in self.LOANS]
+        batch = money.amortize_batch(principals, ['1.0'] * len(terms), terms)
+        for index, (principal, months) in enumerate(zip(principals, terms)):
+            schedule = money.amortize(principal, '1.0', months)
+            length = int(batch['mask'][index].sum())
+            self.assertEqual(batch['payment'][index, :length].tolist(), list(schedule.payment))
+            self.assertEqual(batch['balance'][index, :length].tolist(), list(schedule.balance))
+
+    def test_rounding_modes(self):
+        # 250 cents at 1% is 2.5 cents of interest: banker's rounding keeps 2, half-up gives 3
+        self.assertEqual(money.amortize(250, '1.0', 2, ROUND_HALF_EVEN).interest[0], 2)
+        self.assertEqual(money.amortize(250, '1.0', 2, ROUND_HALF_UP).interest[0], 3)
+
+    def test_calculator_matches_model(self):
+        loan = Loan(amount=Decimal('123456.78'), balance=Decimal('123456.78'), term_months=36, start_date=date(2025, 1, 1))
+        model = loan._build_amortization_schedule(original=True)
+        calculator = calculate_loan(123456.78, 1.0, 36)
+        batch = calculate_loans_batch([123456.78], [1.0], [36])
+        self.assertEqual(calculator['schedule'].payment.tolist(), model.payment.tolist())
+        self.assertEqual(batch['payment'][0].tolist(), model.payment.tolist())
+        self.assertEqual(round(calculator['total_paid'] * 100), round(float(model.payment.sum()) * 100))
+
+
+class ScheduleQueryTests(SimpleTestCase):
+    """
+    balance_after, schedule_row, installment_interest and interest_between agree to the cent
+    with the schedule the batch engine iterates out, rounding and the final installment included.
+    """
+
+    def test_random_loans_match_the_schedule(self):
+        rnd = random.Random(3)
+        loans = [
+            (Decimal(rnd.randrange(100, 100_000_000)) / 100, rnd.choice(('0', '0.5', '1', '1.25', '3.7', '25', '99.99')),
+             rnd.randrange(1, 361))
+            for _ in range(300)
+        ]
+        batch = money.amortize_batch(
+            [money.to_cents(amount) for amount, _, _ in loans], [rate for _, rate, _ in loans], [term for _, _, term in loans],
+        )
+        for index, (amount, rate, term) in enumerate(loans):
+            rows = int(batch['mask'][index].sum())
+            self.assertLessEqual(rows, term)
+            interest = [int(cents) for cents in batch['interest'][index, :rows]]
+            for k in sorted({1, rows, term, rnd.randrange(1, term + 1)}):
+                row = amortization.schedule_row(amount, rate, term, k)
+                expected = [int(batch[name][index, k - 1]) if k <= rows else 0 for name in ('payment', 'interest', 'principal', 'balance')]
+                self.assertEqual([money.to_cents(value) for value in (row.payment, row.interest, row.principal, row.balance)], expected)
+                self.assertEqual(money.to_cents(amortization.installment_interest(amount, rate, term, k)), expected[1])
+                self.assertEqual(money.to_cents(amortization.balance_after(amount, rate, term, k)), expected[3])
+            first, last = sorted((rnd.randrange(1, term + 1), rnd.randrange(1, term + 1)))
+            self.assertEqual(
+                money.to_cents(amortization.interest_between(amount, rate, term, first, last)), sum(interest[first - 1:last]),
+            )
+            self.assertEqual(money.to_cents(amortization.interest_between(amount, rate, term, 1, term)), sum(interest))
+
+    def test_months_outside_the_term(self):
+        with self.assertRaises(IndexError):
+            amortization.schedule_row(Decimal('1000.00'), 1, 12, 13)
+        with self.assertRaises(IndexError):
+            amortization.interest_between(Decimal('1000.00'), 1, 12, 0, 12)
+
+
+class RateChangeTests(TestCase):
+    """A rate change keeps the installments before it and re-amortizes the balance left there."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower = CustomUser.objects.create_user(
+            'rates@example.com', 'Rate', 'Payer', 'Finance', 'Officer', password='pw',
+        )
+
+    def _loan(self, start_date, term_months=24, amount=Decimal('120000.00')):
+        return Loan.objects.create(
+            user=self.borrower, amount=amount, balance=amount, term_months=term_months, start_date=start_date,
+        )
+
+    def test_change_rate_splices_schedule(self):
+        loan = self._loan(date(2025, 1, 1))
+        before = loan.cents_schedule()
+        change_rate(loan, '1.5', month=7)
+        loan = Loan.objects.get(pk=loan.pk)
+        after = loan.cents_schedule()
+        self.assertEqual(loan.rate_segments(), ((1, Decimal('1.00')), (7, Decimal('1.50'))))
+        self.assertEqual(after.payment[:6], before.payment[:6])
+        self.assertEqual(after.interest[6], money.div_round(before.balance_after(6) * 3, 200))
+        self.assertEqual(sum(after.principal), money.to_cents(loan.amount))
+        self.assertEqual(after.balance[-1], 0)
+        schedule = loan.generate_amortization_schedule(original=True)
+        self.assertEqual(schedule.payment.tolist(), [cents / 100 for cents in after.payment])
+
+    def test_change_rate_rejects_earlier_month(self):
+        loan = self._loan(date(2025, 1, 1))
+        change_rate(loan, '1.5', month=7)
+        with self.assertRaises(ValueError):
+            change_rate(loan, '2.0', month=5)
+
+    def test_policy_rate(self):
+        on_date = date(2025, 6, 1)
+        fresh = self._loan(date(2025, 6, 10))
+        running = self._loan(date(2025, 1, 1))
+        finished = self._loan(date(2023, 1, 1), term_months=6)
+        scheduled = self._loan(date(2025, 1, 1))
+        change_rate(scheduled, '2.0', month=12)
+
+        result = apply_policy_rate('1.25', on_date, workers=1)
+
+        self.assertEqual((result.changed, result.skipped), (2, 2))
+        fresh.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((fresh.interest_rate, fresh.rate_from_month), (Decimal('1.25'), 1))
+        month = effective_month(running.start_date, on_date)
+        self.assertEqual((running.interest_rate, running.rate_from_month), (Decimal('1.25'), month))
+        self.assertEqual(running.rate_segments(), ((1, Decimal('1.00')), (month, Decimal('1.25'))))
+        self.assertEqual(RateChange.objects.filter(loan__in=[fresh, running]).count(), 2)
+        self.assertEqual(Loan.objects.get(pk=finished.pk).interest_rate, Decimal('1.00'))
+        self.assertGreater(result.interest_after, result.interest_before)
+
+
+class InstallmentTests(TestCase):
+    """The installment table follows loan issuance, repayments and rate changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrower = CustomUser.objects.create_user(
+            'installments@example.com', 'Due', 'Date', 'Finance', 'Officer', password='pw',
+        )
+
+    def _loan(self, start_date=date(2025, 1, 1), term_months=12):
+        return Loan.objects.create(
+            user=self.borrower, amount=Decimal('60000.00'), balance=Decimal('60000.00'),
+            term_months=term_months, start_date=start_date,
+        )
+
+    def _stored(self, loan):
+        return [
+            (money.to_cents(payment), money.to_cents(interest), money.to_cents(principal))
+            for payment, interest, principal in loan.installments.order_by('seq').values_list('payment', 'interest', 'principal')
+        ]
+
+    def _expected(self, loan):
+        schedule = Loan.objects.get(pk=loan.pk).cents_schedule()
+        return list(zip(schedule.payment, schedule.interest, schedule.principal))
+
+    def test_materialized_on_issue(self):
+        loan = self._loan()
+        self.assertEqual(self._stored(loan), self._expected(loan))
+        last = loan.installments.get(seq=12)
+        self.assertEqual(last.due_date, loan.start_date + timedelta(days=330))
+        self.assertEqual(last.status, Installment.DUE)
+
+    def test_repayments_set_status(self):
+        loan = self._loan()
+        first = loan.installments.get(seq=1)
+        repayment = Repayment.objects.create(
+            loan=loan, date=first.due_date, amount=first.payment, interest=first.interest, principal=first.principal,
+        )
+        first.refresh_from_db()
+        self.assertEqual(first.status, Installment.PAID)
+        on_date = loan.start_date + timedelta(days=65)
+        self.assertEqual(list(Installment.objects.overdue(on_date).values_list('seq', flat=True)), [2, 3])
+        self.assertEqual(Installment.objects.due_between(loan.start_date, on_date).count(), 2)
+        repayment.delete()
+        first.refresh_from_db()
+        self.assertEqual(first.status, Installment.DUE)
+
+    def test_rate_change_rewrites_from_change(self):
+        loan = self._loan()
+        before = self._stored(loan)
+        change_rate(loan, '1.5', month=7)
+        after = self._stored(loan)
+        self.assertEqual(after[:6], before[:6])
+        self.assertEqual(after, self._expected(loan))
+
+    def test_zero_amount_drops_installments(self):
+        loan = self._loan()
+        loan.amount = Decimal('0.00')
+        loan.save()
+        self.assertFalse(loan.installments.exists())
+
+    def test_policy_rate_and_rebuild(self):
+        loan = self._loan()
+        apply_policy_rate('1.25', date(2025, 4, 1), workers=1)
+        expected = self._expected(loan)
+        self.assertEqual(Loan.objects.get(pk=loan.pk).rate_from_month, 4)
+        self.assertEqual(self._stored(loan), expected)
+        Installment.objects.all().delete()
+        self.assertEqual(installments.rebuild(), 12)
+        self.assertEqual(self._stored(loan), expected)
+
+    def test_policy_rate_failure_leaves_nothing_applied(self):
+        loan = self._loan()
+        before = self._stored(loan)
+        with mock.patch('mohi.installments.replace', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                apply_policy_rate('1.25', date(2025, 4, 1), workers=1)
+        loan.refresh_from_db()
+        self.assertEqual((loan.interest_rate, loan.rate_from_month), (Decimal('1.00'), 1))
+        self.assertFalse(RateChange.objects.filter(loan=loan).exists())
+        self.assertEqual(self._stored(loan), before)
+
+
+class QuoteApiTests(SimpleTestCase):
+    """/api/quote answers bad terms with a 400, or an error entry per item in a batch, never a 500."""
+
+    BAD = (
+        {'amount': 'inf', 'term': '12'}, {'amount': 'nan', 'term': '12'}, {'amount': '1e300', 'term': '12'},
+        {'amount': '1000', 'term': '12', 'rate': 'nan'}, {'amount': '1000', 'term': '12', 'rate': '1e30'},
+        {'amount': '1000', 'term': '200000'}, {'amount': '-5', 'term': '12'}, {'term': '12'},
+    )
+
+    def test_get(self):
+        response = self.client.get(reverse('api_quote'), {'amount': '1000', 'term': '12'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['monthly_payment'], 88.85)
+        response = self.client.get(reverse('api_quote'), {'amount': '1000', 'term': '12', 'schedule': '1'})
+        self.assertEqual(len(response.json()['schedule']), 12)
+
+    def test_get_rejects_bad_terms(self):
+        for params in self.BAD:
+            response = self.client.get(reverse('api_quote'), params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+
+    def test_batch_reports_bad_items(self):
+        items = [{'amount': 1000, 'term': 12}, *self.BAD, [1], {'amount': 1000, 'term': 1e400}]
+        for schedule in (False, True):
+            response = self.client.post(
+                reverse('api_quote'), {'quotes': items, 'schedule': schedule}, content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+            quotes = response.json()['quotes']
+            self.assertEqual(quotes[0]['monthly_payment'], 88.85)
+            self.assertTrue(all('error' in quote for quote in quotes[1:]))
+
+    async def test_off_grid_quote_is_priced_off_the_event_loop(self):
+        quotes._quote_grid()
+        quotes._summary.cache_clear()
+        threads = []
+
+        def price(*args):
+            threads.append(threading.current_thread().name)
+            return amortization.summarize_loans_batch(*args)
+
+        with mock.patch('mohi.quotes.summarize_loans_batch', side_effect=price):
+            response = await self.async_client.get(reverse('api_quote'), {'amount': '12345.67', 'term': '37', 'rate': '1.37'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('mohi-offload'), threads)
+
+    def test_batch_prices_off_grid_items_in_one_pass(self):
+        quotes._quote_grid()
+        items = [{'amount': 10000 + i, 'term': 600, 'rate': 1.37} for i in range(50)] + [{'amount': 'x', 'term': 1}]
+        with mock.patch('mohi.quotes.summarize_loans_batch', wraps=quotes.summarize_loans_batch) as priced:
+            response = self.client.post(reverse('api_quote'), {'quotes': items}, content_type='application/json')
+        self.assertEqual(priced.call_count, 1)
+        batch = response.json()['quotes']
+        self.assertIn('error', batch[-1])
+        for item, quote in zip(items[:3], batch):
+            single = self.client.get(reverse('api_quote'), item).json()
+            self.assertEqual(quote, single)
+
+
+class CalculatorTests(TestCase):
+    """Calculator quotes travel as a key into the session, never as code in the query string."""
+
+    def test_quote_round_trip(self):
+        response = self.client.post(reverse('loan_calculator'), {'loanAmount': '1000', 'loanTerm': '12'})
+        self.assertEqual(response.status_code, 302)
+        self.assertRegex(response['Location'], r'\?quote=[0-9a-f]{32}$')
+        preview = self.client.get(response['Location'])
+        self.assertEqual(preview.status_code, 200)
+        self.assertEqual(len(preview.context['schedule']), 12)
+
+    def test_unknown_or_injected_key_redirects(self):
+        for key in ('0' * 32, "__import__('os').system('true')"):
+            response = self.client.get(reverse('pdf_preview'), {'quote': key})
+            self.assertRedirects(response, reverse('loan_calculator'))
+
+    def test_bad_terms_show_the_form_error(self):
+        for amount, term in (('inf', '12'), ('nan', '12'), ('abc', '12'), ('1000', '200000'), ('1000', '')):
+            response = self.client.post(reverse('loan_calculator'), {'loanAmount': amount, 'loanTerm': term})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['error'])
+
+
+class ViewCacheTests(TestCase):
+    """Cached pages, fragments and ETags follow writes, including bulk writes that send no signals."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            'cache@example.com', 'Cache', 'Staff', 'Finance', 'Officer', password='pw', is_staff=True,
+        )
+        cls.loan = Loan.objects.create(
+            user=cls.staff, amount=Decimal('12000.00'), balance=Decimal('12000.00'),
+            term_months=12, start_date=date(2025, 1, 1),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def _forget_local_caches(self):
+        # What another process sees: its own page and fragment caches, the shared version cache
+        caches['default'].clear()
+        caches['template_fragments'].clear()
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('home'))
+        self.assertIn('private', response['Cache-Control'])
+        not_modified = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        Repayment.objects.create(
+            loan=self.loan, date=self.loan.start_date, amount=Decimal('1066.19'),
+            principal=Decimal('946.19'), interest=Decimal('120.00'),
+        )
+        changed = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_bulk_write_expires_pages_and_fragments(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        detail = self.client.get(reverse('loan_detail', args=[self.loan.id]))
+        self.assertContains(detail, 'No repayments made.')
+        self._forget_local_caches()
+        rows = [(2, {'loan_id': str(self.loan.id), 'date': '2025-01-01', 'amount': '1066.19'})]
+        with self.captureOnCommitCallbacks(execute=True):
+            post_deductions(rows)
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        detail = self.client.get(reverse('loan_detail', args=[self.loan.id]))
+        self.assertNotContains(detail, 'No repayments made.')
+        self.assertContains(detail, '2025-01-01')
+
+    def test_policy_rate_expires_pages(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_policy_rate('1.25', date(2025, 6, 1), workers=1)
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class GeneratePdfTests(SimpleTestCase):
+    """generate_pdf refuses a malformed payload with a 400 instead of a truncated stream."""
+
+    LOAN = {
+        'id': 7, 'amount': 1000, 'term_months': 1, 'start_date': '2025-01-01', 'balance': 0, 'status': 'Paid',
+        'user': {'email': 'pdf@example.com'},
+    }
+    ROW = {'month': 1, 'date': '2025-01-01', 'payment': 1010, 'interest': 10, 'principal': 1000, 'balance': 0}
+
+    def _post(self, loan, repayments=()):
+        return self.client.post(
+            reverse('generate_pdf'), {'loan': loan, 'repayments': list(repayments)}, content_type='application/json',
+        )
+
+    def test_renders(self):
+        response = self._post(dict(self.LOAN, schedule=[self.ROW]))
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        self.assertTrue(body.startswith(b'%PDF') and body.endswith(b'%%EOF\n'))
+
+    def test_rejects_missing_or_malformed_fields(self):
+        without_amount = {key: value for key, value in self.LOAN.items() if key != 'amount'}
+        for loan, repayments in (
+            (dict(without_amount, schedule=[self.ROW]), ()),
+            (dict(self.LOAN, schedule=[{'month': 1}]), ()),
+            (dict(self.LOAN, schedule=[dict(self.ROW, payment='lots')]), ()),
+            (dict(self.LOAN, schedule='rows'), ()),
+            (dict(self.LOAN, user='someone', schedule=[self.ROW]), ()),
+            (dict(self.LOAN, schedule=[self.ROW]), [{'date': '2025-01-01'}]),
+        ):
+            response = self._post(loan, repayments)
+            self.assertEqual(response.status_code, 400, loan)
+            self.assertFalse(response.streaming)
+
+
+class ExportTests(TestCase):
+    """The streamed CSV and XLSX exports hold exactly the loans the user may see, and the XLSX is a readable workbook."""
+
+    SHEET = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            'exports@example.com', 'Ex', 'Port', 'Finance', 'Officer', password='pw', is_staff=True,
+        )
+        cls.borrower = CustomUser.objects.create_user('borrower@example.com', 'Bo', 'Rower', 'Finance', 'Clerk', password='pw')
+        for user, amount, term_months in ((cls.staff, '12000.00', 12), (cls.borrower, '6000.00', 6), (cls.borrower, '3000.00', 3)):
+            Loan.objects.create(
+                user=user, amount=Decimal(amount), balance=Decimal(amount), term_months=term_months, start_date=date(2025, 1, 1),
+            )
+
+    def _export(self, user, export_format, schedules=False):
+        self.client.force_login(user)
+        response = self.client.get(reverse('export_portfolio'), {'format': export_format, 'schedules': '1' if schedules else ''})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def _expected(self, loans):
+        return [
+            [str(loan.id), loan.user.email, str(loan.amount), str(loan.balance), str(loan.term_months),
+             loan.start_date.isoformat(), loan.get_status_display()]
+            for loan in loans.select_related('user').order_by('id')
+        ]
+
+    def _sheet_rows(self, content):
+        with zipfile.ZipFile(BytesIO(content)) as workbook:
+            self.assertIsNone(workbook.testzip())
+            self.assertTrue({'[Content_Types].xml', 'xl/workbook.xml', 'xl/worksheets/sheet1.xml'} <= set(workbook.namelist()))
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        return [
+            [''.join(cell.itertext()) for cell in row]
+            for row in sheet.iter(f'{self.SHEET}row')
+        ]
+
+    def test_csv_rows_match_the_queryset(self):
+        rows = list(csv.reader(StringIO(self._export(self.staff, 'csv', schedules=True).decode())))
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual([row[:7] for row in rows[1:] if row[1]], self._expected(Loan.objects.all()))
+        for loan in Loan.objects.all():
+            schedule = [row for row in rows[1:] if row[0] == str(loan.id) and not row[1]]
+            self.assertEqual([row[7] for row in schedule], [str(month) for month in range(1, loan.term_months + 1)])
+
+        rows = list(csv.reader(StringIO(self._export(self.borrower, 'csv').decode())))
+        self.assertEqual(rows[1:], [row + [''] * 6 for row in self._expected(Loan.objects.filter(user=self.borrower))])
+
+    def test_xlsx_is_a_well_formed_workbook(self):
+        rows = self._sheet_rows(self._export(self.staff, 'xlsx'))
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual([row[:7] for row in rows[1:]], self._expected(Loan.objects.all()))
+
+    def test_empty_portfolio(self):
+        newcomer = CustomUser.objects.create_user('newcomer@example.com', 'New', 'Comer', 'Finance', 'Clerk', password='pw')
+        self.assertEqual(list(csv.reader(StringIO(self._export(newcomer, 'csv', schedules=True).decode()))), [HEADER])
+        self.assertEqual(self._sheet_rows(self._export(newcomer, 'xlsx', schedules=True)), [HEADER])
+
+
+class StatementJobTests(TestCase):
+    """A statement job always ends up done or failed, even when its worker crashes or disappears."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            'jobs@example.com', 'Job', 'Runner', 'Finance', 'Officer', password='pw', is_staff=True,
+        )
+
+    def test_error_fails_the_job(self):
+        job = enqueue_statements(Loan.objects.none(), created_by=self.staff)
+        job = claim_next_job()
+        with mock.patch('mohi.jobs._render_items', side_effect=OSError("disk full")):
+            job = run_job(job, workers=1)
+        self.assertEqual((job.status, job.error), (StatementJob.FAILED, "disk full"))
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(STATEMENT_JOB_TIMEOUT=60, STATEMENT_JOB_MAX_ATTEMPTS=2)
+    def test_stale_jobs_are_requeued_then_failed(self):
+        enqueue_statements(Loan.objects.none(), created_by=self.staff)
+        job = claim_next_job()
+        later = timezone.now() + timedelta(seconds=61)
+        self.assertEqual(recover_stale_jobs(timezone.now()), (0, 0))
+        self.assertEqual(recover_stale_jobs(later), (1, 0))
+        job = claim_next_job()
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(recover_stale_jobs(later + timedelta(seconds=61)), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, StatementJob.FAILED)
+        self.assertTrue(job.error)
+
+    def test_deleted_loan_is_an_item_error(self):
+        loans = [
+            Loan.objects.create(user=self.staff, amount=Decimal('1200.00'), balance=Decimal('1200.00'), term_months=12)
+            for _ in range(2)
+        ]
+        enqueue_statements(Loan.objects.filter(pk__in=[loan.pk for loan in loans]), created_by=self.staff)
+        job = claim_next_job()
+        payloads = jobs._payloads(job, chunk_size=1)
+        self.assertEqual(next(payloads)[1]['loan']['id'], loans[0].pk)
+        # Deleted while the job runs, after its items were read
+        loans[1].delete()
+        self.assertEqual(list(payloads), [])
+        job.refresh_from_db()
+        self.assertEqual((job.failed, job.completed), (1, 0))
+
+    def test_missing_file_is_a_404(self):
+        loan = Loan.objects.create(user=self.staff, amount=Decimal('1200.00'), balance=Decimal('1200.00'), term_months=12)
+        job = enqueue_statements(Loan.objects.filter(pk=loan.pk), created_by=self.staff)
+        job.items.update(status=StatementJob.DONE, file_path='/nonexistent/statement_loan.pdf')
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('statement_job_download', args=[job.id, loan.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SeedPortfolioTests(TestCase):
+    """Seeded repayments are priced at each loan's own rate, so they match its installments."""
+
+    @override_settings(DEFAULT_MONTHLY_RATE=2.5)
+    def test_repayments_match_installments(self):
+        result = seed_portfolio(3, 20, seed=1)
+        self.assertGreater(result.repayments, 0)
+        self.assertFalse(Loan.objects.exclude(interest_rate=Decimal('2.50')).exists())
+        installments = {
+            (loan_id, due_date): (payment, interest, status)
+            for loan_id, due_date, payment, interest, status in Installment.objects.values_list(
+                'loan_id', 'due_date', 'payment', 'interest', 'status',
+            )
+        }
+        for repayment in Repayment.objects.all():
+            self.assertEqual(
+                installments[(repayment.loan_id, repayment.date)],
+                (repayment.amount, repayment.interest, Installment.PAID),
+            )
+
+
+class BulkIssuanceTests(TestCase):
+    """Bulk issuance matches borrowers ignoring case and refuses a malformed file as a whole."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('Jane.Doe@example.com', 'Jane', 'Doe', 'Finance', 'Officer')
+
+    def _issue(self, text):
+        return issue_loans(read_rows(text.splitlines(keepends=True)), date(2025, 1, 1), batch_size=2)
+
+    def test_email_ignores_case(self):
+        result = self._issue(
+            "email,amount,term_months\n"
+            "jane.doe@EXAMPLE.com,12000,12\n"
+            "Jane.Doe@example.com,6000,6\n"
+            "nobody@example.com,6000,6\n"
+        )
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.errors, [(4, "No user with email nobody@example.com.")])
+        self.assertEqual(Loan.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Installment.objects.filter(loan__user=self.user).count(), 18)
+
+    def test_malformed_csv_is_a_row_error(self):
+        text = "email,amount,term_months\njane.doe@example.com,12000,12\n" + 'x' * (csv.field_size_limit() + 1) + ",1,1\n"
+        with self.assertRaisesMessage(RowError, "Malformed CSV after line 2"):
+            self._issue(text)
+        self.assertFalse(Loan.objects.exists())
+
+    def _upload(self, data):
+        staff = CustomUser.objects.create_user(
+            'issuer@example.com', 'Issue', 'Staff', 'Finance', 'Officer', password='pw', is_staff=True,
+        )
+        self.client.force_login(staff)
+        return self.client.post(reverse('bulk_issue_loans'), {'file': SimpleUploadedFile('loans.csv', data)})
+
+    def test_upload_reports_malformed_csv(self):
+        response = self._upload(b'email,amount,term_months\n' + b'x' * 200000 + b',1,1\n')
+        self.assertContains(response, 'Malformed CSV')
+        self.assertFalse(Loan.objects.exists())
+
+    def test_upload_rejects_oversized_term(self):
+        response = self._upload(
+            b'email,amount,term_months\n'
+            b'jane.doe@example.com,12000,100000000000000000000\n'
+            b'jane.doe@example.com,12000,601\n'
+            b'jane.doe@example.com,12000,600\n'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].errors, [
+            (2, "Term must be between 1 and 600 months."), (3, "Term must be between 1 and 600 months."),
+        ])
+        self.assertEqual(list(Loan.objects.values_list('term_months', flat=True)), [600])
+
+
+class BalanceTests(TestCase):
+    """Loan.balance and is_paid follow repayment writes, and reconcile_balances repairs drift."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('balance@example.com', 'Bal', 'Ance', 'Finance', 'Officer')
+
+    def _loan(self, amount=Decimal('1000.00')):
+        return Loan.objects.create(
+            user=self.user, amount=amount, balance=amount, term_months=12, start_date=date(2025, 1, 1),
+        )
+
+    def _repay(self, loan, principal):
+        return Repayment.objects.create(
+            loan=loan, date=loan.start_date, amount=principal, principal=principal, interest=Decimal('0.00'),
+        )
+
+    def test_repayment_create_update_and_delete(self):
+        loan = self._loan()
+        first = self._repay(loan, Decimal('400.00'))
+        loan.refresh_from_db()
+        self.assertEqual((loan.balance, loan.is_paid), (Decimal('600.00'), False))
+        second = self._repay(loan, Decimal('600.00'))
+        loan.refresh_from_db()
+        self.assertEqual((loan.balance, loan.is_paid), (Decimal('0.00'), True))
+        self.assertIsNotNone(loan.end_date)
+        second.principal = Decimal('500.00')
+        second.save()
+        loan.refresh_from_db()
+        self.assertEqual((loan.balance, loan.is_paid), (Decimal('100.00'), False))
+        first.delete()
+        loan.refresh_from_db()
+        self.assertEqual((loan.balance, loan.is_paid), (Decimal('500.00'), False))
+
+    def test_reconcile_fixes_only_drifted_loans(self):
+        steady, drifted, settled = self._loan(), self._loan(), self._loan()
+        self._repay(steady, Decimal('250.00'))
+        self._repay(drifted, Decimal('250.00'))
+        self._repay(settled, Decimal('1000.00'))
+        Loan.objects.filter(pk=drifted.pk).update(balance=Decimal('1000.00'))
+        Loan.objects.filter(pk=settled.pk).update(balance=Decimal('5.00'), is_paid=False, end_date=None)
+        self.assertEqual(set(Loan.objects.drifted()), {drifted, settled})
+
+        out = StringIO()
+        with mock.patch('mohi.bulk.view_cache.invalidate') as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_balances', batch_size=2, stdout=out)
+        self.assertIn("Checked 3 loans. Fixed 2 drifted balances.", out.getvalue())
+        self.assertEqual({call.args for call in invalidate.call_args_list}, {(self.user.id,)})
+        self.assertFalse(Loan.objects.drifted().exists())
+        settled.refresh_from_db()
+        self.assertEqual((settled.balance, settled.is_paid), (Decimal('0.00'), True))
+        self.assertIsNotNone(settled.end_date)
+
+
+class PortfolioStatsTests(TestCase):
+    """Once refreshed, the materialized summary serves the same totals as a direct aggregate, as the live source does."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user('stats@example.com', 'Sta', 'Tistic', 'Finance', 'Officer', is_staff=True)
+        cls.borrowers = [
+            CustomUser.objects.create_user(f'stats{index}@example.com', 'Bor', 'Rower', 'Finance', 'Clerk') for index in range(3)
+        ]
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def _loan(self, user, amount):
+        return Loan.objects.create(
+            user=user, amount=Decimal(amount), balance=Decimal(amount), term_months=12, start_date=date(2025, 1, 1),
+        )
+
+    def _repay(self, loan, amount):
+        return Repayment.objects.create(
+            loan=loan, date=loan.start_date, amount=Decimal(amount), principal=Decimal(amount), interest=Decimal('0.00'),
+        )
+
+    def _direct(self, loans):
+        loans = list(loans)
+        return (
+            len(loans),
+            sum((loan.amount for loan in loans), Decimal('0.00')),
+            sum((repayment.amount for loan in loans for repayment in loan.repayment_set.all()), Decimal('0.00')),
+            sum((loan.balance for loan in loans), Decimal('0.00')),
+        )
+
+    def _served(self, user):
+        stats = PortfolioStats.for_user(user)
+        return (stats.loan_count, stats.principal, stats.repaid, stats.outstanding)
+
+    @override_settings(PORTFOLIO_STATS_SOURCE='summary')
+    def test_summary_matches_direct_aggregate_after_repayments_and_deletes(self):
+        first, second, gone = self.borrowers
+        kept = self._loan(first, '1000.00')
+        self._repay(kept, '250.00')
+        self._repay(self._loan(first, '500.00'), '500.00')
+        other = self._loan(second, '2000.00')
+        self._repay(other, '300.00')
+        self._repay(other, '700.00').delete()
+        self._repay(self._loan(gone, '800.00'), '100.00')
+        Loan.objects.filter(user=gone).delete()
+        self._loan(second, '400.00').delete()
+
+        refresh_summaries()
+        self.assertEqual(self._served(self.staff), self._direct(Loan.objects.all()))
+        for borrower in self.borrowers:
+            self.assertEqual(self._served(borrower), self._direct(Loan.objects.filter(user=borrower)))
+        self.assertEqual(self._served(gone), (0, Decimal('0.00'), Decimal('0.00'), Decimal('0.00')))
+        with override_settings(PORTFOLIO_STATS_SOURCE='live'):
+            caches['default'].clear()
+            self.assertEqual(self._served(self.staff), self._direct(Loan.objects.all()))
+
+
+class MetricsTests(TestCase):
+    """Every request is counted and timed, and /metrics is only served to staff and the scraper token."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            'metrics@example.com', 'Met', 'Rics', 'Finance', 'Officer', password='pw', is_staff=True,
+        )
+
+    def _sample(self, line_start):
+        for line in metrics.render().splitlines():
+            if line.startswith(line_start + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_requests_are_counted(self):
+        self.client.force_login(self.staff)
+        requests = 'mohi_requests_total{view="home",method="GET",status="200"}'
+        queries = 'mohi_request_db_queries_count{view="home"}'
+        before = self._sample(requests), self._sample(queries)
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.assertEqual((self._sample(requests), self._sample(queries)), (before[0] + 2, before[1] + 2))
+
+    def test_endpoint_access(self):
+        url = reverse('metrics')
+        # A local reverse proxy makes every client look like 127.0.0.1
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, '# TYPE mohi_requests_total counter')
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class PayrollTests(TestCase):
+    """Posting the same deduction file again changes nothing; a corrected file updates in place."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user('payroll@example.com', 'Pay', 'Roll', 'Finance', 'Officer')
+        cls.loan = Loan.objects.create(
+            user=user, amount=Decimal('12000.00'), balance=Decimal('12000.00'),
+            term_months=12, start_date=date(2025, 1, 1),
+        )
+
+    def _rows(self, *amounts):
+        return [
+            (line, {'loan_id': str(self.loan.id), 'date': str(self.loan.start_date + timedelta(days=30 * k + 3)), 'amount': amount})
+            for line, (k, amount) in enumerate(enumerate(amounts), start=2)
+        ]
+
+    def _state(self):
+        self.loan.refresh_from_db()
+        repayments = list(Repayment.objects.order_by('date').values_list('date', 'amount', 'principal', 'interest'))
+        paid = list(Installment.objects.filter(loan=self.loan, status=Installment.PAID).order_by('seq').values_list('seq', flat=True))
+        return self.loan.balance, repayments, paid
+
+    def test_rerun_is_a_no_op(self):
+        rows = self._rows('1066.19', '1066.19', '1066.19')
+        first = post_deductions(rows, batch_size=2)
+        self.assertEqual((first.created, first.updated, first.unchanged, first.rejected), (3, 0, 0, 0))
+        state = self._state()
+        self.assertEqual(state[2], [1, 2, 3])
+        rerun = post_deductions(rows, batch_size=2)
+        self.assertEqual((rerun.created, rerun.updated, rerun.unchanged, rerun.rejected), (0, 0, 3, 0))
+        self.assertEqual(self._state(), state)
+
+    def test_corrected_file_updates_in_place(self):
+        post_deductions(self._rows('1066.19', '1066.19'))
+        corrected = post_deductions(self._rows('1066.19', '500.00'))
+        self.assertEqual((corrected.created, corrected.updated, corrected.unchanged), (0, 1, 1))
+        balance, repayments, _ = self._state()
+        self.assertEqual([amount for _, amount, _, _ in repayments], [Decimal('1066.19'), Decimal('500.00')])
+        self.assertEqual(balance, self.loan.amount - sum(principal for _, _, principal, _ in repayments))
+
+
+@override_settings(REPLICA_DATABASE='default')  # any configured alias stands in for the replica
+class ReplicaRoutingTests(SimpleTestCase):
+    """@use_replica views read from the replica, except for a browser that has just written."""
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Loan))
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(Loan), 'default')
+            self.assertIsNone(router.db_for_read(mock.Mock(_meta=mock.Mock(app_label='django_cache'))))
+            self.assertEqual(router.db_for_write(Loan), 'default')
+
+    def test_writes_pin_the_browser(self):
+        factory = RequestFactory()
+        middleware = ReplicaPinMiddleware(lambda request: HttpResponse())
+        pinned = middleware(factory.post('/issue_loan/'))
+        self.assertEqual(pinned.cookies[settings.REPLICA_PIN_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, middleware(factory.get('/')).cookies)
+        failed = ReplicaPinMiddleware(lambda request: HttpResponse(status=500))(factory.post('/issue_loan/'))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, failed.cookies)
+        with override_settings(REPLICA_DATABASE=None):
+            self.assertNotIn(settings.REPLICA_PIN_COOKIE, middleware(factory.post('/issue_loan/')).cookies)
+
+    def test_pinned_browser_reads_the_primary(self):
+        # The view reports where a Loan read made inside it would go
+        view = use_replica(lambda request: HttpResponse(str(ReplicaRouter().db_for_read(Loan))))
+        self.assertEqual(view(RequestFactory().get('/')).content, b'default')
+        pinned = RequestFactory().get('/')
+        pinned.COOKIES[settings.REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(view(pinned).content, b'None')
+
+
+class RollupTests(TestCase):
+    """Rollups kept current on every write match a rebuild from scratch."""
+
+    def _snapshot(self):
+        return sorted(MonthlyRollup.objects.values_list(
+            'month', 'department', 'loans_issued', 'disbursed', 'repaid', 'interest', 'principal_repaid', 'outstanding',
+        ))
+
+    def test_incremental_rollups_match_rebuild(self):
+        finance = CustomUser.objects.create_user('roll.finance@example.com', 'Roll', 'Up', 'Finance', 'Officer')
+        CustomUser.objects.create_user('roll.ict@example.com', 'Roll', 'Up', 'ICT', 'Officer')
+        loan = Loan.objects.create(
+            user=finance, amount=Decimal('12000.00'), balance=Decimal('12000.00'),
+            term_months=12, start_date=date(2025, 1, 15),
+        )
+        moved = Loan.objects.create(
+            user=finance, amount=Decimal('5000.00'), balance=Decimal('5000.00'),
+            term_months=6, start_date=date(2025, 2, 1),
+        )
+        repayment = Repayment.objects.create(
+            loan=loan, date=date(2025, 2, 14), amount=Decimal('1066.19'),
+            principal=Decimal('946.19'), interest=Decimal('120.00'),
+        )
+        dropped = Repayment.objects.create(
+            loan=loan, date=date(2025, 3, 16), amount=Decimal('1066.19'),
+            principal=Decimal('955.65'), interest=Decimal('110.54'),
+        )
+        repayment.date, repayment.amount = date(2025, 4, 1), Decimal('1000.00')
+        repayment.save()
+        dropped.delete()
+        moved.start_date, moved.amount = date(2025, 5, 1), Decimal('7000.00')
+        moved.save()
+        issue_loans(read_rows([
+            "email,amount,term_months,start_date\n",
+            "roll.ict@example.com,3000,3,2025-02-10\n",
+            "ROLL.FINANCE@example.com,4000,4,2025-03-01\n",
+        ]), date(2025, 1, 1))
+        post_deductions([(2, {'loan_id': str(loan.id), 'date': '2025-01-20', 'amount': '1066.19'})])
+        Loan.objects.get(start_date=date(2025, 3, 1)).delete()
+
+        incremental = self._snapshot()
+        self.assertTrue(incremental)
+        rollups.rebuild()
+        self.assertEqual(incremental, self._snapshot())
+
+
+class ScheduleCacheTests(TestCase):
+    """Schedules are served from the cache until a write anywhere moves their version."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('schedules@example.com', 'Sched', 'Ule', 'Finance', 'Officer')
+
+    def setUp(self):
+        caches[settings.SCHEDULE_CACHE_ALIAS].clear()
+        schedule_cache.reset_schedule_cache_stats()
+        self.loan = Loan.objects.create(
+            user=self.user, amount=Decimal('12000.00'), balance=Decimal('12000.00'),
+            term_months=12, start_date=date(2025, 1, 1),
+        )
+
+    def _counts(self):
+        stats = schedule_cache.schedule_cache_stats()
+        return stats['hits'], stats['misses']
+
+    def test_hits_misses_and_invalidation_on_write(self):
+        self.assertEqual(len(self.loan.generate_amortization_schedule()), 12)
+        self.loan.generate_amortization_schedule()
+        self.assertEqual(self._counts(), (1, 1))
+        Repayment.objects.create(
+            loan=self.loan, date=self.loan.start_date, amount=Decimal('1066.19'),
+            principal=Decimal('946.19'), interest=Decimal('120.00'),
+        )
+        self.loan.refresh_from_db()
+        self.assertEqual(len(self.loan.generate_amortization_schedule()), 11)
+        self.assertEqual(self._counts(), (1, 2))
+        self.assertGreaterEqual(schedule_cache.schedule_cache_stats()['invalidations'], 1)
+
+    def test_write_from_another_process_is_seen(self):
+        with schedule_cache.version_scope():
+            self.loan.generate_amortization_schedule()
+            with self.assertNumQueries(0):
+                self.loan.generate_amortization_schedule()
+        # What another process's invalidate() leaves in the shared version cache
+        token = time.time_ns()
+        caches[settings.VERSION_CACHE_ALIAS].set_many({
+            f'mohi:schedule-version:{self.loan.pk}': token, schedule_cache.GENERATION_KEY: token,
+        })
+        with schedule_cache.version_scope():
+            self.loan.generate_amortization_schedule()
+        self.assertEqual(self._counts(), (1, 2))
+
+    def test_key_of_a_fresh_instance(self):
+        loan = Loan(pk=self.loan.pk, amount=Decimal('12000.00'), balance=Decimal('12000.00'), term_months=12)
+        loan.start_date = timezone.make_aware(datetime(2025, 1, 1, 9, 30))
+        key = schedule_cache.schedule_key(loan, original=True)
+        self.assertNotIn(' ', key)
+        self.assertIn(':2025-01-01:', key)
+
+
+class AsgiConnectionTests(SimpleTestCase):
+    """Under ASGI, connections opened on the async views' worker threads are released, not kept per thread."""
+
+    def test_asgi_entry_point_disables_persistent_connections(self):
+        probe = (
+            "import loan_tracker.asgi\n"
+            "from django.db import connections\n"
+            "print(sorted({connections[alias].settings_dict['CONN_MAX_AGE'] for alias in connections}))\n"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', probe], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertEqual(output.strip(), '[0]')
+
+    def test_offload_threads_close_their_connections(self):
+        closed_on = []
+        with mock.patch(
+            'mohi.concurrency.close_old_connections', side_effect=lambda: closed_on.append(threading.current_thread().name),
+        ):
+            self.assertEqual(asyncio.run(concurrency.offload(sum, (1, 2))), 3)
+        self.assertEqual(len(closed_on), 1)
+        self.assertTrue(closed_on[0].startswith('mohi-offload'))
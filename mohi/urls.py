@@ -11,11 +11,18 @@ urlpatterns = [
     path('loans/<int:loan_id>/repay/', views.make_repayment, name='make_repayment'),
      path('loans/<int:loan_id>/download/', views.loan_download, name='loan_download'),
     path('report/', views.loan_report, name='loan_report'),
+    path('export/', views.export_portfolio, name='export_portfolio'),
     
     path('logout/', views.logout_view, name='logout'),
     path('loan_calculator/', views.loan_calculator, name='loan_calculator'),
     path('issue_loan/', views.issue_loan, name='issue_loan'),
+    path('issue_loan/bulk/', views.bulk_issue_loans, name='bulk_issue_loans'),
     path('pdf_preview/', views.pdf_preview, name='pdf_preview'),
     path('generate-pdf/', views.generate_pdf, name='generate_pdf'),
+    path('api/quote', views.api_quote, name='api_quote'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('jobs/statements/', views.enqueue_statement_job, name='enqueue_statement_job'),
+    path('jobs/<int:job_id>/', views.statement_job_status, name='statement_job_status'),
+    path('jobs/<int:job_id>/loans/<int:loan_id>/', views.statement_job_download, name='statement_job_download'),
     
 ]
\ No newline at end of file
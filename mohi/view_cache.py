@@ -0,0 +1,125 @@
+import hashlib
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .schedule_cache import current_versions, set_versions
+
+PORTFOLIO = 'portfolio'
+EVERYONE = 'all'
+
+
+def _cache():
+    return caches[getattr(settings, 'VIEW_CACHE_ALIAS', 'default')]
+
+
+def _version_key(scope):
+    return f'mohi:view-version:{scope}'
+
+
+def scope_version(scope):
+    """
+    Version of the data behind a cached page: PORTFOLIO for staff pages, a user id for a
+    borrower's own pages, each paired with the EVERYONE version moved by invalidate_all().
+    Versions are times of writes, kept in the shared version cache (schedule_cache.current_versions)
+    so that writes from any process are seen; the later one doubles as Last-Modified.
+    """
+    versions = current_versions([_version_key(EVERYONE), _version_key(scope)])
+    return versions[_version_key(EVERYONE)], versions[_version_key(scope)]
+
+
+def invalidate(user_id):
+    """Expire the cached pages of a borrower and every staff page, after a loan or repayment write."""
+    set_versions([_version_key(PORTFOLIO), _version_key(user_id)])
+
+
+def invalidate_all():
+    """Expire every cached page, for book-wide writes."""
+    set_versions([_version_key(EVERYONE)])
+
+
+def _lookup(request, user):
+    """Cache key, ETag and Last-Modified timestamp of this request's page."""
+    versions = scope_version(PORTFOLIO if user.is_staff else user.pk)
+    # The session key keeps pages (and the CSRF tokens in them) from outliving a login
+    raw = '|'.join([
+        request.path, request.GET.urlencode(), str(user.pk), request.session.session_key or '', *map(str, versions),
+    ])
+    digest = hashlib.sha256(raw.encode()).hexdigest()[:32]
+    return f'mohi:view:{digest}', f'"{digest}"', max(versions) // 1_000_000_000
+
+
+def _finish(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Browsers keep the page but revalidate every time, which costs a 304 until the data changes
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def _store(key, response):
+    if response.status_code == 200 and not response.streaming:
+        return key, (response.content, response['Content-Type'])
+    return None
+
+
+def _bypass(request, user):
+    return request.method not in ('GET', 'HEAD') or not user.is_authenticated
+
+
+def cache_per_user(view_func):
+    """
+    Cache the rendered page per user and session for VIEW_CACHE_TIMEOUT seconds, keyed on the
+    version of the data it shows, and answer conditional requests with 304 Not Modified.
+    Loan and Repayment writes move the version on, so a cached page is never served stale.
+    """
+    timeout = getattr(settings, 'VIEW_CACHE_TIMEOUT', 300)
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            user = await request.auser()
+            if _bypass(request, user):
+                return await view_func(request, *args, **kwargs)
+            # The version cache may be database-backed
+            key, etag, last_modified = await sync_to_async(_lookup)(request, user)
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+            cached = await _cache().aget(key)
+            if cached is not None:
+                response = HttpResponse(cached[0], content_type=cached[1])
+            else:
+                response = await view_func(request, *args, **kwargs)
+                entry = _store(key, response)
+                if entry:
+                    await _cache().aset(*entry, timeout)
+            return _finish(response, etag, last_modified)
+        return _wrapped_async_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        user = request.user
+        if _bypass(request, user):
+            return view_func(request, *args, **kwargs)
+        key, etag, last_modified = _lookup(request, user)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        cached = _cache().get(key)
+        if cached is not None:
+            response = HttpResponse(cached[0], content_type=cached[1])
+        else:
+            response = view_func(request, *args, **kwargs)
+            entry = _store(key, response)
+            if entry:
+                _cache().set(*entry, timeout)
+        return _finish(response, etag, last_modified)
+    return _wrapped_view
@@ -3,55 +3,66 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.hashers import make_password
 from django.db import transaction
-from django.db.models import Sum, Q
 from django.utils import timezone
-from datetime import timedelta
-from .decorators import is_staff_required
-from .models import CustomUser, Loan, Repayment
-from django.db.models.functions import TruncMonth
+from datetime import date, timedelta
+from .decorators import is_staff_required, use_replica
+from .models import CustomUser, Loan, MonthlyRollup, Repayment, StatementJob, StatementJobItem, default_monthly_rate
+from . import metrics
+from .concurrency import offload
+from .exports import EXPORT_FORMATS, portfolio_rows
+from .issuance import RowError, issue_loans, read_rows
+from .jobs import enqueue_statements
+from .pdf import render_payment_schedule, validate_payload
+from .pagination import keyset_paginate
+from .quotes import clean_terms, get_quote, quote_summaries, quote_summary, recall_quote, remember_quote
+from .rates import clean_rate
+from .stats import PortfolioStats
+from .view_cache import cache_per_user
+from . import schedule_cache
+import codecs
+import hmac
 import logging
 import json
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.csrf import csrf_exempt
-import subprocess
 import os
-from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 from django.core.paginator import Paginator
+from django.conf import settings
 from decimal import Decimal, InvalidOperation
 from django.contrib import messages
 
 
 # from datetime import date as dt
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+MAX_BATCH_QUOTES = 1000
+MAX_LISTED_ERRORS = 200
+REPORT_PAGE_SIZE = 50
 
 
+
+@cache_per_user
+@use_replica
 def home(request):
     context = {}
     if request.user.is_authenticated:
         exchange_rate = 1  # 1 USD = 1 KSH
+        stats = PortfolioStats.for_user(request.user).scaled(exchange_rate)
         if request.user.is_staff:
-            loans = Loan.objects.all()
-            total_loans = loans.count()
-            total_amount = loans.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-            total_paid = Repayment.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
             context.update({
-                'total_loans': total_loans,
-                'total_amount': total_amount * exchange_rate,
-                'total_paid': total_paid * exchange_rate
+                'total_loans': stats.loan_count,
+                'total_amount': stats.principal,
+                'total_paid': stats.repaid
             })
         else:
-            user_loans = Loan.objects.filter(user=request.user)
-            context['user_loans'] = user_loans
-            if user_loans.exists():
-                user_total_amount = user_loans.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                user_total_paid = Repayment.objects.filter(loan__in=user_loans).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+            context['user_loan_count'] = stats.loan_count
+            if stats.loan_count:
                 context.update({
-                    'user_total_amount': user_total_amount * exchange_rate,
-                    'user_total_paid': user_total_paid * exchange_rate
+                    'user_total_amount': stats.principal,
+                    'user_total_paid': stats.repaid
                 })
     return render(request, 'mohi/home.html', context)
 
@@ -94,11 +105,8 @@ def apply_loan(request):
         amount = request.POST.get('amount')
         term_months = request.POST.get('term_months')
         try:
-            amount = float(amount)
-            term_months = int(term_months)
-            if amount <= 0 or term_months <= 0:
-                raise ValueError
-        except ValueError:
+            amount, _, term_months = clean_terms(amount, default_monthly_rate(), term_months)
+        except (TypeError, ValueError):
             return render(request, 'mohi/loan_apply.html', {'error': 'Invalid amount or term.'})
 
         if request.user.is_staff:
@@ -110,7 +118,7 @@ def apply_loan(request):
         start_date = timezone.now().date()
         end_date = start_date + timedelta(days=30 * term_months)
 
-        loan = Loan.objects.create(
+        Loan.objects.create(
             user=user,
             amount=amount,
             term_months=term_months,
@@ -119,7 +127,6 @@ def apply_loan(request):
             balance=amount,
             is_paid=False
         )
-        loan.save()
 
         return redirect('loan_list')
 
@@ -133,12 +140,17 @@ def issue_loan(request):
         amount = request.POST.get('amount')
         term_months = request.POST.get('term_months')
         try:
-            amount = float(amount)
-            term_months = int(term_months)
-            if amount <= 0 or term_months <= 0:
-                raise ValueError
-        except ValueError:
-            return render(request, 'mohi/issue_loan.html', {'error': 'Invalid amount or term.', 'users': CustomUser.objects.all()})
+            amount, _, term_months = clean_terms(amount, default_monthly_rate(), term_months)
+        except (TypeError, ValueError):
+            return render(request, 'mohi/issue_loan.html', {
+                'error': 'Invalid amount or term.', 'users': CustomUser.objects.all(), 'default_rate': default_monthly_rate(),
+            })
+        try:
+            interest_rate = clean_rate(request.POST.get('interest_rate') or default_monthly_rate())
+        except ValueError as e:
+            return render(request, 'mohi/issue_loan.html', {
+                'error': str(e), 'users': CustomUser.objects.all(), 'default_rate': default_monthly_rate(),
+            })
 
         user_id = request.POST.get('user_id')
         user = get_object_or_404(CustomUser, id=user_id)
@@ -146,69 +158,84 @@ def issue_loan(request):
         start_date = timezone.now().date()
         end_date = start_date + timedelta(days=30 * term_months)
 
-        loan = Loan.objects.create(
+        Loan.objects.create(
             user=user,
             amount=amount,
+            interest_rate=interest_rate,
             term_months=term_months,
             start_date=start_date,
             end_date=end_date,
             balance=amount,
             is_paid=False
         )
-        loan.save()
 
         return redirect('loan_list')
 
     users = CustomUser.objects.all()
-    return render(request, 'mohi/issue_loan.html', {'users': users})
+    return render(request, 'mohi/issue_loan.html', {'users': users, 'default_rate': default_monthly_rate()})
+
+@is_staff_required
+def bulk_issue_loans(request):
+    context = {}
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if upload is None:
+            context['error'] = 'Choose a CSV file to upload.'
+        else:
+            try:
+                rows = read_rows(codecs.iterdecode(upload, 'utf-8-sig'))
+                result = issue_loans(rows, timezone.now().date())
+            except (RowError, UnicodeDecodeError) as exc:
+                context['error'] = f'Could not read the file: {exc}'
+            else:
+                if result.created:
+                    messages.success(request, f"Issued {result.created} loans.")
+                context.update({
+                    'result': result,
+                    'errors': result.errors[:MAX_LISTED_ERRORS],
+                    'more_errors': max(result.rejected - MAX_LISTED_ERRORS, 0),
+                })
+    return render(request, 'mohi/issue_loans_bulk.html', context)
 
 @login_required
+@cache_per_user
+@use_replica
 def loan_list(request):
     search_query = request.GET.get('search', '')
-    loans = Loan.objects.all() if request.user.is_staff else Loan.objects.filter(user=request.user)
+    loans = Loan.objects.visible_to(request.user)
     if search_query:
-        loans = loans.filter(
-            Q(id__icontains=search_query.strip()) |
-            Q(user__email__icontains=search_query.strip()) |
-            Q(is_paid__icontains=search_query.strip())
-        )
-    # Update balance for each loan based on repayments
-    for loan in loans:
-        total_repaid = Repayment.objects.filter(loan=loan).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        loan.balance = max(Decimal('0.00'), loan.amount - total_repaid)
-        if loan.balance <= Decimal('0.00'):
-            loan.is_paid = True
-        else:
-            loan.is_paid = False
-        loan.save()
-
-    # Pagination
-    paginator = Paginator(loans, 10)  # 10 loans per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        loans = loans.search(search_query)
+    # Balances and is_paid are maintained on repayment writes, so listing is read-only
+    # Pagination: keyset mode (?mode=cursor) stays constant-time on deep pages; page numbers need OFFSET and COUNT
+    cursor = request.GET.get('cursor')
+    cursor_page = None
+    page_obj = None
+    if cursor or request.GET.get('mode') == 'cursor':
+        cursor_page = keyset_paginate(loans.for_listing(), cursor, per_page=10)
+    else:
+        paginator = Paginator(loans.for_listing().order_by('-start_date', '-id'), 10)  # 10 loans per page
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
     # Stats
-    total_loans = loans.count()
-    total_amount = loans.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-    total_paid = Repayment.objects.filter(loan__in=loans).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
     exchange_rate = 1  # 1 USD = 1 KSH
-    total_amount_ksh = total_amount * exchange_rate
-    total_paid_ksh = total_paid * exchange_rate
+    stats = PortfolioStats.from_queryset(loans) if search_query else PortfolioStats.for_user(request.user)
+    stats = stats.scaled(exchange_rate)
     return render(request, 'mohi/loan_list.html', {
-        'loans': page_obj,
-        'total_loans': total_loans,
-        'total_amount': total_amount_ksh,
-        'total_paid': total_paid_ksh,
+        'loans': cursor_page if cursor_page is not None else page_obj,
+        'total_loans': stats.loan_count,
+        'total_amount': stats.principal,
+        'total_paid': stats.repaid,
         'search_query': search_query,
-        'is_paginated': True,
-        'page_obj': page_obj
+        'is_paginated': page_obj is not None,
+        'page_obj': page_obj,
+        'cursor_page': cursor_page
     })
 
 
-
 @login_required
 def loan_detail(request, loan_id):
-    loan = get_object_or_404(Loan, id=loan_id)
-    if not request.user.is_staff and loan.user != request.user:
+    loan = get_object_or_404(Loan.objects.select_related('user'), id=loan_id)
+    if not request.user.is_staff and loan.user_id != request.user.pk:
         return redirect('loan_list')
     
     # Generate the original amortization schedule
@@ -216,29 +243,12 @@ def loan_detail(request, loan_id):
     repayments = Repayment.objects.filter(loan=loan)
     exchange_rate = Decimal('1')  # 1 USD = 1 KSH
     
-    # Calculate current balance based on principal repaid
-    total_principal_repaid = sum(rep.principal for rep in repayments) or Decimal('0.00')
+    # Balance is kept current by the repayment hooks
     loan_ksh_amount = loan.amount * exchange_rate
-    loan_ksh_balance = max(Decimal('0.00'), loan.amount - total_principal_repaid) * exchange_rate
-    
-    # Update loan status
-    loan.balance = loan_ksh_balance
-    loan.is_paid = loan_ksh_balance <= Decimal('0.00')
-    if loan.is_paid and not loan.end_date:
-        loan.end_date = timezone.now().date()
-    loan.save()
+    loan_ksh_balance = loan.balance * exchange_rate
     
     # Convert schedule and repayments to KSH
-    schedule_ksh = [
-        {
-            'month': item['month'],
-            'date': item['date'],
-            'payment': item['payment'] * float(exchange_rate),
-            'interest': item['interest'] * float(exchange_rate),
-            'principal': item['principal'] * float(exchange_rate),
-            'balance': item['balance'] * float(exchange_rate)
-        } for item in schedule
-    ]
+    schedule_ksh = schedule.scaled(exchange_rate)
     repayments_ksh = [
         {
             'date': rep.date,
@@ -254,12 +264,14 @@ def loan_detail(request, loan_id):
     
     return render(request, 'mohi/loan_detail.html', {
         'loan': loan,
+        # Key of the cached schedule and repayment tables; moves on with every write to the loan
+        'loan_version': schedule_cache.loan_version(loan.id),
         'schedule': schedule_ksh,
         'repayments': repayments_ksh,
         'loan_ksh_amount': float(loan_ksh_amount),
         'loan_ksh_balance': float(loan_ksh_balance),
-        'monthly_payment': schedule[0]['payment'] * float(exchange_rate) if schedule else 0.0,
-        'total_interest': sum(item['interest'] for item in schedule) * float(exchange_rate),
+        'monthly_payment': float(schedule_ksh.payment[0]) if schedule else 0.0,
+        'total_interest': float(schedule_ksh.interest.sum()),
         'total_paid': total_paid_ksh
     })
 
@@ -267,8 +279,8 @@ def loan_detail(request, loan_id):
 
 @login_required
 def make_repayment(request, loan_id):
-    loan = get_object_or_404(Loan, id=loan_id)
-    if not request.user.is_staff and loan.user != request.user:
+    loan = get_object_or_404(Loan.objects.select_related('user'), id=loan_id)
+    if not request.user.is_staff and loan.user_id != request.user.pk:
         return redirect('loan_list')
     
     # Generate adjusted schedule (accounts for repayments)
@@ -276,16 +288,7 @@ def make_repayment(request, loan_id):
     repayments = Repayment.objects.filter(loan=loan)
     exchange_rate = Decimal('1')  # 1 USD = 1 KSH
     
-    schedule_ksh = [
-        {
-            'month': item['month'],
-            'date': item['date'],
-            'payment': item['payment'] * float(exchange_rate),
-            'interest': item['interest'] * float(exchange_rate),
-            'principal': item['principal'] * float(exchange_rate),
-            'balance': item['balance'] * float(exchange_rate)
-        } for item in schedule
-    ]
+    schedule_ksh = schedule.scaled(exchange_rate)
     repayments_ksh = [
         {
             'date': rep.date,
@@ -300,12 +303,12 @@ def make_repayment(request, loan_id):
             for i, item in enumerate(schedule_ksh):
                 checkbox_name = f'paid_{i}'
                 if request.POST.get(checkbox_name):
-                    payment_amount = Decimal(str(item['payment']))
-                    interest = Decimal(str(item['interest']))
-                    principal = Decimal(str(item['principal']))
+                    payment_amount = Decimal(str(item.payment))
+                    interest = Decimal(str(item.interest))
+                    principal = Decimal(str(item.principal))
                     
                     # Create or update repayment
-                    existing_repayment = repayments.filter(date=item['date']).first()
+                    existing_repayment = repayments.filter(date=item.date).first()
                     if existing_repayment:
                         existing_repayment.amount = payment_amount / exchange_rate
                         existing_repayment.principal = principal / exchange_rate
@@ -314,20 +317,14 @@ def make_repayment(request, loan_id):
                     else:
                         Repayment.objects.create(
                             loan=loan,
-                            date=item['date'],
+                            date=item.date,
                             amount=payment_amount / exchange_rate,
                             principal=principal / exchange_rate,
                             interest=interest / exchange_rate
                         )
-                    # Update balance based on principal only
-                    loan.balance -= principal / exchange_rate
             
-            # Update loan status
-            if loan.balance <= Decimal('0.00'):
-                loan.balance = Decimal('0.00')
-                loan.is_paid = True
-                loan.end_date = timezone.now().date()
-            loan.save()
+            # Balance, is_paid and end_date were updated in the database by the repayment hooks
+            loan.refresh_from_db(fields=['balance', 'is_paid', 'end_date'])
         
         messages.success(request, "Loan repayments updated successfully.")
         return render(request, 'mohi/make_repayment.html', {
@@ -345,9 +342,10 @@ def make_repayment(request, loan_id):
     })
 
 @login_required
+@use_replica
 def loan_download(request, loan_id):
-    loan = get_object_or_404(Loan, id=loan_id)
-    if not request.user.is_staff and loan.user != request.user:
+    loan = get_object_or_404(Loan.objects.select_related('user'), id=loan_id)
+    if not request.user.is_staff and loan.user_id != request.user.pk:
         return redirect('loan_list')
     
     # Generate the original amortization schedule
@@ -356,16 +354,7 @@ def loan_download(request, loan_id):
     exchange_rate = Decimal('1')  # 1 USD = 1 KSH
     
     # Convert schedule and repayments to KSH
-    schedule_ksh = [
-        {
-            'month': item['month'],
-            'date': item['date'],
-            'payment': item['payment'] * float(exchange_rate),
-            'interest': item['interest'] * float(exchange_rate),
-            'principal': item['principal'] * float(exchange_rate),
-            'balance': item['balance'] * float(exchange_rate)
-        } for item in schedule
-    ]
+    schedule_ksh = schedule.scaled(exchange_rate)
     repayments_ksh = [
         {
             'date': rep.date,
@@ -381,56 +370,126 @@ def loan_download(request, loan_id):
         'schedule': schedule_ksh,
         'repayments': repayments_ksh,
         'loan_ksh_amount': float(loan.amount * exchange_rate),
-        'monthly_payment': schedule[0]['payment'] * float(exchange_rate) if schedule else 0.0,
-        'total_interest': sum(item['interest'] for item in schedule) * float(exchange_rate),
+        'monthly_payment': float(schedule_ksh.payment[0]) if schedule else 0.0,
+        'total_interest': float(schedule_ksh.interest.sum()),
         'total_paid': sum(rep.amount for rep in repayments) * float(exchange_rate) or 0.0
     })
 
 @login_required
-def loan_report(request):
+@cache_per_user
+@use_replica
+async def loan_report(request):
     exchange_rate = 1
     chart_data = {}
-    if request.user.is_staff:
-        total_loans_count = Loan.objects.count()
-        total_amount = Loan.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        total_repayments = Repayment.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        loans = Loan.objects.all()
-
+    user = await request.auser()
+    department = request.GET.get('department', '')
+    stats = (await PortfolioStats.afor_user(user)).scaled(exchange_rate)
+    # The table is keyset-paginated like loan_list; the full portfolio is one export_portfolio away
+    loans = await sync_to_async(keyset_paginate)(
+        Loan.objects.visible_to(user).for_listing(), request.GET.get('cursor'), per_page=REPORT_PAGE_SIZE
+    )
+    if user.is_staff:
         # Aggregate data for admin charts
-        total_outstanding = max(Decimal('0.00'), total_amount - total_repayments)
         chart_data['loan_summary'] = {
             'labels': ['Total Amount', 'Total Repayments', 'Total Outstanding'],
-            'data': [float(total_amount * exchange_rate), float(total_repayments * exchange_rate), float(total_outstanding * exchange_rate)],
+            'data': [float(stats.principal), float(stats.repaid), float(stats.outstanding)],
             'backgroundColor': ['#1E3A8A', '#10B981', '#F59E0B']
         }
-        repayments_by_month = Repayment.objects.annotate(month=TruncMonth('date')).values('month').annotate(total=Sum('amount')).order_by('month')
-        chart_data['repayment_trend'] = {
-            'labels': [item['month'].strftime('%Y-%m') for item in repayments_by_month],
-            'data': [float(item['total'] * exchange_rate) for item in repayments_by_month],
-            'borderColor': '#1E3A8A',
-            'fill': False
-        }
+        # One precomputed row per month, so the charts cost the same however long the history is
+        months = [
+            row async for row in
+            MonthlyRollup.objects.filter(department=department).order_by('month')
+        ]
+        labels = [row.month.strftime('%Y-%m') for row in months]
+        for key, field, color in (
+            ('repayment_trend', 'repaid', '#1E3A8A'),
+            ('disbursement_trend', 'disbursed', '#10B981'),
+            ('outstanding_trend', 'outstanding', '#F59E0B'),
+        ):
+            chart_data[key] = {
+                'labels': labels,
+                'data': [float(getattr(row, field) * exchange_rate) for row in months],
+                'borderColor': color,
+                'fill': False
+            }
     else:
-        user_loans = Loan.objects.filter(user=request.user)
-        total_loans_count = user_loans.count()
-        total_amount = user_loans.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        total_repayments = Repayment.objects.filter(loan__in=user_loans).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        loans = user_loans
-        total_outstanding = max(Decimal('0.00'), total_amount - total_repayments)
         chart_data['loan_summary'] = {
             'labels': ['Your Total Amount', 'Your Total Repayments', 'Your Total Outstanding'],
-            'data': [float(total_amount * exchange_rate), float(total_repayments * exchange_rate), float(total_outstanding * exchange_rate)],
+            'data': [float(stats.principal), float(stats.repaid), float(stats.outstanding)],
             'backgroundColor': ['#1E3A8A', '#10B981', '#F59E0B']
         }
 
     context = {
-        'total_loans': total_loans_count,
-        'total_amount': total_amount * exchange_rate,
-        'total_repayments': total_repayments * exchange_rate,
+        'total_loans': stats.loan_count,
+        'total_amount': stats.principal,
+        'total_repayments': stats.repaid,
         'loans': loans,
+        'department': department,
         'chart_data': chart_data
     }
-    return render(request, 'mohi/loan_report.html', context)
+    # Template rendering touches request.user and other sync APIs, so it runs in a worker thread;
+    # hand it the user loaded above so the context processors do not fetch it a second time
+    request.user = user
+    return await sync_to_async(render)(request, 'mohi/loan_report.html', context)
+
+
+
+@login_required
+@use_replica
+def export_portfolio(request):
+    """Stream the portfolio (all loans for staff, own loans otherwise) as CSV or XLSX."""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'Unsupported format'}, status=400)
+    include_schedules = request.GET.get('schedules') in ('1', 'true', 'on')
+    loans = Loan.objects.visible_to(request.user)
+
+    stream, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(portfolio_rows(loans, include_schedules)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename=loan_portfolio.{export_format}'
+    return response
+
+
+
+@is_staff_required
+def enqueue_statement_job(request):
+    """Queue statements for the posted loan_ids, or for every active loan when none are given."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    loan_ids = [int(value) for value in request.POST.getlist('loan_ids') if value.isdigit()]
+    loans = Loan.objects.filter(id__in=loan_ids) if loan_ids else Loan.objects.filter(is_paid=False)
+    job = enqueue_statements(loans, created_by=request.user)
+    return JsonResponse({'id': job.id, 'status': job.status, 'total': job.total,
+                         'status_url': reverse('statement_job_status', args=[job.id])}, status=202)
+
+
+@is_staff_required
+def statement_job_status(request, job_id):
+    job = get_object_or_404(StatementJob, id=job_id)
+    failures = list(job.items.filter(status=StatementJob.FAILED).values('loan_id', 'error')[:50])
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'total': job.total,
+        'completed': job.completed,
+        'failed': job.failed,
+        'progress': round((job.completed + job.failed) / job.total * 100, 1) if job.total else 100.0,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error,
+        'failures': failures,
+    })
+
+
+@is_staff_required
+def statement_job_download(request, job_id, loan_id):
+    item = get_object_or_404(StatementJobItem, job_id=job_id, loan_id=loan_id, status=StatementJob.DONE)
+    try:
+        statement = open(item.file_path, 'rb')
+    except OSError:
+        raise Http404("The statement file is no longer available.")
+    return FileResponse(statement, as_attachment=True, filename=os.path.basename(item.file_path))
 
 
 
@@ -438,15 +497,12 @@ def login_view(request):
     if request.method == 'POST':
         email = request.POST.get('username')
         password = request.POST.get('password')
-        print(f"Attempting login for email: {email}")
         user = authenticate(request, username=email, password=password)
-        print(f"Authenticate returned: {user}")
         if user is not None:
-            print("Login successful")
             login(request, user)
             return redirect('home')
         else:
-            print("Login failed")
+            logger.info("Failed login for %s", email)
             return render(request, 'mohi/login.html', {'error': 'Invalid email or password.'})
     return render(request, 'mohi/login.html')
 
@@ -455,266 +511,150 @@ def logout_view(request):
     return redirect('/')
 
 
-def calculate_loan(principal, monthly_rate, months):
-    """
-    Calculate loan details for a reducing balance loan.
-    Args:
-        principal (float): Loan amount
-        monthly_rate (float): Monthly interest rate in percent (e.g., 1 for 1%)
-        months (int): Loan term in months
-    Returns:
-        dict: Monthly payment, total interest, total paid, and amortization schedule
-    """
-    # Input validation
-    if principal <= 0 or monthly_rate < 0 or months <= 0:
-        raise ValueError("Principal and months must be positive, and monthly rate must be non-negative.")
+async def loan_calculator(request):
+    if request.method == 'POST':
+        try:
+            principal, monthly_rate, months = clean_terms(
+                request.POST.get('loanAmount'),
+                request.POST.get('monthlyRate') or settings.DEFAULT_MONTHLY_RATE,
+                request.POST.get('loanTerm'),
+            )
+            # Quotes are cached by their terms and kept server-side; the redirect only carries the key.
+            # Pricing is CPU-bound, so it runs off the event loop.
+            key, _ = await offload(get_quote, principal, monthly_rate, months)
+            await sync_to_async(remember_quote)(request.session, key, principal, monthly_rate, months, timezone.localdate())
+            return redirect(f"{reverse('pdf_preview')}?quote={key}")
+        except (TypeError, ValueError) as e:
+            return await sync_to_async(render)(
+                request, 'mohi/loan_calculator.html', {'error': str(e), 'default_rate': settings.DEFAULT_MONTHLY_RATE},
+            )
+    return await sync_to_async(render)(request, 'mohi/loan_calculator.html', {'default_rate': settings.DEFAULT_MONTHLY_RATE})
 
-    # Convert monthly rate to decimal
-    r = monthly_rate / 100  # e.g., 1% = 0.01
-    
-    # Calculate monthly payment using the formula: M = P * [r(1+r)^n / ((1+r)^n - 1)]
-    if r == 0:  # Handle zero interest case
-        monthly_payment = principal / months
-    else:
-        monthly_payment = principal * (r * (1 + r) ** months) / ((1 + r) ** months - 1)
-    
-    # Initialize amortization schedule
-    balance = principal
-    total_interest = 0
-    schedule = []
-    
-    # Generate amortization schedule
-    for month in range(1, months + 1):
-        # Calculate interest for the current month
-        interest = balance * r
-        # Calculate principal portion of payment
-        principal_paid = monthly_payment - interest
-        # Update balance
-        balance -= principal_paid
-        
-        # Ensure balance doesn't go negative
-        if balance < 0:
-            principal_paid += balance  # Adjust principal to avoid negative balance
-            balance = 0
-        
-        total_interest += interest
-        
-        # Store schedule details
-        schedule.append({
-            'month': month,
-            'payment': round(monthly_payment, 2),
-            'interest': round(interest, 2),
-            'principal': round(principal_paid, 2),
-            'balance': round(balance, 2)
-        })
-        
-        # Break if balance is paid off
-        if balance <= 0:
-            break
-    
-    # Adjust final payment if there's a small remaining balance
-    if balance > 0:
-        final_payment = balance + (balance * r)
-        total_interest += balance * r
-        schedule.append({
-            'month': len(schedule) + 1,
-            'payment': round(final_payment, 2),
-            'interest': round(balance * r, 2),
-            'principal': round(balance, 2),
-            'balance': 0.00
-        })
-    
-    # Calculate total paid
-    total_paid = sum(item['payment'] for item in schedule)
-    
-    return {
-        'monthly_payment': round(monthly_payment, 2),
-        'total_interest': round(total_interest, 2),
-        'total_paid': round(total_paid, 2),
-        'schedule': schedule
+
+async def pdf_preview(request):
+    quote = await sync_to_async(recall_quote)(request.session, request.GET.get('quote', ''))
+    if quote is None:
+        return redirect('loan_calculator')
+    (principal, monthly_rate, months, quote_date), loan_details = quote
+    base_date = date.fromisoformat(quote_date)
+
+    context = {
+        'principal': principal,
+        'months': months,
+        'monthly_payment': loan_details['monthly_payment'],
+        'total_interest': loan_details['total_interest'],
+        'total_paid': loan_details['total_paid'],
+        'schedule': loan_details['schedule'].starting(base_date),
+        'timestamp': base_date
     }
+    return await sync_to_async(render)(request, 'mohi/pdf_preview.html', context)
 
-def loan_calculator(request):
-    if request.method == 'POST':
-        try:
-            principal = float(request.POST.get('loanAmount'))
-            months = int(request.POST.get('loanTerm'))
-            monthly_rate = 1.0  # Fixed 1% monthly interest rate
-            loan_details = calculate_loan(principal, monthly_rate, months)
-            timestamp = timezone.now()
-            # Redirect with query parameters instead of keyword arguments
-            query_params = f"?principal={principal}&months={months}&monthly_payment={loan_details['monthly_payment']}&total_interest={loan_details['total_interest']}&total_paid={loan_details['total_paid']}&schedule={str(loan_details['schedule']).replace(' ', '')}&timestamp={timestamp.isoformat()}"
-            return redirect(f"/pdf_preview/{query_params}")
-        except ValueError as e:
-            return render(request, 'mohi/loan_calculator.html', {'error': str(e)})
-    return render(request, 'mohi/loan_calculator.html')
 
 
-from datetime import datetime, timedelta
-def pdf_preview(request):
-    try:
-        principal = float(request.GET.get('principal'))
-        months = int(request.GET.get('months'))
-        monthly_payment = float(request.GET.get('monthly_payment'))
-        total_interest = float(request.GET.get('total_interest'))
-        total_paid = float(request.GET.get('total_paid'))
-        schedule_data = eval(request.GET.get('schedule'))
-        timestamp_str = request.GET.get('timestamp')
-        
-        # Convert timestamp to date only, fixing ISO format
-        if ' ' in timestamp_str:
-            timestamp_str = timestamp_str.replace(' ', '+')
-        base_date = datetime.fromisoformat(timestamp_str).date()
-        
-        # Generate payment dates using timedelta (approximate)
-        schedule_with_dates = []
-        for i, item in enumerate(schedule_data, 1):
-            new_item = item.copy()
-            new_item['date'] = base_date + timedelta(days=30 * (i - 1))
-            schedule_with_dates.append(new_item)
-        
-        context = {
-            'principal': principal,
-            'months': months,
-            'monthly_payment': monthly_payment,
-            'total_interest': total_interest,
-            'total_paid': total_paid,
-            'schedule': schedule_with_dates,
-            'timestamp': base_date
-        }
-        return render(request, 'mohi/pdf_preview.html', context)
-    except (ValueError, TypeError) as e:
-        print(f"{e}")
-      
+def _api_terms(params):
+    return clean_terms(params['amount'], params.get('rate', settings.DEFAULT_MONTHLY_RATE), params['term'])
+
+
+def _with_schedule(quote, terms):
+    _, loan_details = get_quote(*terms)
+    quote['schedule'] = loan_details['schedule'].as_dicts()
+    return quote
+
+
+def _api_quote(params, include_schedule):
+    terms = _api_terms(params)
+    quote = quote_summary(*terms)
+    return _with_schedule(quote, terms) if include_schedule else quote
+
+
+@csrf_exempt
+async def api_quote(request):
+    """
+    GET ?amount=&term=[&rate=][&schedule=1] returns one quote.
+    POST {"quotes": [{"amount": ..., "term": ..., "rate": ...}, ...], "schedule": false}
+    returns {"quotes": [...]} in the same order, with an "error" entry for invalid items.
+    Only parsing runs on the event loop. All pricing, grid lookups included (the grid itself
+    is priced on first use), runs on the offload pool.
+    """
+    if request.method == 'GET':
+        include_schedule = request.GET.get('schedule') in ('1', 'true')
+        try:
+            return JsonResponse(await offload(_api_quote, request.GET, include_schedule))
+        except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+            return JsonResponse({'error': str(e) or 'Invalid request'}, status=400)
+
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            items = data['quotes']
+            include_schedule = bool(data.get('schedule', False))
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'Invalid request'}, status=400)
+        if not isinstance(items, list) or len(items) > MAX_BATCH_QUOTES:
+            return JsonResponse({'error': f'quotes must be a list of at most {MAX_BATCH_QUOTES} items'}, status=400)
+        quotes = await offload(_api_quote_batch, items, include_schedule)
+        return JsonResponse({'quotes': quotes})
+
+    return JsonResponse({'error': 'Invalid request'}, status=405)
+
+
+def _api_quote_batch(items, include_schedule):
+    """Quotes for a batch: each item is validated on its own, then every valid one is priced in one pass."""
+    cleaned = []
+    for item in items:
+        try:
+            cleaned.append(_api_terms(item))
+        except (KeyError, TypeError, ValueError, AttributeError, ArithmeticError) as e:
+            # InvalidOperation and OverflowError are ArithmeticErrors; one bad item must not fail the batch
+            cleaned.append({'error': str(e) or 'Invalid quote'})
+    summaries = iter(quote_summaries([terms for terms in cleaned if isinstance(terms, tuple)]))
+    quotes = []
+    for terms in cleaned:
+        if isinstance(terms, dict):
+            quotes.append(terms)
+        else:
+            quote = next(summaries)
+            quotes.append(_with_schedule(quote, terms) if include_schedule else quote)
+    return quotes
 
 
 
 @csrf_exempt
 def generate_pdf(request):
     if request.method == 'POST':
-        data = json.loads(request.body)
-        loan = data['loan']
-        schedule = loan['schedule']
-        repayments = data['repayments']
-
-        # Generate LaTeX content
-        latex_content = r"""
-\documentclass[a4paper,12pt]{article}
-\usepackage[utf8]{inputenc}
-\usepackage[T1]{fontenc}
-\usepackage{geometry}
-\geometry{margin=1in}
-\usepackage{booktabs}
-\usepackage{amsmath}
-\usepackage{amsfonts}
-\usepackage{times} % Reliable font package
-
-% Begin document
-\begin{document}
-
-% Title and User Information
-\begin{center}
-    \textbf{Payment Schedule - Loan \#%d}
-    \vspace{0.5cm}
-\end{center}
-
-% User Information
-\section*{User Information}
-\begin{itemize}
-    \item Email: %s
-    \item Name: %s
-    \item Department: %s
-    \item Designation: %s
-\end{itemize}
-
-% Loan Summary
-\section*{Loan Summary}
-\begin{itemize}
-    \item Amount: KSH %.2f
-    \item Term: %d months
-    \item Start Date: %s
-    \item Balance: KSH %.2f
-    \item Status: %s
-\end{itemize}
-
-% Payment Schedule Table
-\section*{Payment Schedule}
-\begin{table}[h]
-    \centering
-    \begin{tabular}{cccccc}
-        \toprule
-        Month & Date & Payment (KSH) & Interest (KSH) & Principal (KSH) & Balance (KSH) \\
-        \midrule
-        """ % (
-            loan['id'],
-            loan['user']['email'],
-            loan['user']['name'],
-            loan['user']['department'],
-            loan['user']['designation'],
-            loan['amount'],
-            loan['term_months'],
-            loan['start_date'],
-            loan['balance'],
-            loan['status']
+        try:
+            data = json.loads(request.body)
+            loan = data['loan']
+            schedule = loan['schedule']
+            repayments = data.get('repayments', [])
+            # The response streams, so a bad field must be caught before the first page is sent
+            validate_payload(loan, schedule, repayments)
+        except (KeyError, TypeError, AttributeError):
+            return JsonResponse({'error': 'Invalid request'}, status=400)
+        except ValueError as e:
+            return JsonResponse({'error': str(e) or 'Invalid request'}, status=400)
+
+        # Rendered in-process and streamed page by page; nothing is written to disk
+        response = StreamingHttpResponse(
+            render_payment_schedule(loan, schedule, repayments), content_type='application/pdf'
         )
+        response['Content-Disposition'] = f'attachment; filename=Payment_Schedule_Loan_{loan["id"]}.pdf'
+        return response
+    return JsonResponse({'error': 'Invalid request'}, status=400)
 
-        for item in schedule:
-            latex_content += r"%d & %s & %.2f & %.2f & %.2f & %.2f \\" % (
-                item['month'],
-                item['date'],
-                item['payment'],
-                item['interest'],
-                item['principal'],
-                item['balance']
-            )
 
-        latex_content += r"""
-        \bottomrule
-    \end{tabular}
-\end{table}
-
-% Repayments Table
-\section*{Repayments}
-\begin{table}[h]
-    \centering
-    \begin{tabular}{cccc}
-        \toprule
-        Date & Amount (KSH) & Principal (KSH) & Interest (KSH) \\
-        \midrule
-        """
-
-        for repayment in repayments:
-            latex_content += r"%s & %.2f & %.2f & %.2f \\" % (
-                repayment.date,
-                repayment.amount * 1,
-                repayment.principal * 1,
-                repayment.interest * 1
-            )
+def _metrics_token_ok(request):
+    # The client address is not checked: behind a reverse proxy every request comes from it
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    supplied = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
 
-        latex_content += r"""
-        \bottomrule
-    \end{tabular}
-\end{table}
-
-\end{document}
-"""
-
-        # Write LaTeX to temporary file
-        tex_file = os.path.join(settings.MEDIA_ROOT, 'temp_payment_schedule.tex')
-        with open(tex_file, 'w') as f:
-            f.write(latex_content)
-
-        # Compile LaTeX to PDF
-        pdf_file = os.path.join(settings.MEDIA_ROOT, 'temp_payment_schedule.pdf')
-        subprocess.run(['latexmk', '-pdf', tex_file], cwd=settings.MEDIA_ROOT, check=True)
-
-        # Return PDF as response
-        with open(pdf_file, 'rb') as f:
-            response = HttpResponse(f.read(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename=Payment_Schedule_Loan_{loan["id"]}.pdf'
-            return response
-
-        # Clean up
-        os.remove(tex_file)
-        os.remove(pdf_file)
-    return JsonResponse({'error': 'Invalid request'}, status=400)
\ No newline at end of file
+
+def metrics_view(request):
+    """
+    Request latency, query and template timings and instrumented function timings of this
+    process, in the Prometheus text format. Open to staff and to scrapers holding METRICS_TOKEN.
+    """
+    if not request.user.is_staff and not _metrics_token_ok(request):
+        return HttpResponseForbidden("Metrics are only available to staff and to the configured scraper.")
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')